@@ -0,0 +1,72 @@
+"""Micro-benchmark and regression check for the prompt guard.
+
+Run from this directory: ``python bench_guard.py``. Every prompt in
+guard_corpus.json must get its expected verdict. If ``langdetect`` is
+installed, the previous implementation (langdetect + one ``re.search`` per
+pattern) is timed alongside and its verdicts are compared as well.
+"""
+import json
+import os
+import re
+import sys
+import time
+
+from guard import LANG_PATTERNS, engine
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guard_corpus.json")
+ROUNDS = 200
+
+
+def legacy_blocked(text: str) -> bool:
+    """Verdict of the langdetect-based guard this engine replaced"""
+    from langdetect import detect
+    try:
+        lang = "ru" if detect(text) == "ru" else "en"
+    except Exception:
+        lang = "en"
+    patterns = LANG_PATTERNS.get(lang, []) + LANG_PATTERNS["code"]
+    return any(re.search(pattern, text) for pattern in patterns)
+
+
+def engine_blocked(text: str) -> bool:
+    return engine.find_injection(text) is not None
+
+
+def bench(check, prompts) -> float:
+    """Return the mean latency per prompt in microseconds"""
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for prompt in prompts:
+            check(prompt)
+    return (time.perf_counter() - started) / (ROUNDS * len(prompts)) * 1e6
+
+
+def main() -> int:
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        corpus = json.load(f)
+    prompts = [case["prompt"] for case in corpus]
+
+    failures = [case for case in corpus if engine_blocked(case["prompt"]) != case["blocked"]]
+    for case in failures:
+        print(f"MISMATCH engine: {case['prompt']!r} expected blocked={case['blocked']}")
+
+    report = {"cases": len(corpus), "engine_mismatches": len(failures),
+              "engine_us": round(bench(engine_blocked, prompts), 2)}
+    try:
+        import langdetect  # noqa: F401
+    except ImportError:
+        report["legacy_us"] = None
+    else:
+        legacy_failures = [case for case in corpus if legacy_blocked(case["prompt"]) != case["blocked"]]
+        for case in legacy_failures:
+            print(f"MISMATCH legacy: {case['prompt']!r} expected blocked={case['blocked']}")
+        report["legacy_mismatches"] = len(legacy_failures)
+        report["legacy_us"] = round(bench(legacy_blocked, prompts), 2)
+        report["speedup"] = round(report["legacy_us"] / report["engine_us"], 1)
+
+    print(json.dumps(report, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
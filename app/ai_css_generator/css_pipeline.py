@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Каталог тем, который nginx отдаёт как /static/themes/
+THEMES_DIR = os.getenv("THEMES_DIR", "/static/css/themes")
+THEMES_URL = os.getenv("THEMES_URL", "/static/themes")
+THEME_MAPPING_FILE = "theme_mapping.json"
+
+ALLOWED_PROPERTIES = {
+    "color", "background", "background-color", "background-image", "background-size",
+    "background-position", "background-repeat", "opacity",
+    "font", "font-family", "font-size", "font-weight", "font-style", "line-height",
+    "letter-spacing", "text-align", "text-transform", "text-decoration", "text-shadow",
+    "border", "border-top", "border-bottom", "border-left", "border-right",
+    "border-color", "border-width", "border-style", "border-radius", "border-bottom-color",
+    "outline", "box-shadow",
+    "margin", "margin-top", "margin-bottom", "margin-left", "margin-right",
+    "padding", "padding-top", "padding-bottom", "padding-left", "padding-right",
+    "gap", "width", "max-width", "min-height",
+    "transition", "transform", "filter", "backdrop-filter",
+}
+
+ALLOWED_ELEMENTS = {
+    "html", "body", "header", "footer", "main", "section", "nav", "div", "span",
+    "h1", "h2", "h3", "h4", "p", "a", "ul", "li", "img", "button",
+}
+
+ALLOWED_PSEUDO = {"hover", "focus", "active", "first-child", "last-child", "root"}
+
+# Значения, через которые можно вытащить внешние ресурсы или выполнить код
+FORBIDDEN_VALUE = re.compile(r"url\s*\(|expression\s*\(|javascript:|@import|[<>\\]", re.IGNORECASE)
+
+_CODE_FENCE = re.compile(r"```(?:css)?\s*\n?(.*?)```", re.DOTALL | re.IGNORECASE)
+_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_PROPERTY = re.compile(r"^(--[a-z0-9-]+|[a-z-]+)$")
+_COMPOUND = re.compile(r"^([a-z][a-z0-9]*)?((?:[.#][a-z_][a-z0-9_-]*)*)((?::{1,2}[a-z-]+)*)$", re.IGNORECASE)
+_PSEUDO = re.compile(r":{1,2}([a-z-]+)", re.IGNORECASE)
+
+
+class CSSValidationError(ValueError):
+    """Model output contains no usable CSS"""
+
+
+@dataclass
+class PublishedTheme:
+    theme_id: str
+    filename: str
+    url: str
+    css: str
+    title: str
+
+
+def extract_css(text: str) -> str:
+    """Take the CSS out of a model reply (fenced block if present)"""
+    blocks = _CODE_FENCE.findall(text)
+    if blocks:
+        return "\n".join(blocks)
+    return text
+
+
+def _strip_at_rules(css: str) -> str:
+    """Drop @import/@media/@font-face etc. together with their nested blocks"""
+    out = []
+    i = 0
+    depth = 0
+    while i < len(css):
+        ch = css[i]
+        if ch == "@" and depth == 0:
+            end_statement = css.find(";", i)
+            start_block = css.find("{", i)
+            if start_block == -1 or (end_statement != -1 and end_statement < start_block):
+                i = len(css) if end_statement == -1 else end_statement + 1
+                continue
+            level = 0
+            j = start_block
+            while j < len(css):
+                if css[j] == "{":
+                    level += 1
+                elif css[j] == "}":
+                    level -= 1
+                    if level == 0:
+                        break
+                j += 1
+            i = j + 1
+            continue
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth = max(0, depth - 1)
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _valid_selector(selector: str) -> bool:
+    for compound in re.split(r"\s*[>+~]\s*|\s+", selector.strip()):
+        if not compound:
+            continue
+        match = _COMPOUND.match(compound)
+        if not match or not any(match.groups()):
+            return False
+        element = match.group(1)
+        if element and element.lower() not in ALLOWED_ELEMENTS:
+            return False
+        for pseudo in _PSEUDO.findall(match.group(3) or ""):
+            if pseudo.lower() not in ALLOWED_PSEUDO:
+                return False
+    return True
+
+
+def _clean_declarations(body: str) -> List[Tuple[str, str]]:
+    declarations = []
+    for declaration in body.split(";"):
+        if ":" not in declaration:
+            continue
+        prop, value = declaration.split(":", 1)
+        prop = prop.strip().lower()
+        value = re.sub(r"\s*,\s*", ",", " ".join(value.split()))
+        if not value or not _PROPERTY.match(prop) or FORBIDDEN_VALUE.search(value):
+            continue
+        # Пользовательские свойства (--accent-color) разрешены, как в classic.css
+        if prop.startswith("--") or prop in ALLOWED_PROPERTIES:
+            declarations.append((prop, value))
+    return declarations
+
+
+def sanitize_css(css: str) -> List[Tuple[str, List[Tuple[str, str]]]]:
+    """Keep only allowlisted selectors and properties; at-rules are dropped"""
+    css = _strip_at_rules(_COMMENT.sub("", css))
+    rules = []
+    for selectors, body in _RULE.findall(css):
+        kept = [s.strip() for s in selectors.split(",") if s.strip() and _valid_selector(s)]
+        declarations = _clean_declarations(body)
+        if kept and declarations:
+            rules.append((",".join(" ".join(s.split()) for s in kept), declarations))
+    if not rules:
+        raise CSSValidationError("No valid CSS rules in model output")
+    return rules
+
+
+def minify_css(rules: List[Tuple[str, List[Tuple[str, str]]]]) -> str:
+    return "".join(
+        selector + "{" + ";".join(f"{prop}:{value}" for prop, value in declarations) + "}"
+        for selector, declarations in rules
+    )
+
+
+_mapping_lock = threading.Lock()
+
+
+def _register_theme(filename: str, title: str, themes_dir: str) -> None:
+    """Add the theme to theme_mapping.json that the bot reads"""
+    path = os.path.join(themes_dir, THEME_MAPPING_FILE)
+    with _mapping_lock:
+        mapping = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                mapping = json.load(f)
+        if mapping.get(filename) == title:
+            return
+        mapping[filename] = title
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(mapping, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+def publish_css(raw: str, title: str, themes_dir: Optional[str] = None) -> PublishedTheme:
+    """Extract, validate, minify and store the CSS under a content-hashed name.
+
+    Blocking (file I/O); call through ``asyncio.to_thread``.
+    """
+    themes_dir = themes_dir or THEMES_DIR
+    css = minify_css(sanitize_css(extract_css(raw)))
+    digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:12]
+    # Без "_" в имени: бот разбирает callback_data theme_{org_id}_{theme_id} по "_"
+    theme_id = f"ai-{digest}"
+    filename = f"{theme_id}.css"
+    os.makedirs(themes_dir, exist_ok=True)
+    path = os.path.join(themes_dir, filename)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(css)
+        os.replace(tmp_path, path)
+    _register_theme(filename, title, themes_dir)
+    return PublishedTheme(
+        theme_id=theme_id,
+        filename=filename,
+        url=f"{THEMES_URL}/{filename}",
+        css=css,
+        title=title,
+    )
+
+
+def theme_title(prompt: str, limit: int = 40) -> str:
+    """Human-readable theme name for the bot's theme list"""
+    text = " ".join(prompt.split())
+    if len(text) > limit:
+        text = text[:limit - 1] + "…"
+    return f"AI: {text}"
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, field_validator
 import re
-from langdetect import detect
+from typing import Dict, List, Optional
 
 LANG_PATTERNS = {
     "en": [
@@ -22,20 +22,60 @@ LANG_PATTERNS = {
     ]
 }
 
+_INLINE_IGNORECASE = "(?i)"
+
+
 def detect_language(text: str) -> str:
-    try:
-        lang = detect(text)
-        return "ru" if lang == "ru" else "en"
-    except:
-        return "en"
+    """Cheap script heuristic: Cyrillic-dominated text is "ru", anything else "en"."""
+    cyrillic = latin = 0
+    for ch in text:
+        if "а" <= ch <= "я" or "А" <= ch <= "Я" or ch in "ёЁ":
+            cyrillic += 1
+        elif "a" <= ch <= "z" or "A" <= ch <= "Z":
+            latin += 1
+    return "ru" if cyrillic and cyrillic >= latin else "en"
+
+
+def _combine(patterns: List[str]) -> re.Pattern:
+    """Compile several patterns into one alternation scanned in a single pass"""
+    parts = []
+    for pattern in patterns:
+        # Флаг (?i) нельзя оставлять внутри альтернативы, выносим его в compile
+        if pattern.startswith(_INLINE_IGNORECASE):
+            pattern = pattern[len(_INLINE_IGNORECASE):]
+        parts.append(f"(?:{pattern})")
+    return re.compile("|".join(parts), re.IGNORECASE)
+
+
+class GuardEngine:
+    """Prompt-injection matcher with patterns compiled once per language"""
+
+    def __init__(self, lang_patterns: Dict[str, List[str]]):
+        code = lang_patterns.get("code", [])
+        self._matchers = {
+            lang: _combine(patterns + code)
+            for lang, patterns in lang_patterns.items()
+            if lang != "code"
+        }
+        self._fallback = _combine(code)
+
+    def find_injection(self, text: str) -> Optional[str]:
+        """Return the detected language if the text matches any pattern, else None"""
+        lang = detect_language(text)
+        matcher = self._matchers.get(lang, self._fallback)
+        if matcher.search(text):
+            return lang
+        return None
+
+
+engine = GuardEngine(LANG_PATTERNS)
+
 
-class PromptRequest(BaseModel):    
+class PromptRequest(BaseModel):
     prompt: str
     @field_validator('prompt')
     def check_prompt(cls, v):
-        lang = detect_language(v)
-        patterns = LANG_PATTERNS.get(lang, []) + LANG_PATTERNS["code"]
-        for pattern in patterns:
-            if re.search(pattern, v):
-                raise ValueError(f"Prompt injection detected in {lang} text.")
+        lang = engine.find_injection(v)
+        if lang is not None:
+            raise ValueError(f"Prompt injection detected in {lang} text.")
         return v
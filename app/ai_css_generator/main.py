@@ -1,13 +1,121 @@
+import os
+import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from guard import PromptRequest
-from openai_client import call_openai, check_openai_health
+from openai_client import call_openai, stream_openai, check_openai_health, init_client, close_client, MODEL, TEMPERATURE
+from cache import ResultCache, SingleFlight, cache_key
+from css_pipeline import CSSValidationError, publish_css, theme_title
+from common.admission import Rate, RouteClass, install_admission
+from common.metrics import install_metrics
+from common.tracing import install_tracing, trace_httpx, get_tracer
 
-app = FastAPI()
+# Кэш результатов генерации
+CACHE_PATH = os.getenv(
+    "AI_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "results.sqlite3"),
+)
+CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+result_cache = ResultCache(CACHE_PATH, CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+inflight = SingleFlight()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Один пул соединений на весь процесс
+    await init_client()
+    yield
+    await close_client()
+
+app = FastAPI(lifespan=lifespan)
+# Запрос к модели дорогой: не больше нескольких одновременно и пара в минуту на пользователя
+install_admission(app, [
+    RouteClass.from_env("ai", concurrency=4, queue=8, deadline=30.0, per_user=Rate(per_minute=5, burst=2)),
+], {
+    ("POST", "/generate"): "ai",
+    ("POST", "/generate/stream"): "ai",
+})
+install_metrics(app)
+install_tracing(app, "ai-css-generator")
+# До init_client: инструментируются клиенты, созданные после вызова
+trace_httpx()
+tracer = get_tracer(__name__)
+
+
+async def generate_and_store(key: str, prompt: str) -> str:
+    """Call the upstream once and persist the result"""
+    result = await call_openai(prompt)
+    await asyncio.to_thread(result_cache.set, key, result)
+    return result
+
+async def publish_theme(result: str, prompt: str) -> dict:
+    """Validate, minify and publish the generated CSS as a static theme"""
+    with tracer.start_as_current_span("theme.publish"):
+        theme = await asyncio.to_thread(publish_css, result, theme_title(prompt))
+    return {"id": theme.theme_id, "file": theme.filename, "url": theme.url, "css": theme.css, "title": theme.title}
 
 @app.post("/generate")
 async def generate(data: PromptRequest):
-    response = await call_openai(data.prompt)
-    return {"status": "ok", "result": response}
+    key = cache_key(data.prompt, MODEL, TEMPERATURE)
+    cached = await asyncio.to_thread(result_cache.get, key)
+    if cached is not None:
+        response = cached
+    else:
+        # Одинаковые одновременные запросы ждут один вызов OpenAI
+        response = await inflight.do(key, lambda: generate_and_store(key, data.prompt))
+    try:
+        theme = await publish_theme(response, data.prompt)
+    except CSSValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"status": "ok", "result": response, "cached": cached is not None, "theme": theme}
+
+def sse_event(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.post("/generate/stream")
+async def generate_stream(data: PromptRequest):
+    """Stream the generated styles as server-sent events"""
+    key = cache_key(data.prompt, MODEL, TEMPERATURE)
+    cached = await asyncio.to_thread(result_cache.get, key)
+
+    async def events():
+        if cached is not None:
+            result = cached
+            yield sse_event({"delta": cached})
+        else:
+            parts = []
+            try:
+                async for delta in stream_openai(data.prompt):
+                    parts.append(delta)
+                    yield sse_event({"delta": delta})
+            except Exception as e:
+                logger.error(f"Error streaming generation: {str(e)}")
+                yield sse_event({"error": str(e)})
+                return
+            result = "".join(parts)
+            await asyncio.to_thread(result_cache.set, key, result)
+        try:
+            theme = await publish_theme(result, data.prompt)
+        except CSSValidationError as e:
+            yield sse_event({"error": str(e)})
+            return
+        yield sse_event({"done": True, "cached": cached is not None, "theme": theme})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx не должен копить ответ целиком
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/health")
 async def health():
@@ -1,30 +1,104 @@
 import os
+import json
+import time
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
 import httpx
 from dotenv import load_dotenv
 from tenacity import (
     retry,
-    retry_if_exception_type,
+    retry_if_exception,
     wait_random_exponential,
     stop_after_attempt,
 )
-from httpx import HTTPError, TimeoutException, ConnectError
+from httpx import HTTPStatusError, TimeoutException, TransportError
+
+from rate_limiter import TokenBucket
+from common.metrics import UPSTREAM_RETRIES, observe_upstream
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_URL = "https://api.openai.com/v1/chat/completions"
-MODEL = "gpt-4"
+# Базовый URL можно переопределить, чтобы гонять сервис против локальной заглушки
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+OPENAI_URL = f"{OPENAI_BASE_URL}/chat/completions"
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+TEMPERATURE = 0.7
+
+# Лимиты на исходящие запросы к OpenAI
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+RATE_PER_SECOND = float(os.getenv("OPENAI_RATE_PER_SECOND", "3"))
+RATE_BURST = int(os.getenv("OPENAI_RATE_BURST", "6"))
+
+TIMEOUT = httpx.Timeout(connect=5.0, read=60.0, write=10.0, pool=30.0)
+LIMITS = httpx.Limits(
+    max_connections=MAX_CONCURRENCY,
+    max_keepalive_connections=MAX_CONCURRENCY,
+    keepalive_expiry=30.0,
+)
 
 headers = {
     "Authorization": f"Bearer {OPENAI_API_KEY}",
     "Content-Type": "application/json",
 }
 
-# Retry только при сетевых ошибках
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_bucket: Optional[TokenBucket] = None
+
+
+async def init_client() -> httpx.AsyncClient:
+    """Create the shared pooled client (called from the FastAPI lifespan)"""
+    global _client, _semaphore, _bucket
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=TIMEOUT,
+            limits=LIMITS,
+            headers=headers,
+        )
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        _bucket = TokenBucket(rate=RATE_PER_SECOND, capacity=RATE_BURST)
+        logger.info(
+            f"OpenAI client ready: {OPENAI_BASE_URL}, concurrency={MAX_CONCURRENCY}, "
+            f"rate={RATE_PER_SECOND}/s, burst={RATE_BURST}"
+        )
+    return _client
+
+
+async def close_client() -> None:
+    """Close the shared client and drop pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Retry network failures, 429 and 5xx; other 4xx are caller errors"""
+    if isinstance(exc, (TimeoutException, TransportError)):
+        return True
+    if isinstance(exc, HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+def _count_retry(retry_state) -> None:
+    UPSTREAM_RETRIES.labels("openai").inc()
+
+
+# Retry только при сетевых ошибках, 429 и 5xx.
+# Пауза по Retry-After применяется к общему ведру, поэтому повторы всех
+# конкурентных запросов ждут вместе, а не бьют в upstream одновременно.
 @retry(
-    retry=retry_if_exception_type((TimeoutException, ConnectError, HTTPError)),
+    retry=retry_if_exception(_is_retryable),
     wait=wait_random_exponential(min=1, max=10),
     stop=stop_after_attempt(5),
+    before_sleep=_count_retry,
     reraise=True,
 )
 async def call_openai(prompt: str) -> str:
@@ -34,11 +108,77 @@ async def call_openai(prompt: str) -> str:
             {"role": "system", "content": "Ты помощник, генерирующий стили HTML-страниц по описанию."},
             {"role": "user", "content": prompt}
         ],
-        "temperature": 0.7,
+        "temperature": TEMPERATURE,
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(OPENAI_URL, json=payload, headers=headers)
-        response.raise_for_status()  # вызовет исключение при ошибке 4xx/5xx
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
\ No newline at end of file
+    client = await init_client()
+    async with _semaphore:
+        await _bucket.acquire()
+        started = time.perf_counter()
+        try:
+            response = await client.post(OPENAI_URL, json=payload)
+        except Exception:
+            observe_upstream("openai", started, "error")
+            raise
+        observe_upstream("openai", started, str(response.status_code))
+    _bucket.update_from_headers(response.status_code, response.headers)
+    response.raise_for_status()  # вызовет исключение при ошибке 4xx/5xx
+    data = response.json()
+    return data["choices"][0]["message"]["content"]
+
+
+async def check_openai_health() -> None:
+    """Check that the upstream is reachable with the configured key"""
+    client = await init_client()
+    response = await client.get(f"{OPENAI_BASE_URL}/models")
+    response.raise_for_status()
+
+
+async def stream_openai(prompt: str) -> AsyncIterator[str]:
+    """Stream completion deltas from the upstream SSE response.
+
+    No retries here: once the first chunk is forwarded to the client the
+    request cannot be replayed transparently.
+    """
+    payload = {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": "Ты помощник, генерирующий стили HTML-страниц по описанию."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": TEMPERATURE,
+        "stream": True,
+    }
+
+    client = await init_client()
+    async with _semaphore:
+        await _bucket.acquire()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async for delta in _stream_deltas(client, payload):
+                yield delta
+            outcome = "stream"
+        finally:
+            observe_upstream("openai", started, outcome)
+
+
+async def _stream_deltas(client: httpx.AsyncClient, payload: dict) -> AsyncIterator[str]:
+    async with client.stream("POST", OPENAI_URL, json=payload) as response:
+        _bucket.update_from_headers(response.status_code, response.headers)
+        if response.is_error:
+            await response.aread()
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
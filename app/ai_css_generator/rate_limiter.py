@@ -0,0 +1,109 @@
+import asyncio
+import re
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Mapping, Optional
+
+# Формат OpenAI для x-ratelimit-reset-*: "1s", "6m0s", "20ms", "1h2m3.5s"
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse an OpenAI x-ratelimit-reset-* duration into seconds"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value.strip())
+    if not parts:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+    return sum(float(amount) * _UNIT_SECONDS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """Token bucket shared by all upstream calls.
+
+    Callers wait in ``acquire`` until a token is available. The bucket can be
+    paused globally when the upstream tells us to back off, so concurrent
+    requests wait together instead of retrying into another 429.
+    """
+
+    def __init__(self, rate: float, capacity: int, clock=time.monotonic):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate and capacity must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait for a token; waiters are served in arrival order"""
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Block every caller for the given number of seconds"""
+        if seconds <= 0:
+            return
+        now = self._clock()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        # После паузы начинаем с пустого ведра, чтобы не выстрелить всей пачкой
+        self._tokens = 0.0
+        self._updated = max(self._updated, self._blocked_until)
+
+    def update_from_headers(self, status_code: int, headers: Mapping[str, str]) -> Optional[float]:
+        """Apply Retry-After and x-ratelimit-* headers, return the pause applied"""
+        delay = parse_retry_after(headers.get("retry-after"))
+        if delay is None:
+            retry_after_ms = headers.get("retry-after-ms")
+            if retry_after_ms:
+                try:
+                    delay = max(0.0, float(retry_after_ms) / 1000)
+                except ValueError:
+                    delay = None
+        if delay is None and headers.get("x-ratelimit-remaining-requests") == "0":
+            delay = parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+        if delay is None and status_code == 429:
+            delay = 1.0
+        if delay:
+            self.pause(delay)
+        return delay
@@ -0,0 +1,151 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOBS_TABLE = "import_jobs"
+# Загруженные файлы ждут воркер здесь; каталог общий для API и воркеров
+IMPORT_DIR = os.getenv("IMPORT_DIR", "/imports")
+# Задание, которое столько секунд не обновлялось, считается брошенным упавшим воркером
+JOB_STALE_SECONDS = int(os.getenv("IMPORT_JOB_STALE_SECONDS", "600"))
+JOB_MAX_ATTEMPTS = int(os.getenv("IMPORT_JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+JOBS_TABLE_SQL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {JOBS_TABLE} (
+        id BIGSERIAL PRIMARY KEY,
+        organization_id INTEGER NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+        mode TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT '{QUEUED}',
+        total_rows INTEGER,
+        processed_rows INTEGER NOT NULL DEFAULT 0,
+        result JSONB,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        finished TIMESTAMPTZ
+    )
+    """,
+    # Воркеры выбирают только незавершённые задания
+    f"CREATE INDEX IF NOT EXISTS ix_{JOBS_TABLE}_pending ON {JOBS_TABLE} (created) WHERE status IN ('{QUEUED}', '{RUNNING}')",
+]
+
+JOB_COLUMNS = "id, organization_id, mode, filename, file_path, status, total_rows, processed_rows, result, error, attempts, created, updated, finished"
+
+
+def ensure_jobs_schema(db: Session) -> None:
+    for statement in JOBS_TABLE_SQL:
+        db.execute(text(statement))
+    db.commit()
+
+
+def _job_dict(row) -> Dict[str, Any]:
+    job = dict(row._mapping)
+    job.pop("file_path", None)
+    for column in ("created", "updated", "finished"):
+        if job[column] is not None:
+            job[column] = job[column].isoformat()
+    return job
+
+
+def create_job(db: Session, org_id: int, mode: str, filename: str, file_path: str) -> Dict[str, Any]:
+    row = db.execute(text(f"""
+    INSERT INTO {JOBS_TABLE} (organization_id, mode, filename, file_path)
+    VALUES (:org_id, :mode, :filename, :file_path)
+    RETURNING {JOB_COLUMNS}
+    """), {"org_id": org_id, "mode": mode, "filename": filename, "file_path": file_path}).fetchone()
+    return _job_dict(row)
+
+
+def get_job(db: Session, job_id: int) -> Optional[Dict[str, Any]]:
+    row = db.execute(text(f"SELECT {JOB_COLUMNS} FROM {JOBS_TABLE} WHERE id = :job_id"), {"job_id": job_id}).fetchone()
+    return _job_dict(row) if row else None
+
+
+def fail_abandoned_jobs(db: Session) -> List[str]:
+    """Fail abandoned jobs that used up their attempts; returns their file paths"""
+    rows = db.execute(text(f"""
+    UPDATE {JOBS_TABLE}
+    SET status = '{FAILED}', error = coalesce(error, 'Worker stopped responding'), processed_rows = 0,
+        updated = CURRENT_TIMESTAMP, finished = CURRENT_TIMESTAMP
+    WHERE status = '{RUNNING}' AND attempts >= :max_attempts
+      AND updated < CURRENT_TIMESTAMP - make_interval(secs => :stale)
+    RETURNING id, file_path
+    """), {"stale": JOB_STALE_SECONDS, "max_attempts": JOB_MAX_ATTEMPTS}).fetchall()
+    db.commit()
+    for row in rows:
+        logger.warning(f"Import job {row.id} abandoned after {JOB_MAX_ATTEMPTS} attempts")
+    return [row.file_path for row in rows]
+
+
+def claim_job(db: Session) -> Optional[Dict[str, Any]]:
+    """Take the oldest queued (or abandoned) job; SKIP LOCKED lets workers claim in parallel"""
+    row = db.execute(text(f"""
+    UPDATE {JOBS_TABLE} SET status = '{RUNNING}', attempts = attempts + 1, updated = CURRENT_TIMESTAMP
+    WHERE id = (
+        SELECT id FROM {JOBS_TABLE}
+        WHERE status = '{QUEUED}'
+           OR (status = '{RUNNING}' AND attempts < :max_attempts
+               AND updated < CURRENT_TIMESTAMP - make_interval(secs => :stale))
+        ORDER BY created
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING {JOB_COLUMNS}
+    """), {"stale": JOB_STALE_SECONDS, "max_attempts": JOB_MAX_ATTEMPTS}).fetchone()
+    db.commit()
+    if row is None:
+        return None
+    job = _job_dict(row)
+    job["file_path"] = row.file_path
+    return job
+
+
+def touch_job(db: Session, job_id: int) -> None:
+    """Heartbeat: a running job updated recently is not reclaimed by other workers"""
+    db.execute(text(f"UPDATE {JOBS_TABLE} SET updated = CURRENT_TIMESTAMP WHERE id = :job_id AND status = '{RUNNING}'"),
+               {"job_id": job_id})
+    db.commit()
+
+
+def update_progress(db: Session, job_id: int, processed_rows: int, total_rows: Optional[int] = None) -> None:
+    """Commit progress right away so status requests see it while the import transaction is open"""
+    db.execute(text(f"""
+    UPDATE {JOBS_TABLE}
+    SET processed_rows = :processed, total_rows = coalesce(:total, total_rows), updated = CURRENT_TIMESTAMP
+    WHERE id = :job_id
+    """), {"job_id": job_id, "processed": processed_rows, "total": total_rows})
+    db.commit()
+
+
+def finish_job(db: Session, job_id: int, result: Dict[str, Any]) -> None:
+    db.execute(text(f"""
+    UPDATE {JOBS_TABLE}
+    SET status = '{DONE}', processed_rows = coalesce(total_rows, processed_rows), result = CAST(:result AS jsonb),
+        updated = CURRENT_TIMESTAMP, finished = CURRENT_TIMESTAMP
+    WHERE id = :job_id
+    """), {"job_id": job_id, "result": json.dumps(result)})
+    db.commit()
+
+
+def fail_job(db: Session, job_id: int, error: str, attempts: int, permanent: bool = False) -> None:
+    """Put the job back in the queue, or fail it if the file is bad or attempts are used up"""
+    status = FAILED if permanent or attempts >= JOB_MAX_ATTEMPTS else QUEUED
+    db.execute(text(f"""
+    UPDATE {JOBS_TABLE}
+    SET status = :status, error = :error, processed_rows = 0, updated = CURRENT_TIMESTAMP,
+        finished = CASE WHEN :status = '{FAILED}' THEN CURRENT_TIMESTAMP END
+    WHERE id = :job_id
+    """), {"job_id": job_id, "status": status, "error": error})
+    db.commit()
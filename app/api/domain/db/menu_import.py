@@ -0,0 +1,197 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Set, Tuple
+import hashlib
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MENU_COLUMNS = ("name", "price", "category", "description", "subcategory", "image_name")
+SYNC_COLUMNS = MENU_COLUMNS + ("sku",)
+COLUMN_TYPES = {
+    "name": "text[]",
+    "price": "numeric[]",
+    "category": "text[]",
+    "description": "text[]",
+    "subcategory": "text[]",
+    "image_name": "text[]",
+    "sku": "text[]",
+}
+
+# Натуральный ключ: артикул, если задан, иначе категория + название без учёта регистра
+SYNC_KEY_SQL = "coalesce(nullif({p}sku, ''), lower({p}category) || chr(31) || lower({p}name))"
+
+_sync_prepared: Set[str] = set()
+
+
+def _text_or_none(value: Any):
+    # pandas отдаёт пустые ячейки как NaN
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    return str(value)
+
+
+def _unnest(columns: Tuple[str, ...]) -> str:
+    arrays = ", ".join(f"CAST(:{column} AS {COLUMN_TYPES[column]})" for column in columns)
+    return f"unnest({arrays})"
+
+
+def _array_params(rows: List[Dict[str, Any]], columns: Tuple[str, ...]) -> Dict[str, list]:
+    return {
+        column: [row.get(column) if column == "price" else _text_or_none(row.get(column)) for row in rows]
+        for column in columns
+    }
+
+
+def insert_menu_rows(db: Session, table_name: str, rows: List[Dict[str, Any]]) -> int:
+    """Insert menu rows with a single INSERT ... SELECT FROM unnest(...).
+
+    One statement per import instead of one per row: a single round trip, and
+    the statement-level category summary trigger fires once. Rows that clash
+    with the natural key of a synced menu are skipped; returns rows inserted.
+    """
+    if not rows:
+        return 0
+    insert_sql = f"""
+    INSERT INTO {table_name} ({", ".join(MENU_COLUMNS)})
+    SELECT * FROM {_unnest(MENU_COLUMNS)}
+    ON CONFLICT DO NOTHING
+    """
+    return db.execute(text(insert_sql), _array_params(rows, MENU_COLUMNS)).rowcount
+
+
+def ensure_menu_sync(db: Session, table_name: str) -> int:
+    """Add sku and the unique natural key to a menu table (idempotent).
+
+    Duplicates left by earlier append-only uploads are collapsed to the
+    oldest row per key: sync treats the uploaded file as the source of truth.
+    Runs in the caller's transaction; returns the number of rows removed.
+    """
+    if table_name in _sync_prepared:
+        return 0
+    index_name = f"ix_{hashlib.md5(table_name.encode()).hexdigest()[:12]}_sync_key"
+    exists = db.execute(text("SELECT to_regclass(:index_name) IS NOT NULL"), {"index_name": index_name}).scalar()
+    if exists:
+        # Индекс уже закоммичен: дальше таблицу не проверяем
+        _sync_prepared.add(table_name)
+        return 0
+    db.execute(text(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS sku TEXT"))
+    db.execute(text(
+        f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS sync_key TEXT "
+        f"GENERATED ALWAYS AS ({SYNC_KEY_SQL.format(p='')}) STORED"
+    ))
+    removed = db.execute(text(f"""
+    DELETE FROM {table_name} t
+    USING {table_name} keep
+    WHERE t.sync_key = keep.sync_key AND t.id > keep.id
+    """)).rowcount
+    if removed:
+        logger.info(f"Removing {removed} duplicate rows from {table_name} before enabling sync")
+    db.execute(text(f"CREATE UNIQUE INDEX {index_name} ON {table_name} (sync_key)"))
+    return removed
+
+
+def _dedupe(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Keep the last row per natural key, as ON CONFLICT can touch a row only once"""
+    unique: Dict[Any, Dict[str, Any]] = {}
+    for row in rows:
+        sku = _text_or_none(row.get("sku"))
+        key = sku if sku else (str(row["category"]).lower(), str(row["name"]).lower())
+        unique[key] = row
+    return list(unique.values()), len(rows) - len(unique)
+
+
+def sync_menu_rows(db: Session, table_name: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Make the menu match the uploaded rows: upsert by natural key, delete the rest.
+
+    Unchanged rows are not written, availability (stop list) is preserved.
+    A row whose sku was added, changed or removed keeps its id: it is matched
+    by category + name and re-keyed before the upsert.
+    The caller commits, including the one-time cleanup of old duplicates.
+    """
+    duplicates_removed = ensure_menu_sync(db, table_name)
+    rows, duplicates = _dedupe(rows)
+    params = _array_params(rows, SYNC_COLUMNS)
+    key_params = {column: params[column] for column in ("category", "name", "sku")}
+
+    # Новый ключ, которого нет в таблице, забирает строку с той же категорией и названием,
+    # если её собственного ключа нет в файле: иначе она ушла бы в удаление вместе со стоп-листом
+    rekey_sql = f"""
+    WITH incoming AS (
+        SELECT i.category, i.name, i.sku, {SYNC_KEY_SQL.format(p='i.')} AS key
+        FROM {_unnest(("category", "name", "sku"))} AS i(category, name, sku)
+    ), candidates AS (
+        SELECT DISTINCT ON (i.key) t.id, i.sku
+        FROM incoming i
+        JOIN {table_name} t ON lower(t.category) = lower(i.category) AND lower(t.name) = lower(i.name)
+        WHERE t.sync_key <> i.key
+          AND NOT EXISTS (SELECT 1 FROM {table_name} x WHERE x.sync_key = i.key)
+          AND NOT EXISTS (SELECT 1 FROM incoming o WHERE o.key = t.sync_key)
+        ORDER BY i.key, t.id
+    )
+    UPDATE {table_name} t
+    SET sku = nullif(c.sku, ''), updated = CURRENT_TIMESTAMP
+    FROM candidates c
+    WHERE t.id = c.id
+    RETURNING t.id, t.name, t.category
+    """
+    rekeyed = []
+    if rows:
+        rekeyed = [
+            {"id": row.id, "name": row.name, "category": row.category}
+            for row in db.execute(text(rekey_sql), key_params)
+        ]
+
+    columns = ", ".join(SYNC_COLUMNS)
+    # DISTINCT ON повторяет _dedupe на стороне БД: ключ считается тем же lower(), что и индекс
+    upsert_sql = f"""
+    INSERT INTO {table_name} AS t ({columns})
+    SELECT DISTINCT ON (key) {columns} FROM (
+        SELECT i.*, {SYNC_KEY_SQL.format(p='i.')} AS key
+        FROM {_unnest(SYNC_COLUMNS)} WITH ORDINALITY AS i({columns}, n)
+    ) incoming
+    ORDER BY key, n DESC
+    ON CONFLICT (sync_key) DO UPDATE
+    SET name = EXCLUDED.name,
+        price = EXCLUDED.price,
+        category = EXCLUDED.category,
+        description = EXCLUDED.description,
+        subcategory = EXCLUDED.subcategory,
+        image_name = coalesce(EXCLUDED.image_name, t.image_name),
+        sku = EXCLUDED.sku,
+        updated = CURRENT_TIMESTAMP
+    WHERE (t.name, t.price, t.category, t.description, t.subcategory, t.image_name, t.sku)
+          IS DISTINCT FROM
+          (EXCLUDED.name, EXCLUDED.price, EXCLUDED.category, EXCLUDED.description,
+           EXCLUDED.subcategory, coalesce(EXCLUDED.image_name, t.image_name), EXCLUDED.sku)
+    RETURNING id, name, category, (xmax = 0) AS inserted
+    """
+    inserted, updated = [], []
+    if rows:
+        for row in db.execute(text(upsert_sql), params):
+            (inserted if row.inserted else updated).append({"id": row.id, "name": row.name, "category": row.category})
+
+    delete_sql = f"""
+    DELETE FROM {table_name} t
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {_unnest(("category", "name", "sku"))} AS i(category, name, sku)
+        WHERE {SYNC_KEY_SQL.format(p='i.')} = t.sync_key
+    )
+    RETURNING id, name, category
+    """
+    deleted = [
+        {"id": row.id, "name": row.name, "category": row.category}
+        for row in db.execute(text(delete_sql), key_params)
+    ]
+
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "deleted": deleted,
+        "rekeyed": rekeyed,
+        "unchanged": len(rows) - len(inserted) - len(updated),
+        "duplicates_in_file": duplicates,
+        "duplicates_removed": duplicates_removed,
+    }
@@ -1,5 +1,5 @@
 from domain.db.base import Base
-from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, BigInteger, ForeignKey
+from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, BigInteger, ForeignKey, insert
 from datetime import datetime, UTC
 from dataclasses import dataclass
 from decimal import Decimal
@@ -260,7 +260,7 @@ class UserTable:
     __tablename__: str = "users"
     
     id: Column = Column(Integer, primary_key=True, index=True)
-    tid: Column = Column(BigInteger, nullable=False)
+    tid: Column = Column(BigInteger, nullable=False, unique=True, index=True)
     owner: Column = Column(Boolean, default=False)
     language: Column = Column(String, default='ru')
     created: Column = Column(DateTime, default=lambda: datetime.now(UTC))
@@ -711,6 +711,28 @@ class Image(Base):
             db.rollback()
             raise e
 
+    @classmethod
+    def create_many(cls, db: Session, images: List[ImageData]) -> List[ImageData]:
+        """Create image records with one multi-row INSERT ... RETURNING"""
+        if not images:
+            return []
+        try:
+            # В dataclass до commit: после него объекты истекают и читались бы по одному
+            rows = db.scalars(
+                insert(cls).returning(cls),
+                [{
+                    "organization_id": image.organization_id,
+                    "original_filename": image.original_filename,
+                    "stored_filename": image.stored_filename
+                } for image in images]
+            ).all()
+            created = [row.to_dataclass() for row in rows]
+            db.commit()
+            return created
+        except SQLAlchemyError as e:
+            db.rollback()
+            raise e
+
     @classmethod
     def get_by_id(cls, db: Session, image_id: int) -> Optional['Image']:
         """Get image by ID"""
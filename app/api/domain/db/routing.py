@@ -0,0 +1,178 @@
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+import itertools
+import logging
+import os
+import threading
+import time
+
+from domain.db.database import SessionLocal, engine
+from common.metrics import DB_READ_ROUTED, DB_REPLICA_HEALTHY, DB_REPLICA_LAG_BYTES
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Реплики через запятую; без них все чтения идут на основную базу
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_CHECK_INTERVAL = float(os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", "2.0"))
+# Реплика, отставшая больше чем на столько байт WAL, из чтения исключается
+REPLICA_MAX_LAG_BYTES = int(os.getenv("DATABASE_REPLICA_MAX_LAG_BYTES", str(1024 * 1024)))
+# Столько секунд после записи чтения того же пользователя/организации идут на основную базу
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DATABASE_READ_YOUR_WRITES_SECONDS", "5.0"))
+
+USER_HEADER = "x-telegram-user-id"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.name = urlsplit(url).hostname or url
+        # Реплика только для чтения: случайная запись упадёт, а не разойдётся с основной базой
+        self.engine = create_engine(
+            url,
+            pool_size=5,
+            max_overflow=10,
+            pool_timeout=5,
+            pool_recycle=1800,
+            pool_pre_ping=True,
+            connect_args={"options": "-c default_transaction_read_only=on"},
+        )
+        self.healthy = False
+        self.lag_bytes: Optional[int] = None
+
+
+class ReadRouter:
+    """Picks the engine for read-only requests.
+
+    A background thread polls each replica: reachable and no more than
+    REPLICA_MAX_LAG_BYTES of WAL behind the primary means healthy. Reads are
+    spread round-robin over healthy replicas and fall back to the primary when
+    there are none. Tenants that wrote recently read from the primary.
+    """
+
+    def __init__(self, primary: Engine, urls: Iterable[str]):
+        self.primary = primary
+        self.replicas = [Replica(url) for url in urls]
+        self._cycle = itertools.count()
+        self._recent_writes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if not self.replicas or self._thread is not None:
+            return
+        self.check()
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(REPLICA_CHECK_INTERVAL):
+            self.check()
+
+    def check(self) -> None:
+        """Refresh health and WAL lag of every replica"""
+        try:
+            with self.primary.connect() as conn:
+                primary_lsn = conn.execute(text("SELECT CAST(pg_current_wal_lsn() AS text)")).scalar()
+        except Exception as e:
+            logger.warning(f"Cannot read primary WAL position: {str(e)}")
+            primary_lsn = None
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as conn:
+                    row = conn.execute(text("""
+                    SELECT pg_is_in_recovery() AS in_recovery,
+                           pg_wal_lsn_diff(CAST(:lsn AS pg_lsn), pg_last_wal_replay_lsn()) AS lag
+                    """), {"lsn": primary_lsn}).fetchone()
+                # Не реплика (например, вторая локальная база для проверки) - отставания нет
+                lag = int(row.lag) if row.in_recovery and row.lag is not None else 0
+                if row.in_recovery and primary_lsn is None:
+                    lag = None
+                replica.lag_bytes = lag
+                replica.healthy = lag is not None and lag <= REPLICA_MAX_LAG_BYTES
+            except Exception as e:
+                if replica.healthy:
+                    logger.warning(f"Replica {replica.name} is unavailable: {str(e)}")
+                replica.healthy, replica.lag_bytes = False, None
+            DB_REPLICA_HEALTHY.labels(replica.name).set(1 if replica.healthy else 0)
+            if replica.lag_bytes is not None:
+                DB_REPLICA_LAG_BYTES.labels(replica.name).set(replica.lag_bytes)
+
+    def mark_write(self, keys: Iterable[str]) -> None:
+        deadline = time.monotonic() + READ_YOUR_WRITES_SECONDS
+        with self._lock:
+            for key in keys:
+                self._recent_writes[key] = deadline
+            if len(self._recent_writes) > 10000:
+                now = time.monotonic()
+                self._recent_writes = {k: v for k, v in self._recent_writes.items() if v > now}
+
+    def wrote_recently(self, keys: Iterable[str]) -> bool:
+        now = time.monotonic()
+        return any(self._recent_writes.get(key, 0) > now for key in keys)
+
+    def engine_for(self, keys: Iterable[str]) -> Engine:
+        if not self.replicas:
+            return self.primary
+        if self.wrote_recently(keys):
+            DB_READ_ROUTED.labels("primary", "read_your_writes").inc()
+            return self.primary
+        healthy: List[Replica] = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            DB_READ_ROUTED.labels("primary", "no_healthy_replica").inc()
+            return self.primary
+        replica = healthy[next(self._cycle) % len(healthy)]
+        DB_READ_ROUTED.labels(replica.name, "replica").inc()
+        return replica.engine
+
+
+read_router = ReadRouter(engine, REPLICA_URLS)
+
+
+def tenant_keys(request: Request) -> List[str]:
+    """Keys a write is remembered under: the Telegram user and the organization in the path"""
+    keys = []
+    user = request.headers.get(USER_HEADER)
+    if user:
+        keys.append(f"user:{user}")
+    org_id = request.path_params.get("org_id")
+    if org_id is not None:
+        keys.append(f"org:{org_id}")
+    return keys
+
+
+def get_read_db_session(request: Request) -> Session:
+    """Session for read-only endpoints: a healthy replica unless the tenant has just written"""
+    return SessionLocal(bind=read_router.engine_for(tenant_keys(request)))
+
+
+class ReadYourWritesMiddleware:
+    """Remember tenants of successful write requests so their next reads go to the primary"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS or not read_router.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if status_holder["status"] < 400:
+            read_router.mark_write(tenant_keys(Request(scope)))
@@ -0,0 +1,122 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Set, Tuple
+import hashlib
+import re
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Порог похожести для опечаток: 0.6 по умолчанию слишком строг для коротких слов
+WORD_SIMILARITY_THRESHOLD = 0.4
+MAX_QUERY_TOKENS = 8
+
+# Название весит больше категории, категория больше описания.
+# Русская и английская конфигурации вместе: меню бывают смешанные
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(category, '') || ' ' || coalesce(subcategory, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(category, '') || ' ' || coalesce(subcategory, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'C')
+"""
+
+_prepared: Set[str] = set()
+
+
+def ensure_search_extension(db: Session) -> None:
+    """pg_trgm provides the trigram operators used for typo tolerance"""
+    db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    db.commit()
+
+
+def ensure_menu_search(db: Session, table_name: str) -> None:
+    """Add the search column and indexes to a menu table (idempotent)"""
+    if table_name in _prepared:
+        return
+    # Имя таблицы зависит от названия организации и может не влезть в 63 символа
+    prefix = f"ix_{hashlib.md5(table_name.encode()).hexdigest()[:12]}"
+    statements = [
+        f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED",
+        f"CREATE INDEX IF NOT EXISTS {prefix}_search ON {table_name} USING gin (search_vector)",
+        f"CREATE INDEX IF NOT EXISTS {prefix}_name_trgm ON {table_name} USING gin (lower(name) gin_trgm_ops)",
+        f"CREATE INDEX IF NOT EXISTS {prefix}_category_trgm ON {table_name} USING gin (lower(category) gin_trgm_ops)",
+    ]
+    for statement in statements:
+        db.execute(text(statement))
+    db.commit()
+    _prepared.add(table_name)
+
+
+def _prefix_tsquery(query: str) -> str:
+    """'капуч молок' -> 'капуч:* & молок:*' (each word may be a prefix)"""
+    tokens = re.findall(r"[^\W_]+", query.lower())[:MAX_QUERY_TOKENS]
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def search_menu(
+    db: Session,
+    table_name: str,
+    query: str,
+    skip: int = 0,
+    limit: int = 20,
+    available_only: bool = False,
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """Ranked full-text search with prefix matching and trigram typo tolerance.
+
+    Returns the total number of matches and one page of items.
+    """
+    ensure_menu_search(db, table_name)
+    prefix_query = _prefix_tsquery(query)
+    needle = " ".join(query.lower().split())
+
+    # Полнотекстовое совпадение (с префиксами) ИЛИ похожее слово в названии/категории;
+    # обе ветки идут по GIN-индексам через BitmapOr
+    conditions = ["(:needle <% lower(name) OR :needle <% lower(category))"]
+    rank = "word_similarity(:needle, lower(name)) + 0.5 * word_similarity(:needle, lower(category))"
+    if prefix_query:
+        tsquery = "(to_tsquery('russian', :tsquery) || to_tsquery('english', :tsquery))"
+        conditions.insert(0, f"search_vector @@ {tsquery}")
+        rank = f"2 * ts_rank_cd(search_vector, {tsquery}) + {rank}"
+    where = " OR ".join(conditions)
+    if available_only:
+        where = f"({where}) AND is_available"
+
+    sql = f"""
+    SELECT id, name, description, price, category, subcategory, is_available, image_name,
+           created, updated, {rank} AS rank, count(*) OVER () AS total
+    FROM {table_name}
+    WHERE {where}
+    ORDER BY rank DESC, name
+    LIMIT :limit OFFSET :skip
+    """
+    db.execute(
+        text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+        {"threshold": str(WORD_SIMILARITY_THRESHOLD)},
+    )
+    rows = db.execute(text(sql), {
+        "needle": needle,
+        "tsquery": prefix_query,
+        "limit": limit,
+        "skip": skip,
+    }).fetchall()
+
+    total = rows[0].total if rows else 0
+    items = [{
+        "id": row.id,
+        "name": row.name,
+        "description": row.description,
+        "price": float(row.price),
+        "category": row.category,
+        "subcategory": row.subcategory,
+        "is_available": row.is_available,
+        "image_name": row.image_name,
+        "created": row.created.isoformat() if row.created else None,
+        "updated": row.updated.isoformat() if row.updated else None,
+        "rank": round(float(row.rank), 4),
+    } for row in rows]
+    return total, items
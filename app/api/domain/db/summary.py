@@ -0,0 +1,138 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Set
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUMMARY_TABLE = "menu_category_summary"
+
+# Одна строка на (таблица меню, категория, подкатегория); '' - без подкатегории
+SUMMARY_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+    menu_table TEXT NOT NULL,
+    category TEXT NOT NULL,
+    subcategory TEXT NOT NULL DEFAULT '',
+    item_count INTEGER NOT NULL DEFAULT 0,
+    available_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (menu_table, category, subcategory)
+)
+"""
+
+# Триггер уровня оператора: массовый импорт обновляет сводку одним
+# агрегатом по transition-таблице, а не построчно
+SUMMARY_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION {SUMMARY_TABLE}_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        INSERT INTO {SUMMARY_TABLE} AS s (menu_table, category, subcategory, item_count, available_count)
+        SELECT TG_TABLE_NAME, category, coalesce(subcategory, ''),
+               -count(*), -count(*) FILTER (WHERE is_available)
+        FROM old_rows
+        GROUP BY category, coalesce(subcategory, '')
+        ON CONFLICT (menu_table, category, subcategory) DO UPDATE
+        SET item_count = s.item_count + EXCLUDED.item_count,
+            available_count = s.available_count + EXCLUDED.available_count;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO {SUMMARY_TABLE} AS s (menu_table, category, subcategory, item_count, available_count)
+        SELECT TG_TABLE_NAME, category, coalesce(subcategory, ''),
+               count(*), count(*) FILTER (WHERE is_available)
+        FROM new_rows
+        GROUP BY category, coalesce(subcategory, '')
+        ON CONFLICT (menu_table, category, subcategory) DO UPDATE
+        SET item_count = s.item_count + EXCLUDED.item_count,
+            available_count = s.available_count + EXCLUDED.available_count;
+    END IF;
+    DELETE FROM {SUMMARY_TABLE} WHERE menu_table = TG_TABLE_NAME AND item_count <= 0;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+# Transition-таблицы нельзя объявить у триггера на несколько событий
+TRIGGERS = {
+    "ins": "AFTER INSERT ON {table} REFERENCING NEW TABLE AS new_rows",
+    "upd": "AFTER UPDATE ON {table} REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "del": "AFTER DELETE ON {table} REFERENCING OLD TABLE AS old_rows",
+}
+
+_prepared: Set[str] = set()
+
+
+def ensure_summary_schema(db: Session) -> None:
+    """Create the summary table and the shared trigger function"""
+    db.execute(text(SUMMARY_TABLE_SQL))
+    db.execute(text(SUMMARY_FUNCTION_SQL))
+    db.commit()
+
+
+def ensure_menu_summary(db: Session, table_name: str) -> None:
+    """Attach summary triggers to a menu table, rebuilding its summary the first time"""
+    if table_name in _prepared:
+        return
+    installed = db.execute(text(
+        "SELECT count(*) FROM pg_trigger WHERE tgrelid = CAST(:table AS regclass) AND tgname LIKE 'category_summary_%'"
+    ), {"table": table_name}).scalar()
+    if installed < len(TRIGGERS):
+        # Блокируем запись на время пересчёта, чтобы не потерять изменения
+        db.execute(text(f"LOCK TABLE {table_name} IN SHARE ROW EXCLUSIVE MODE"))
+        for suffix, clause in TRIGGERS.items():
+            db.execute(text(f"DROP TRIGGER IF EXISTS category_summary_{suffix} ON {table_name}"))
+            db.execute(text(
+                f"CREATE TRIGGER category_summary_{suffix} {clause.format(table=table_name)} "
+                f"FOR EACH STATEMENT EXECUTE FUNCTION {SUMMARY_TABLE}_apply()"
+            ))
+        rebuild_menu_summary(db, table_name)
+        logger.info(f"Category summary triggers installed on {table_name}")
+    db.commit()
+    _prepared.add(table_name)
+
+
+def rebuild_menu_summary(db: Session, table_name: str) -> None:
+    """Recompute the summary of one menu table from scratch (caller commits)"""
+    db.execute(text(f"DELETE FROM {SUMMARY_TABLE} WHERE menu_table = :table"), {"table": table_name})
+    db.execute(text(f"""
+    INSERT INTO {SUMMARY_TABLE} (menu_table, category, subcategory, item_count, available_count)
+    SELECT :table, category, coalesce(subcategory, ''), count(*), count(*) FILTER (WHERE is_available)
+    FROM {table_name}
+    GROUP BY category, coalesce(subcategory, '')
+    """), {"table": table_name})
+
+
+def get_category_names(db: Session, table_name: str) -> List[str]:
+    """Distinct categories of a menu, read from the summary"""
+    result = db.execute(text(f"""
+    SELECT DISTINCT category FROM {SUMMARY_TABLE}
+    WHERE menu_table = :table
+    ORDER BY category
+    """), {"table": table_name})
+    return [row[0] for row in result]
+
+
+def get_category_summary(db: Session, table_name: str) -> List[Dict[str, Any]]:
+    """Categories with item/available counts and their subcategories"""
+    result = db.execute(text(f"""
+    SELECT category, subcategory, item_count, available_count FROM {SUMMARY_TABLE}
+    WHERE menu_table = :table
+    ORDER BY category, subcategory
+    """), {"table": table_name})
+    categories: Dict[str, Dict[str, Any]] = {}
+    for row in result:
+        category = categories.setdefault(row.category, {
+            "category": row.category,
+            "item_count": 0,
+            "available_count": 0,
+            "subcategories": [],
+        })
+        category["item_count"] += row.item_count
+        category["available_count"] += row.available_count
+        if row.subcategory:
+            category["subcategories"].append({
+                "name": row.subcategory,
+                "item_count": row.item_count,
+                "available_count": row.available_count,
+            })
+    return list(categories.values())
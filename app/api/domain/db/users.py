@@ -0,0 +1,72 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Any, Dict
+import logging
+
+from domain.db.models import UserData
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Имя совпадает с индексом, который create_all строит по UserTable.tid (index=True, unique=True)
+TID_INDEX = "ix_users_tid"
+
+# Конфликт по tid обновляет строку теми же значениями: RETURNING отдаёт существующего
+# пользователя, а триггер версий пропускает обновление без изменений
+REGISTER_SQL = """
+INSERT INTO users (tid, owner, language, created, updated)
+VALUES (:tid, FALSE, 'ru', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+ON CONFLICT (tid) DO UPDATE SET tid = EXCLUDED.tid
+RETURNING id, tid, owner, language, created, updated
+"""
+
+
+def ensure_user_schema(db: Session) -> None:
+    """Unique index on users.tid; duplicates left by concurrent /start are merged first"""
+    exists = db.execute(text("SELECT to_regclass(:index_name) IS NOT NULL"), {"index_name": TID_INDEX}).scalar()
+    if exists:
+        return
+    # Самая старая запись с тем же tid забирает признак владельца и язык, выбранный последним
+    merged = db.execute(text("""
+    UPDATE users keep
+    SET owner = coalesce(dups.owner, keep.owner), language = coalesce(dups.language, keep.language)
+    FROM (
+        SELECT tid, min(id) AS id, bool_or(owner) AS owner,
+               (array_agg(language ORDER BY updated DESC NULLS LAST, id DESC)
+                   FILTER (WHERE language IS NOT NULL AND language <> 'ru'))[1] AS language
+        FROM users
+        GROUP BY tid
+        HAVING count(*) > 1
+    ) dups
+    WHERE keep.id = dups.id
+    RETURNING keep.tid
+    """)).scalars().all()
+    if merged:
+        logger.info(f"Merging duplicate users of tids {merged}")
+    # Организации дублей переходят к самой старой записи с тем же tid
+    db.execute(text("""
+    UPDATE organizations o SET owner_id = keep.id
+    FROM users dup
+    JOIN LATERAL (SELECT min(id) AS id FROM users WHERE tid = dup.tid) keep ON TRUE
+    WHERE o.owner_id = dup.id AND dup.id <> keep.id
+    """))
+    removed = db.execute(text("""
+    DELETE FROM users u
+    USING users keep
+    WHERE u.tid = keep.tid AND u.id > keep.id
+    """)).rowcount
+    if removed:
+        logger.info(f"Removed {removed} duplicate users before indexing tid")
+    db.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {TID_INDEX} ON users (tid)"))
+    db.commit()
+
+
+def register_user(db: Session, tid: int) -> Dict[str, Any]:
+    """Return the user with this Telegram ID, creating it if needed, in one round trip.
+
+    The statement runs in autocommit: no separate BEGIN/COMMIT exchanges.
+    """
+    connection = db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+    row = connection.execute(text(REGISTER_SQL), {"tid": tid}).fetchone()
+    return UserData(**row._mapping).to_dict()
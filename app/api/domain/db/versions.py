@@ -0,0 +1,119 @@
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Set, Tuple
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VERSIONS_TABLE = "resource_versions"
+
+# Номер версии берётся из общей последовательности: у двух состояний одного ресурса он не совпадёт
+VERSIONS_TABLE_SQL = [
+    "CREATE SEQUENCE IF NOT EXISTS resource_version_seq",
+    f"""
+    CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+        resource TEXT PRIMARY KEY,
+        version BIGINT NOT NULL,
+        changed TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+# Ключ ресурса: TG_ARGV[0] для триггера уровня оператора, TG_ARGV[0] || значение колонки TG_ARGV[1] для строки
+VERSION_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION resource_version_bump() RETURNS trigger AS $$
+DECLARE
+    key TEXT;
+    has_rows BOOLEAN;
+BEGIN
+    IF TG_LEVEL = 'ROW' AND TG_OP = 'UPDATE' AND to_jsonb(OLD) = to_jsonb(NEW) THEN
+        -- Обновление без изменений (upsert существующего пользователя) версию не меняет
+        RETURN NULL;
+    ELSIF TG_LEVEL = 'STATEMENT' THEN
+        IF TG_OP <> 'TRUNCATE' THEN
+            -- Оператор, не изменивший ни одной строки (PATCH без изменений), версию не меняет;
+            -- EXECUTE: таблица переходов своя у каждого меню, план не кэшируем
+            EXECUTE 'SELECT EXISTS (SELECT 1 FROM changed_rows)' INTO has_rows;
+            IF NOT has_rows THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        key := TG_ARGV[0];
+    ELSIF TG_OP = 'DELETE' THEN
+        key := TG_ARGV[0] || (to_jsonb(OLD) ->> TG_ARGV[1]);
+    ELSE
+        key := TG_ARGV[0] || (to_jsonb(NEW) ->> TG_ARGV[1]);
+    END IF;
+    INSERT INTO {VERSIONS_TABLE} (resource, version, changed)
+    VALUES (key, nextval('resource_version_seq'), CURRENT_TIMESTAMP)
+    ON CONFLICT (resource) DO UPDATE SET version = EXCLUDED.version, changed = EXCLUDED.changed;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+# Триггеры меню: таблица переходов допускается только у триггера на одно событие
+MENU_TRIGGERS = {
+    "resource_version_insert": "INSERT REFERENCING NEW TABLE AS changed_rows",
+    "resource_version_update": "UPDATE REFERENCING NEW TABLE AS changed_rows",
+    "resource_version_delete": "DELETE REFERENCING OLD TABLE AS changed_rows",
+    "resource_version_truncate": "TRUNCATE",
+}
+
+# Таблица -> (префикс ключа, колонка с идентификатором)
+ROW_TRIGGERS = {
+    "organizations": ("org:", "id"),
+    "images": ("images:", "organization_id"),
+    "users": ("user:", "tid"),
+}
+
+_prepared: Set[str] = set()
+
+
+def ensure_version_schema(db: Session) -> None:
+    """Create the versions table, the bump function and triggers on the shared tables"""
+    for statement in VERSIONS_TABLE_SQL:
+        db.execute(text(statement))
+    db.execute(text(VERSION_FUNCTION_SQL))
+    for table_name, (prefix, column) in ROW_TRIGGERS.items():
+        db.execute(text(f"DROP TRIGGER IF EXISTS resource_version ON {table_name}"))
+        db.execute(text(
+            f"CREATE TRIGGER resource_version AFTER INSERT OR UPDATE OR DELETE ON {table_name} "
+            f"FOR EACH ROW EXECUTE FUNCTION resource_version_bump('{prefix}', '{column}')"
+        ))
+    db.commit()
+
+
+def ensure_menu_versioning(db: Session, table_name: str, org_id: int) -> None:
+    """Bump menu:<org_id> on every statement that changes rows of the menu table"""
+    if table_name in _prepared:
+        return
+    installed = db.execute(text(
+        "SELECT count(*) FROM pg_trigger WHERE tgrelid = CAST(:table AS regclass) AND tgname = ANY(CAST(:names AS text[]))"
+    ), {"table": table_name, "names": list(MENU_TRIGGERS)}).scalar()
+    if installed < len(MENU_TRIGGERS):
+        # Прежний общий триггер срабатывал и на операторы без изменённых строк
+        db.execute(text(f"DROP TRIGGER IF EXISTS resource_version ON {table_name}"))
+        for name, event in MENU_TRIGGERS.items():
+            db.execute(text(f"DROP TRIGGER IF EXISTS {name} ON {table_name}"))
+            db.execute(text(
+                f"CREATE TRIGGER {name} AFTER {event} ON {table_name} "
+                f"FOR EACH STATEMENT EXECUTE FUNCTION resource_version_bump('menu:{int(org_id)}')"
+            ))
+    db.commit()
+    _prepared.add(table_name)
+
+
+def get_versions(db: Session, resources: List[str]) -> Tuple[Dict[str, int], Optional[datetime]]:
+    """Current versions of resources (0 if never written) and their latest change time"""
+    rows = db.execute(text(f"""
+    SELECT resource, version, changed FROM {VERSIONS_TABLE}
+    WHERE resource = ANY(CAST(:resources AS text[]))
+    """), {"resources": resources}).fetchall()
+    versions = {resource: 0 for resource in resources}
+    versions.update({row.resource: row.version for row in rows})
+    changed = max((row.changed for row in rows), default=None)
+    return versions, changed
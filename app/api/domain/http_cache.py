@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from typing import Any, Dict, Optional
+import hashlib
+import json
+
+from common.wire import VARY, encode_response
+
+
+class Validators:
+    """ETag and Last-Modified of a response, computed from resource versions"""
+
+    def __init__(self, versions: Dict[str, int], changed: Optional[datetime] = None, *variant: Any,
+                 negotiated: bool = False):
+        # negotiated: тело выбирается по Accept/Accept-Encoding (respond), 304 должен нести тот же Vary
+        self.negotiated = negotiated
+        # Параметры запроса (skip/limit/category) дают разные тела при одной версии данных
+        payload = json.dumps([sorted(versions.items()), [str(v) for v in variant]])
+        self.etag = f'W/"{hashlib.sha1(payload.encode()).hexdigest()[:20]}"'
+        self.last_modified = changed.astimezone(timezone.utc).replace(microsecond=0) if changed else None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        # no-cache: клиент может хранить ответ, но обязан перепроверять его
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if self.last_modified:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        if self.negotiated:
+            headers["Vary"] = VARY
+        return headers
+
+    def matches(self, request: Request) -> bool:
+        """True if the client's copy is current (If-None-Match wins over If-Modified-Since)"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            if if_none_match.strip() == "*":
+                return True
+            # Слабое сравнение: W/ у тегов не учитывается
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return self.etag.removeprefix("W/") in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and self.last_modified:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers=self.headers)
+
+    def json(self, content: Any) -> JSONResponse:
+        return JSONResponse(content=content, headers=self.headers)
+
+    def respond(self, content: Any, request: Request) -> Response:
+        """Like json(), but MessagePack/zstd when the client asks for it"""
+        return encode_response(content, request, self.headers)
@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import BinaryIO, Dict, List, Set, Tuple
+import os
+import re
+import zipfile
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Страница меню ссылается на {image_name}.jpg, поэтому принимаем только JPEG
+IMAGE_EXTENSIONS = {".jpg", ".jpeg"}
+JPEG_MAGIC = b"\xff\xd8\xff"
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(200 * 1024)))
+# Защита от zip-бомб и случайно отправленных архивов с чем попало
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", "1000"))
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES", str(200 * 1024 * 1024)))
+EXTRACT_WORKERS = int(os.getenv("IMAGE_EXTRACT_WORKERS", "8"))
+
+_UNSAFE_CHARS = re.compile(r"[\\/\x00-\x1f]")
+
+
+class ArchiveError(ValueError):
+    """The upload is not a usable zip archive"""
+
+
+@dataclass
+class ExtractResult:
+    saved: List[Tuple[str, str]] = field(default_factory=list)  # (original, stored)
+    rejected: List[Dict[str, str]] = field(default_factory=list)
+
+
+def stored_image_name(filename: str) -> str:
+    """'Капучино.JPEG' -> 'Капучино.jpg': the name the menu page links to"""
+    stem, _ = os.path.splitext(os.path.basename(filename))
+    return f"{_UNSAFE_CHARS.sub('_', stem).strip()}.jpg"
+
+
+def _is_image_entry(info: zipfile.ZipInfo) -> bool:
+    name = os.path.basename(info.filename)
+    return (
+        not info.is_dir()
+        and not name.startswith(".")
+        and not info.filename.startswith("__MACOSX/")
+        and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+def _extract_one(archive: zipfile.ZipFile, info: zipfile.ZipInfo, target_dir: str) -> Tuple[str, str]:
+    original = os.path.basename(info.filename)
+    if info.file_size > IMAGE_MAX_BYTES:
+        raise ValueError(f"larger than {IMAGE_MAX_BYTES // 1024} KB")
+    with archive.open(info) as source:
+        data = source.read(IMAGE_MAX_BYTES + 1)
+    if len(data) > IMAGE_MAX_BYTES:
+        raise ValueError(f"larger than {IMAGE_MAX_BYTES // 1024} KB")
+    if not data.startswith(JPEG_MAGIC):
+        raise ValueError("not a JPEG image")
+    stored = stored_image_name(original)
+    path = os.path.join(target_dir, stored)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return original, stored
+
+
+def extract_images(fileobj: BinaryIO, target_dir: str) -> ExtractResult:
+    """Validate and extract the JPEGs of a zip archive in parallel"""
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ArchiveError("File is not a zip archive")
+    result = ExtractResult()
+    with archive:
+        entries = []
+        for info in archive.infolist():
+            if _is_image_entry(info):
+                entries.append(info)
+            elif not info.is_dir() and not info.filename.startswith("__MACOSX/"):
+                result.rejected.append({"file": info.filename, "reason": "not a .jpg file"})
+        if len(entries) > ARCHIVE_MAX_FILES:
+            raise ArchiveError(f"Archive has more than {ARCHIVE_MAX_FILES} images")
+        if sum(info.file_size for info in entries) > ARCHIVE_MAX_BYTES:
+            raise ArchiveError(f"Archive is larger than {ARCHIVE_MAX_BYTES // (1024 * 1024)} MB unpacked")
+
+        os.makedirs(target_dir, exist_ok=True)
+        # Одинаковые имена в разных папках архива: берём последний файл
+        by_name: Dict[str, zipfile.ZipInfo] = {}
+        for info in entries:
+            by_name[stored_image_name(info.filename).lower()] = info
+
+        with ThreadPoolExecutor(max_workers=max(1, min(EXTRACT_WORKERS, len(by_name)))) as pool:
+            futures = {info.filename: pool.submit(_extract_one, archive, info, target_dir) for info in by_name.values()}
+            for filename, future in futures.items():
+                try:
+                    result.saved.append(future.result())
+                except Exception as e:
+                    result.rejected.append({"file": filename, "reason": str(e)})
+    return result
+
+
+def match_images_to_menu(db: Session, menu_table_name: str, stored_names: List[str]) -> Dict[str, List[str]]:
+    """Link images to menu items by file name (caller commits).
+
+    A file matches an item whose image_name equals its stem; items without an
+    image_name whose name equals the stem get it assigned in one UPDATE.
+    """
+    stems = [os.path.splitext(name)[0] for name in stored_names]
+    if not stems:
+        return {"matched": [], "assigned": [], "unmatched": []}
+    assigned = [row.image_name for row in db.execute(text(f"""
+    UPDATE {menu_table_name} t
+    SET image_name = f.stem, updated = CURRENT_TIMESTAMP
+    FROM unnest(CAST(:stems AS text[])) AS f(stem)
+    WHERE (t.image_name IS NULL OR t.image_name = '') AND lower(t.name) = lower(f.stem)
+    RETURNING t.image_name
+    """), {"stems": stems})]
+    linked: Set[str] = {row[0] for row in db.execute(text(f"""
+    SELECT DISTINCT image_name FROM {menu_table_name}
+    WHERE image_name = ANY(CAST(:stems AS text[]))
+    """), {"stems": stems})}
+    return {
+        "matched": sorted(linked - set(assigned)),
+        "assigned": sorted(set(assigned)),
+        "unmatched": sorted(set(stems) - linked),
+    }
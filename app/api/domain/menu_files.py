@@ -0,0 +1,38 @@
+from decimal import Decimal
+from typing import Any, Dict, List
+import csv
+import os
+
+MENU_FILE_EXTENSIONS = (".csv", ".xls", ".xlsx")
+
+
+class MenuFileError(Exception):
+    """The uploaded file cannot be imported; retrying will not help"""
+
+
+def _menu_row(row) -> Dict[str, Any]:
+    return {
+        'name': row['name'],
+        'price': Decimal(str(row['price'])),
+        'category': row['category'],
+        'description': row.get('description'),
+        'subcategory': row.get('subcategory'),
+        'image_name': row.get('image_name'),  # Добавляем имя изображения
+        'sku': row.get('sku')
+    }
+
+
+def read_menu_file(file_path: str, filename: str) -> List[Dict[str, Any]]:
+    """Menu rows of an uploaded CSV or Excel file"""
+    extension = os.path.splitext(filename)[1].lower()
+    try:
+        if extension == ".csv":
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return [_menu_row(row) for row in csv.DictReader(f)]
+        if extension in (".xls", ".xlsx"):
+            import pandas as pd
+            df = pd.read_excel(file_path)
+            return [_menu_row(row) for _, row in df.iterrows()]
+    except (KeyError, ArithmeticError, UnicodeDecodeError, ValueError) as e:
+        raise MenuFileError(f"Cannot read menu file: {type(e).__name__}: {str(e)}")
+    raise MenuFileError("Unsupported file format")
@@ -0,0 +1,119 @@
+from sqlalchemy import text
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import os
+import logging
+import traceback
+
+import aiohttp
+
+from domain.db.database import SessionLocal
+from domain.db.models import Organization
+from common.wire import pack
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GENERATOR_URL = os.getenv("GENERATOR_URL", "http://genhtm:2424")
+# Окно, в котором несколько правок меню сливаются в одну перегенерацию
+REFRESH_DELAY = float(os.getenv("PAGE_REFRESH_DELAY", "2.0"))
+
+
+def build_page_content(org_id: int, menu_table_name: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Available menu items grouped by category, in the generator's request format"""
+    db = SessionLocal()
+    try:
+        result = db.execute(text(f"""
+        SELECT name, price, description, category, subcategory, image_name
+        FROM {menu_table_name}
+        WHERE is_available
+        ORDER BY category, name
+        """))
+        content: Dict[str, List[Dict[str, Any]]] = {}
+        for row in result:
+            content.setdefault(row.category, []).append({
+                "name": row.name,
+                "price": float(row.price),
+                "description": row.description,
+                "subcategory": row.subcategory,
+                "image_url": f"{org_id}/{row.image_name}.jpg",
+            })
+        return content
+    finally:
+        db.close()
+
+
+def _menu_table_name(org_id: int) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        org = Organization.get_by_id(db, org_id)
+        return org.menu_table_name if org else None
+    finally:
+        db.close()
+
+
+class PageRefresher:
+    """Coalesce menu changes into one generator /refresh per organization.
+
+    ``schedule`` may be called from the threadpool (sync endpoints). The
+    first call for an org starts a delayed refresh; calls made before it runs
+    are absorbed by it, calls made while it runs cause exactly one rerun.
+    """
+
+    def __init__(self, delay: float = REFRESH_DELAY):
+        self.delay = delay
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Set[int] = set()
+        self._running: Set[int] = set()
+        self._dirty: Set[int] = set()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+
+    def schedule(self, org_id: int) -> None:
+        if self._loop is None:
+            logger.warning(f"Page refresher is not started, skipping refresh of org {org_id}")
+            return
+        self._loop.call_soon_threadsafe(self._schedule, org_id)
+
+    def _schedule(self, org_id: int) -> None:
+        if org_id in self._running:
+            self._dirty.add(org_id)
+            return
+        if org_id in self._pending:
+            return
+        self._pending.add(org_id)
+        self._loop.create_task(self._run(org_id))
+
+    async def _run(self, org_id: int) -> None:
+        await asyncio.sleep(self.delay)
+        self._pending.discard(org_id)
+        self._running.add(org_id)
+        try:
+            await self.refresh(org_id)
+        except Exception as e:
+            logger.error(f"Error refreshing page of org {org_id}: {str(e)}")
+            logger.error(traceback.format_exc())
+        finally:
+            self._running.discard(org_id)
+            if org_id in self._dirty:
+                self._dirty.discard(org_id)
+                self._schedule(org_id)
+
+    async def refresh(self, org_id: int) -> None:
+        menu_table_name = await asyncio.to_thread(_menu_table_name, org_id)
+        if not menu_table_name:
+            return
+        content = await asyncio.to_thread(build_page_content, org_id, menu_table_name)
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{GENERATOR_URL}/refresh", **pack({"org_id": str(org_id), "content": content})) as resp:
+                if resp.status == 404:
+                    # Страницу ещё не генерировали - обновлять нечего
+                    return
+                if resp.status != 200:
+                    raise Exception(f"Generator refresh failed: {await resp.text()}")
+        logger.info(f"Menu page of org {org_id} refreshed")
+
+
+page_refresher = PageRefresher()
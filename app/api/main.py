@@ -1,10 +1,12 @@
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Request, Query
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from decimal import Decimal
 import os
 import shutil
+import uuid
 from datetime import datetime
 from contextlib import asynccontextmanager
 import logging
@@ -12,13 +14,28 @@ import traceback
 from sqlalchemy.sql import text
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import json
 import aiohttp
 
-from domain.db.database import get_db, init_db, get_db_session
+from domain.db.database import get_db, init_db, get_db_session, engine
 from domain.db.models import Menu, MenuData, Organization, OrganizationData, MenuItem, User, UserData, Image, ImageData
+from domain.db.search import ensure_search_extension, ensure_menu_search, search_menu
+from domain.db.summary import ensure_summary_schema, ensure_menu_summary, get_category_names, get_category_summary
+from domain.db.versions import ensure_version_schema, ensure_menu_versioning, get_versions
+from domain.db.routing import ReadYourWritesMiddleware, get_read_db_session, read_router
+from domain.db.users import ensure_user_schema, register_user as register_user_by_tid
+from domain.db.jobs import IMPORT_DIR, ensure_jobs_schema, create_job, get_job
+from domain.menu_files import MENU_FILE_EXTENSIONS
+from domain.http_cache import Validators
+from common.wire import encode_response
+from domain.pages import page_refresher
+from domain.images import ArchiveError, extract_images, match_images_to_menu
 from domain.entity.tables import get_table_info, get_table_structure, get_table_data
+from common.admission import Rate, RouteClass, install_admission
+from common.metrics import install_metrics, instrument_engine
+from common.profiling import install_profiling
+from common.tracing import install_tracing, trace_engine, get_tracer
 
 # from routes.users import router as router_users
 
@@ -31,6 +48,25 @@ async def lifespan(app: FastAPI):
     try:
         init_db()
         logger.info("Database initialized successfully")
+        # Поиск и сводка категорий для уже существующих меню
+        db = get_db_session()
+        try:
+            ensure_search_extension(db)
+            ensure_summary_schema(db)
+            ensure_user_schema(db)
+            ensure_version_schema(db)
+            ensure_jobs_schema(db)
+            for org in Organization.get_all(db, 0, 10000):
+                ensure_menu_search(db, org.menu_table_name)
+                ensure_menu_summary(db, org.menu_table_name)
+                ensure_menu_versioning(db, org.menu_table_name, org.id)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error preparing menu search, category summary and versions: {str(e)}")
+        finally:
+            db.close()
+        page_refresher.start()
+        read_router.start()
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         logger.error(traceback.format_exc())
@@ -38,6 +74,31 @@ async def lifespan(app: FastAPI):
     yield
 
 app = FastAPI(title="Menu API", lifespan=lifespan)
+# Дорогие маршруты: импорт меню и картинок, генерация страниц, отладка
+install_admission(app, [
+    RouteClass.from_env("import", concurrency=2, queue=8, deadline=15.0,
+                        per_user=Rate(per_minute=10, burst=5), per_org=Rate(per_minute=20, burst=5)),
+    RouteClass.from_env("render", concurrency=2, queue=4, deadline=20.0,
+                        per_user=Rate(per_minute=6, burst=3), per_org=Rate(per_minute=6, burst=3)),
+    RouteClass.from_env("debug", concurrency=1, queue=0, per_user=Rate(per_minute=6, burst=2)),
+], {
+    ("POST", "/organizations/{org_id}/menu"): "import",
+    ("POST", "/api/organizations/{org_id}/menu"): "import",
+    ("POST", "/organizations/{org_id}/images/batch"): "import",
+    ("POST", "/organizations/{org_id}/images/archive"): "import",
+    ("POST", "/organizations/{org_id}/menu/generate/{theme}"): "render",
+    ("GET", "/debug/tables"): "debug",
+})
+# Чтения сразу после записи того же пользователя или организации - с основной базы
+app.add_middleware(ReadYourWritesMiddleware)
+install_metrics(app)
+install_profiling(app)
+instrument_engine(engine)
+install_tracing(app, "menu-api")
+trace_engine(engine)
+for replica in read_router.replicas:
+    trace_engine(replica.engine)
+tracer = get_tracer(__name__)
 
 # Константы
 BASE_URL = "http://api:2424"
@@ -69,6 +130,14 @@ class ImageUploadRequest(BaseModel):
     image_name: str
     stored_name: str
 
+class MenuBulkPatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+    is_available: Optional[bool] = None
+    price: Optional[Decimal] = Field(None, ge=0)
+
+class ImageBatchUploadRequest(BaseModel):
+    images: List[ImageUploadRequest] = Field(..., min_length=1, max_length=1000)
+
 class OrganizationUpdateRequest(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
@@ -207,8 +276,9 @@ def update_menu_item(
             upload_dir = os.getenv("UPLOAD_DIR", "/files")
             os.makedirs(upload_dir, exist_ok=True)
             file_path = os.path.join(upload_dir, image.filename)
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(image.file, buffer)
+            with tracer.start_as_current_span("file.write", attributes={"file.path": file_path}):
+                with open(file_path, "wb") as buffer:
+                    shutil.copyfileobj(image.file, buffer)
             image_url = f"/files/{image.filename}"
 
         # Создание объекта с обновленными данными
@@ -290,6 +360,8 @@ def create_organization(
         """
         db.execute(text(create_menu_table_sql))
         db.commit()
+        ensure_menu_search(db, menu_table_name)
+        ensure_menu_summary(db, menu_table_name)
         # Создаем организацию
         org_data = OrganizationData(
             name=name,
@@ -298,6 +370,7 @@ def create_organization(
             menu_table_name=menu_table_name
         )
         org = Organization.create(db, org_data)
+        ensure_menu_versioning(db, menu_table_name, org.id)
         return org.to_dataclass().to_dict()
     except Exception as e:
         db.rollback()
@@ -310,7 +383,7 @@ def get_organizations(
     skip: int = 0,
     limit: int = 100,
     owner_id: Optional[int] = None,
-    db: Session = Depends(get_db_session)
+    db: Session = Depends(get_read_db_session)
 ):
     """Get all organizations or filter by owner"""
     try:
@@ -325,13 +398,16 @@ def get_organizations(
         db.close()
 
 @app.get("/organizations/{org_id}", response_model=dict)
-def get_organization(org_id: int, db: Session = Depends(get_db_session)):
-    """Get organization by ID"""
+def get_organization(org_id: int, request: Request, db: Session = Depends(get_read_db_session)):
+    """Get organization by ID (supports If-None-Match / If-Modified-Since)"""
     try:
+        validators = Validators(*get_versions(db, [f"org:{org_id}"]))
+        if validators.matches(request):
+            return validators.not_modified()
         org = Organization.get_by_id(db, org_id)
         if not org:
             raise HTTPException(status_code=404, detail="Organization not found")
-        return org.to_dataclass().to_dict()
+        return validators.json(org.to_dataclass().to_dict())
     except HTTPException:
         raise
     except Exception as e:
@@ -339,65 +415,42 @@ def get_organization(org_id: int, db: Session = Depends(get_db_session)):
     finally:
         db.close()
 
-@app.post("/organizations/{org_id}/menu")
-async def upload_menu(
+@app.post("/organizations/{org_id}/menu", status_code=202)
+def upload_menu(
     org_id: int,
     file: UploadFile = File(...),
+    mode: str = Query("append", pattern="^(append|sync)$"),
     db: Session = Depends(get_db_session)
 ):
-    """Upload menu for organization"""
+    """Queue a menu import for the organization; returns the job to poll at /jobs/{job_id}.
+
+    mode=append adds the rows; mode=sync makes the menu match the file by
+    natural key (sku, or category + name) and reports what changed.
+    """
     try:
         # Проверяем существование организации
         org = Organization.get_by_id(db, org_id)
         if not org:
             raise HTTPException(status_code=404, detail="Organization not found")
-
-        # Сохраняем файл
-        file_path = f"temp_{file.filename}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Читаем и обрабатываем файл
-        if file.filename.endswith('.csv'):
-            import csv
-            with open(file_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    insert_sql = f"""
-                    INSERT INTO {org.menu_table_name} (name, price, category, description, subcategory, image_name)
-                    VALUES (:name, :price, :category, :description, :subcategory, :image_name)
-                    """
-                    db.execute(text(insert_sql), {
-                        'name': row['name'],
-                        'price': Decimal(row['price']),
-                        'category': row['category'],
-                        'description': row.get('description'),
-                        'subcategory': row.get('subcategory'),
-                        'image_name': row.get('image_name')  # Добавляем имя изображения
-                    })
-        elif file.filename.endswith(('.xls', '.xlsx')):
-            import pandas as pd
-            df = pd.read_excel(file_path)
-            for _, row in df.iterrows():
-                insert_sql = f"""
-                INSERT INTO {org.menu_table_name} (name, price, category, description, subcategory, image_name)
-                VALUES (:name, :price, :category, :description, :subcategory, :image_name)
-                """
-                db.execute(text(insert_sql), {
-                    'name': row['name'],
-                    'price': Decimal(str(row['price'])),
-                    'category': row['category'],
-                    'description': row.get('description'),
-                    'subcategory': row.get('subcategory'),
-                    'image_name': row.get('image_name')  # Добавляем имя изображения
-                })
-        else:
+        if not file.filename.lower().endswith(MENU_FILE_EXTENSIONS):
             raise HTTPException(status_code=400, detail="Unsupported file format")
 
+        # Файл разбирает воркер (worker.py): сохраняем его в общий каталог
+        os.makedirs(IMPORT_DIR, exist_ok=True)
+        file_path = os.path.join(IMPORT_DIR, f"{org_id}_{uuid.uuid4().hex}_{os.path.basename(file.filename)}")
+        with tracer.start_as_current_span("file.write", attributes={"file.path": file_path}):
+            with open(file_path, "wb") as buffer:
+                shutil.copyfileobj(file.file, buffer)
+
+        job = create_job(db, org_id, mode, file.filename, file_path)
         db.commit()
-        # Удаляем временный файл
-        os.remove(file_path)
-        return {"status": "success", "message": "Menu uploaded successfully"}
+        return {
+            "status": "queued",
+            "message": "Menu import queued",
+            "job_id": job["id"],
+            "status_url": f"/jobs/{job['id']}",
+            "job": job,
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -406,16 +459,42 @@ async def upload_menu(
     finally:
         db.close()
 
+@app.get("/jobs/{job_id}")
+def get_import_job(job_id: int, db: Session = Depends(get_db_session)):
+    """Status and progress of a menu import job"""
+    try:
+        job = get_job(db, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] == "done":
+            # Меню записал воркер: следующее чтение меню - с основной базы
+            read_router.mark_write([f"org:{job['organization_id']}"])
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
 @app.get("/organizations/{org_id}/menu")
 def get_organization_menu(
     org_id: int,
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     category: Optional[str] = None,
-    db: Session = Depends(get_db_session)
+    db: Session = Depends(get_read_db_session)
 ):
-    """Get menu for specific organization"""
+    """Get menu for specific organization (supports If-None-Match / If-Modified-Since)"""
     try:
+        # Версии меню и организации проверяем до чтения строк меню
+        validators = Validators(
+            *get_versions(db, [f"org:{org_id}", f"menu:{org_id}"]), skip, limit, category, negotiated=True
+        )
+        if validators.matches(request):
+            return validators.not_modified()
+
         # Получаем организацию
         org = Organization.get_by_id(db, org_id)
         if not org:
@@ -452,7 +531,7 @@ def get_organization_menu(
                 "updated": row.updated.isoformat() if row.updated else None
             })
 
-        return menu_items
+        return validators.respond(menu_items, request)
     except HTTPException:
         raise
     except Exception as e:
@@ -460,6 +539,83 @@ def get_organization_menu(
     # finally:
     #     db.close()
 
+@app.patch("/organizations/{org_id}/menu")
+def patch_organization_menu(
+    org_id: int,
+    request: MenuBulkPatchRequest,
+    db: Session = Depends(get_db_session)
+):
+    """Set availability and/or price for many menu items in one statement"""
+    try:
+        if request.is_available is None and request.price is None:
+            raise HTTPException(status_code=400, detail="Nothing to update: pass is_available and/or price")
+        org = Organization.get_by_id(db, org_id)
+        if not org:
+            raise HTTPException(status_code=404, detail="Organization not found")
+
+        # Строки, где значение уже такое, не трогаем: их нет в ответе и они не будят триггеры
+        query = f"""
+        UPDATE {org.menu_table_name}
+        SET is_available = coalesce(:is_available, is_available),
+            price = coalesce(:price, price),
+            updated = CURRENT_TIMESTAMP
+        WHERE id = ANY(:ids)
+          AND (is_available IS DISTINCT FROM coalesce(:is_available, is_available)
+               OR price IS DISTINCT FROM coalesce(:price, price))
+        RETURNING id, name, price, category, subcategory, is_available, updated
+        """
+        result = db.execute(text(query), {
+            "ids": request.ids,
+            "is_available": request.is_available,
+            "price": request.price,
+        })
+        changed = [{
+            "id": row.id,
+            "name": row.name,
+            "price": float(row.price),
+            "category": row.category,
+            "subcategory": row.subcategory,
+            "is_available": row.is_available,
+            "updated": row.updated.isoformat() if row.updated else None
+        } for row in result]
+        db.commit()
+
+        if changed:
+            page_refresher.schedule(org_id)
+        return {"requested": len(request.ids), "changed": changed, "page_refresh_scheduled": bool(changed)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+@app.get("/organizations/{org_id}/menu/search")
+def search_organization_menu(
+    org_id: int,
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    available_only: bool = False,
+    db: Session = Depends(get_db_session)
+):
+    """Search menu items by name, category and description"""
+    try:
+        org = Organization.get_by_id(db, org_id)
+        if not org:
+            raise HTTPException(status_code=404, detail="Organization not found")
+
+        total, items = search_menu(db, org.menu_table_name, q, skip, limit, available_only)
+        return encode_response({"query": q, "total": total, "skip": skip, "limit": limit, "items": items}, request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
 @app.get("/organizations/{org_id}/menu/categories")
 def get_organization_menu_categories(
     org_id: int,
@@ -472,19 +628,35 @@ def get_organization_menu_categories(
         if not org:
             raise HTTPException(status_code=404, detail="Organization not found")
 
-        # Получаем уникальные категории
-        query = f"""
-        SELECT DISTINCT category FROM {org.menu_table_name}
-        ORDER BY category
-        """
-        result = db.execute(text(query))
-        categories = [row[0] for row in result]
-        
-        return categories
+        # Категории из сводки, без прохода по всей таблице меню
+        ensure_menu_summary(db, org.menu_table_name)
+        return get_category_names(db, org.menu_table_name)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+@app.get("/organizations/{org_id}/menu/categories/summary")
+def get_organization_menu_category_summary(
+    org_id: int,
+    db: Session = Depends(get_db_session)
+):
+    """Menu categories with item counts, available counts and subcategories"""
+    try:
+        org = Organization.get_by_id(db, org_id)
+        if not org:
+            raise HTTPException(status_code=404, detail="Organization not found")
+
+        ensure_menu_summary(db, org.menu_table_name)
+        return get_category_summary(db, org.menu_table_name)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
 
 # API endpoints
 @app.get("/")
@@ -688,23 +860,11 @@ async def generate_menu(org_id: int, theme: str, db: Session = Depends(get_db_se
 #Users____________________________________________________________________________________
 #POST
 @app.post("/register_user")
-async def register_user(tid: int = Query(...), db: Session = Depends(get_db_session)):
+def register_user(tid: int = Query(...), db: Session = Depends(get_db_session)):
     """Register a new user or return existing user"""
     try:
-        logger.info(f"Attempting to register user with tid: {tid}")
-        
-        # Проверяем существование пользователя
-        existing_user = User.get_by_tid(db, tid)
-        if existing_user:
-            logger.info(f"User with tid {tid} already exists")
-            return existing_user.to_dataclass().to_dict()
-        
-        # Создаем нового пользователя
-        user_data = UserData(tid=tid, owner=False)
-        new_user = User.create(db, user_data)
-        logger.info(f"Successfully registered new user with tid: {tid}")
-        
-        return new_user.to_dataclass().to_dict()
+        # Один INSERT ... ON CONFLICT (tid): без поиска, гонок и дублей
+        return register_user_by_tid(db, tid)
     except Exception as e:
         logger.error(f"Error registering user: {str(e)}")
         logger.error(traceback.format_exc())
@@ -724,13 +884,15 @@ def create_user(
         )
         user_item = User.create(db, user_data)
         return user_item.to_dataclass().to_dict()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="User with this Telegram ID already exists")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         db.close()
 #GET
 @app.get("/users/{user_id}", response_model=dict)
-def get_user(user_id: int, db: Session = Depends(get_db_session)):
+def get_user(user_id: int, db: Session = Depends(get_read_db_session)):
     try:
         item = User.get_by_id(db, user_id)
         if not item:
@@ -744,12 +906,15 @@ def get_user(user_id: int, db: Session = Depends(get_db_session)):
         db.close()
 
 @app.get("/users/telegram/{tid}", response_model=dict)
-def get_user_by_tid(tid: int, db: Session = Depends(get_db_session)):
+def get_user_by_tid(tid: int, request: Request, db: Session = Depends(get_read_db_session)):
     try:
+        validators = Validators(*get_versions(db, [f"user:{tid}"]))
+        if validators.matches(request):
+            return validators.not_modified()
         user = User.get_by_tid(db, tid)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        return user.to_dataclass().to_dict()
+        return validators.json(user.to_dataclass().to_dict())
     except HTTPException:
         raise
     except Exception as e:
@@ -796,12 +961,89 @@ async def upload_images(
     finally:
         db.close()
 
+def register_org_images(db: Session, org: Organization, files: List[tuple]) -> dict:
+    """Link (original, stored) files to menu items and register the new ones in one INSERT"""
+    existing = {image.stored_filename for image in Image.get_by_organization(db, org.id)}
+    match = match_images_to_menu(db, org.menu_table_name, [stored for _, stored in files])
+    db.commit()
+    unique = {stored: original for original, stored in files}
+    new_images = [
+        ImageData(organization_id=org.id, original_filename=original, stored_filename=stored)
+        for stored, original in unique.items()
+        if stored not in existing
+    ]
+    images = Image.create_many(db, new_images)
+    if match["assigned"]:
+        page_refresher.schedule(org.id)
+    return {
+        "registered": [image.to_dict() for image in images],
+        "already_registered": len(unique) - len(new_images),
+        **match
+    }
+
+@app.post("/organizations/{org_id}/images/batch")
+def upload_images_batch(
+    org_id: int,
+    request: ImageBatchUploadRequest,
+    db: Session = Depends(get_db_session)
+):
+    """Register many already stored images (e.g. a Telegram album) at once"""
+    try:
+        org = Organization.get_by_id(db, org_id)
+        if not org:
+            raise HTTPException(status_code=404, detail="Organization not found")
+        files = [(image.image_name, image.stored_name) for image in request.images]
+        return register_org_images(db, org, files)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error registering images: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+@app.post("/organizations/{org_id}/images/archive")
+def upload_images_archive(
+    org_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db_session)
+):
+    """Upload a zip of JPEGs named after menu items; extracts, matches and registers them"""
+    try:
+        org = Organization.get_by_id(db, org_id)
+        if not org:
+            raise HTTPException(status_code=404, detail="Organization not found")
+
+        org_image_dir = os.path.join(IMAGE_DATA_DIR, str(org_id))
+        with tracer.start_as_current_span("images.extract", attributes={"file.path": org_image_dir}):
+            extracted = extract_images(file.file, org_image_dir)
+        result = register_org_images(db, org, extracted.saved)
+        return {"extracted": len(extracted.saved), "rejected": extracted.rejected, **result}
+    except ArchiveError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error uploading image archive: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
 @app.get("/organizations/{org_id}/images")
 async def get_organization_images(
     org_id: int,
-    db: Session = Depends(get_db_session)
+    request: Request,
+    db: Session = Depends(get_read_db_session)
 ):
     try:
+        validators = Validators(*get_versions(db, [f"org:{org_id}", f"images:{org_id}"]))
+        if validators.matches(request):
+            return validators.not_modified()
+
         # Check if organization exists
         org = Organization.get_by_id(db, org_id)
         if not org:
@@ -817,7 +1059,7 @@ async def get_organization_images(
             image_data['url'] = f"/static/image_data/{org_id}/{image.stored_filename}"
             result.append(image_data)
             
-        return {"images": result}
+        return validators.json({"images": result})
     except Exception as e:
         logger.error(f"Error getting images: {str(e)}")
         logger.error(traceback.format_exc())
@@ -828,7 +1070,7 @@ async def get_organization_images(
 @app.get("/images/{image_id}")
 async def get_image(
     image_id: int,
-    db: Session = Depends(get_db_session)
+    db: Session = Depends(get_read_db_session)
 ):
     try:
         image = Image.get_by_id(db, image_id)
@@ -0,0 +1,171 @@
+"""Menu import worker: parses uploaded files and loads them into menu tables.
+
+Jobs are queued by POST /organizations/{org_id}/menu in the import_jobs
+table; each worker process claims them with SELECT ... FOR UPDATE SKIP LOCKED.
+
+    python worker.py            # IMPORT_WORKERS processes
+"""
+from contextlib import contextmanager
+from typing import Any, Dict
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+from domain.db.database import SessionLocal
+from domain.db.jobs import (
+    JOB_MAX_ATTEMPTS, JOB_STALE_SECONDS, claim_job, fail_abandoned_jobs, fail_job, finish_job, touch_job, update_progress
+)
+from domain.db.menu_import import insert_menu_rows, sync_menu_rows
+from domain.db.models import Organization
+from domain.menu_files import MenuFileError, read_menu_file
+from domain.pages import page_refresher
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+IMPORT_POLL_INTERVAL = float(os.getenv("IMPORT_POLL_INTERVAL", "0.5"))
+# Строк на один INSERT; после каждой порции обновляется прогресс задания
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "500"))
+# Пульс задания: чаще, чем его могут счесть брошенным
+HEARTBEAT_INTERVAL = max(1.0, JOB_STALE_SECONDS / 3)
+
+
+@contextmanager
+def heartbeat(job_id: int):
+    """Touch the job from a background thread while a long statement (sync) runs"""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            db = SessionLocal()
+            try:
+                touch_job(db, job_id)
+            except Exception as e:
+                logger.warning(f"Heartbeat of import job {job_id} failed: {str(e)}")
+            finally:
+                db.close()
+
+    thread = threading.Thread(target=beat, name=f"import-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    db = SessionLocal()
+    # Прогресс пишется отдельной сессией: данные меню коммитятся одной транзакцией в конце
+    progress_db = SessionLocal()
+    try:
+        org = Organization.get_by_id(db, job["organization_id"])
+        if not org:
+            raise MenuFileError("Organization not found")
+        rows = read_menu_file(job["file_path"], job["filename"])
+        update_progress(progress_db, job["id"], 0, len(rows))
+
+        if job["mode"] == "sync":
+            if not rows:
+                raise MenuFileError("Sync with an empty file would delete the whole menu")
+            with heartbeat(job["id"]):
+                report = sync_menu_rows(db, org.menu_table_name, rows)
+            changed = any(report[key] for key in ("inserted", "updated", "deleted", "rekeyed", "duplicates_removed"))
+        else:
+            inserted = 0
+            for start in range(0, len(rows), IMPORT_CHUNK_ROWS):
+                chunk = rows[start:start + IMPORT_CHUNK_ROWS]
+                inserted += insert_menu_rows(db, org.menu_table_name, chunk)
+                update_progress(progress_db, job["id"], start + len(chunk))
+            report = {"inserted": inserted, "skipped": len(rows) - inserted}
+            changed = inserted > 0
+        db.commit()
+        return {"mode": job["mode"], "changed": changed, **report}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        progress_db.close()
+
+
+def process_job(job: Dict[str, Any]) -> None:
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        try:
+            result = run_job(job)
+        except MenuFileError as e:
+            fail_job(db, job["id"], str(e), job["attempts"], permanent=True)
+            logger.warning(f"Import job {job['id']} rejected: {str(e)}")
+            final = True
+        except Exception as e:
+            logger.error(f"Import job {job['id']} failed: {str(e)}")
+            logger.error(traceback.format_exc())
+            fail_job(db, job["id"], str(e), job["attempts"])
+            final = job["attempts"] >= JOB_MAX_ATTEMPTS
+        else:
+            finish_job(db, job["id"], result)
+            logger.info(f"Import job {job['id']} done in {time.perf_counter() - started:.2f}s: {result}")
+            final = True
+            if result["changed"]:
+                try:
+                    asyncio.run(page_refresher.refresh(job["organization_id"]))
+                except Exception as e:
+                    logger.error(f"Error refreshing page of org {job['organization_id']}: {str(e)}")
+        # Файл храним, пока задание может быть повторено
+        if final and os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+    finally:
+        db.close()
+
+
+def worker_loop(worker_id: int) -> None:
+    # Каждый процесс (spawn) импортирует модуль заново и создаёт свой движок БД
+    logger.info(f"Import worker {worker_id} started")
+    while True:
+        db = SessionLocal()
+        try:
+            # Брошенные задания без попыток в запасе больше не берём - закрываем и удаляем файл
+            for file_path in fail_abandoned_jobs(db):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            job = claim_job(db)
+        except Exception as e:
+            logger.error(f"Import worker {worker_id} cannot claim jobs: {str(e)}")
+            job = None
+        finally:
+            db.close()
+        if job is None:
+            time.sleep(IMPORT_POLL_INTERVAL)
+            continue
+        logger.info(f"Import worker {worker_id} took job {job['id']} ({job['filename']}, {job['mode']})")
+        process_job(job)
+
+
+def main() -> None:
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=worker_loop, args=(worker_id,), name=f"import-worker-{worker_id}")
+        for worker_id in range(max(1, IMPORT_WORKERS))
+    ]
+    for process in processes:
+        process.start()
+    # Упавший процесс перезапускаем; его задание подберут после IMPORT_JOB_STALE_SECONDS
+    while True:
+        for index, process in enumerate(processes):
+            process.join(timeout=1)
+            if not process.is_alive():
+                logger.warning(f"{process.name} exited with {process.exitcode}, restarting")
+                processes[index] = context.Process(target=worker_loop, args=(index,), name=process.name)
+                processes[index].start()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,21 +6,41 @@ from aiogram.enums.parse_mode import ParseMode
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, ContentType
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import Update
+from aiogram.exceptions import TelegramBadRequest
 import traceback
+import time
+import asyncio
+import html
 from datetime import datetime
 import json
 import qrcode
 from PIL import Image
+import instrumentation
+from instrumentation import http_session
+from http_cache import api_cache
+import wire
 API_URL = os.getenv("API_URL")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Позволяет направить бота на локальную заглушку Bot API (бенчмарки)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
 NGINX_URL = os.getenv("NGINX_URL")
 IMAGES_URL = os.getenv("IMAGES_URL")
 BACKGROUNDS_URL = os.getenv("BACKGROUNDS_URL")
 GEN_URL ='http://genhtm:2424'
+AI_GENERATOR_URL = os.getenv("AI_GENERATOR_URL")
+# Не чаще одного edit_text за интервал при потоковой генерации
+AI_EDIT_INTERVAL = 1.5
+AI_STREAM_TIMEOUT = 180
+# Telegram ограничивает сообщение 4096 символами
+AI_PREVIEW_LIMIT = 3500
+# Сообщения альбома приходят по одному; ждём остальные перед общей регистрацией
+ALBUM_COLLECT_DELAY = 1.0
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -33,7 +53,7 @@ async def load_theme_mapping():
     """Загружает маппинг тем при запуске бота"""
     global THEME_MAPPING
     try:
-        async with aiohttp.ClientSession() as session:
+        async with http_session() as session:
             async with session.get(f"{NGINX_URL}/static/themes/theme_mapping.json") as resp:
                 if resp.status == 200:
                     THEME_MAPPING = await resp.json()
@@ -52,9 +72,14 @@ async def load_theme_mapping():
 #Bot autorization
 bot = Bot(
     token=BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 dp = Dispatcher(storage=MemoryStorage())
+# Метрики: время обработчиков, вызовов API/генератора и запросов к Telegram
+instrumentation.configure(API_URL, GEN_URL, AI_GENERATOR_URL, NGINX_URL)
+bot.session.middleware(instrumentation.TelegramTimingMiddleware())
+dp.update.outer_middleware(instrumentation.UpdateTimingMiddleware())
 # Состояния для создания организации
 class OrganizationStates(StatesGroup):
     waiting_for_name = State()
@@ -64,6 +89,7 @@ class OrganizationStates(StatesGroup):
     waiting_for_description_images = State()
     waiting_for_images = State()
     waiting_for_background = State()  # Новое состояние для фоновых изображений
+    waiting_for_ai_prompt = State()
 # Временное хранилище для альбомов
 SAVE_FOLDER = "/static/image_data"
 os.makedirs(SAVE_FOLDER, exist_ok=True)
@@ -195,7 +221,7 @@ async def register_user(user_id: int) -> bool:
     """Регистрирует пользователя в базе данных"""
     try:
         logger.info(f"Attempting to register user {user_id} with API at {API_URL}")
-        async with aiohttp.ClientSession() as session:
+        async with http_session() as session:
             url = f"{API_URL}/register_user?tid={user_id}"
             logger.info(f"Making POST request to {url}")
             
@@ -300,7 +326,7 @@ async def process_org_menu(message: Message, state: FSMContext):
             await bot.download_file(file.file_path, file_path)
             
             # Отправляем данные на API
-            async with aiohttp.ClientSession() as session:
+            async with http_session() as session:
                 # Регистрируем пользователя
                 async with session.post(f"{API_URL}/register_user?tid={message.from_user.id}") as resp:
                     if resp.status != 200:
@@ -318,35 +344,29 @@ async def process_org_menu(message: Message, state: FSMContext):
                         raise Exception(f"Failed to create organization: {await resp.text()}")
                     org = await resp.json()
                 
-                # Загружаем меню
+                # Загружаем меню: API ставит импорт в очередь и сразу отвечает
                 with open(file_path, 'rb') as f:
                     form = aiohttp.FormData()
                     form.add_field('file', f, filename=message.document.file_name)
                     async with session.post(f"{API_URL}/organizations/{org['id']}/menu", data=form) as resp:
-                        if resp.status != 200:
+                        if resp.status not in (200, 202):
                             raise Exception(f"Failed to upload menu: {await resp.text()}")
-            
-            # Создаем клавиатуру для дальнейших действий
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="📋 Показать меню", callback_data=f"show_menu_{org['id']}")],
-                    [InlineKeyboardButton(text="📋 Загрузить Изображения", callback_data=f"upload_images_{org['id']}")],
-                    [InlineKeyboardButton(text="🌐 Сгенерировать веб-страницу", callback_data=f"generate_web_{org['id']}")],
-                    [InlineKeyboardButton(text="◀️ Назад к списку", callback_data="my_organizations")]
-                ]
-            )
-            
+                        job = await resp.json()
+
             # Удаляем временный файл
             os.remove(file_path)
-            
-            await message.answer(
-                f"✅ Организация '{data['org_name']}' успешно создана!\n\n",
-                reply_markup=keyboard
+
+            status_message = await message.answer(
+                f"✅ Организация '{data['org_name']}' создана.\n⏳ Меню поставлено в очередь на загрузку..."
             )
-            
+            # Ход импорта показываем в том же сообщении, обработчик не ждёт окончания
+            task = asyncio.create_task(track_import_job(status_message, job['job_id'], org['id'], data['org_name']))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
             # Очищаем состояние
             await state.clear()
-            
+
         except Exception as e:
             logger.error(f"Error creating organization: {str(e)}")
             await message.answer(
@@ -366,6 +386,72 @@ async def process_org_menu(message: Message, state: FSMContext):
                 "❌ Произошла ошибка при обработке Google Sheets ID."
             )
 
+IMPORT_POLL_INTERVAL = 1.5
+IMPORT_TIMEOUT = 15 * 60
+RENDER_POLL_INTERVAL = 1.0
+RENDER_TIMEOUT = 5 * 60
+_background_tasks = set()
+
+def format_import_progress(org_name: str, job: dict) -> str:
+    """Текст сообщения о ходе импорта меню"""
+    if job['status'] == 'queued':
+        return f"✅ Организация '{org_name}' создана.\n⏳ Меню в очереди на загрузку..."
+    if job.get('total_rows'):
+        return f"⏳ Загружаю меню '{org_name}': {job['processed_rows']}/{job['total_rows']} строк"
+    return f"⏳ Читаю файл меню '{org_name}'..."
+
+async def track_import_job(status_message: Message, job_id: int, org_id: int, org_name: str):
+    """Опрашивает статус задания импорта и редактирует сообщение до его завершения"""
+    shown = status_message.text or ""
+    deadline = time.monotonic() + IMPORT_TIMEOUT
+    try:
+        async with http_session() as session:
+            while True:
+                async with session.get(f"{API_URL}/jobs/{job_id}") as resp:
+                    if resp.status != 200:
+                        raise Exception(f"Failed to get import job: {await resp.text()}")
+                    job = await resp.json()
+                if job['status'] in ('done', 'failed'):
+                    break
+                shown = await edit_progress(status_message, format_import_progress(org_name, job), shown)
+                if time.monotonic() > deadline:
+                    raise Exception(f"Import job {job_id} is still {job['status']}")
+                await asyncio.sleep(IMPORT_POLL_INTERVAL)
+
+        if job['status'] == 'failed':
+            await edit_progress(
+                status_message,
+                f"❌ Не удалось загрузить меню '{org_name}': {job.get('error')}",
+                shown,
+                reply_markup=await get_back_to_org_buttons(org_id)
+            )
+            return
+
+        result = job.get('result') or {}
+        keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [InlineKeyboardButton(text="📋 Показать меню", callback_data=f"show_menu_{org_id}")],
+                [InlineKeyboardButton(text="📋 Загрузить Изображения", callback_data=f"upload_images_{org_id}")],
+                [InlineKeyboardButton(text="🌐 Сгенерировать веб-страницу", callback_data=f"generate_web_{org_id}")],
+                [InlineKeyboardButton(text="◀️ Назад к списку", callback_data="my_organizations")]
+            ]
+        )
+        await edit_progress(
+            status_message,
+            f"✅ Организация '{org_name}' успешно создана!\n\n"
+            f"Загружено позиций меню: {result.get('inserted', job['processed_rows'])}",
+            shown,
+            reply_markup=keyboard
+        )
+    except Exception as e:
+        logger.error(f"Error tracking import job {job_id}: {str(e)}")
+        await edit_progress(
+            status_message,
+            f"⚠️ Меню '{org_name}' ещё загружается. Проверьте его позже в списке организаций.",
+            shown,
+            reply_markup=await get_back_to_org_buttons(org_id)
+        )
+
 # Загрузка изображений
 @dp.message(OrganizationStates.waiting_for_description_images)
 async def process_org_images(message: Message, state: FSMContext):
@@ -378,9 +464,107 @@ async def process_org_images(message: Message, state: FSMContext):
         "ВАЖНО. Отправляйте изображения как документ, чтобы телеграм не изменил название.\n"
         "Изображения с другими именами загружены не будут.\n"
         "JPG. Не более 200Кб \n"
+        "Можно отправить сразу альбом или ZIP-архив со всеми фотографиями.\n"
     )
     await state.set_state(OrganizationStates.waiting_for_images)
 
+async def save_telegram_image(message: Message, org_images_dir: str) -> str:
+    """Download the photo/document of a message into the org's image dir, return the file name"""
+    if message.photo:
+        file_id = message.photo[-1].file_id
+        original_filename = None
+    else:
+        file_id = message.document.file_id
+        original_filename = message.document.file_name
+    if not original_filename:
+        # Для фото (и документа без имени) используем caption или генерируем имя на основе времени
+        if message.caption:
+            original_filename = f"{message.caption}.jpg"
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            original_filename = f"photo_{timestamp}.jpg"
+
+    file = await bot.get_file(file_id)
+    # Скачиваем файл
+    downloaded_file = await bot.download_file(file.file_path)
+
+    # Сохраняем файл локально
+    local_filepath = os.path.join(org_images_dir, original_filename)
+    with open(local_filepath, 'wb') as f:
+        f.write(downloaded_file.read())
+    return original_filename
+
+def format_images_summary(result: dict) -> str:
+    """Reply text for the batch and archive image endpoints"""
+    lines = [f"✅ Зарегистрировано изображений: {len(result.get('registered', []))}"]
+    if result.get('already_registered'):
+        lines.append(f"♻️ Уже были загружены: {result['already_registered']}")
+    linked = len(result.get('matched', [])) + len(result.get('assigned', []))
+    lines.append(f"🔗 Привязано к позициям меню: {linked}")
+    if result.get('unmatched'):
+        names = ", ".join(result['unmatched'][:10])
+        more = f" и ещё {len(result['unmatched']) - 10}" if len(result['unmatched']) > 10 else ""
+        lines.append(f"⚠️ Нет позиций с такими названиями: {html.escape(names)}{more}")
+    if result.get('rejected'):
+        lines.append(f"❌ Отклонено файлов: {len(result['rejected'])}")
+        for item in result['rejected'][:5]:
+            lines.append(f"  • {html.escape(item['file'])}: {html.escape(item['reason'])}")
+    return "\n".join(lines)
+
+async def upload_images_archive(message: Message, org_id: int):
+    """Send a zip with menu photos to the API, which extracts and registers them in one go"""
+    status_message = await message.answer("📦 Распаковываю архив...")
+    file = await bot.get_file(message.document.file_id)
+    archive = await bot.download_file(file.file_path)
+    form = aiohttp.FormData()
+    form.add_field('file', archive.read(), filename=message.document.file_name, content_type='application/zip')
+    async with http_session() as session:
+        async with session.post(f"{API_URL}/organizations/{org_id}/images/archive", data=form) as resp:
+            if resp.status == 400:
+                detail = (await resp.json()).get('detail', '')
+                await status_message.edit_text(f"❌ Архив не принят: {html.escape(detail)}")
+                return
+            if resp.status != 200:
+                raise Exception(f"Failed to upload archive: {await resp.text()}")
+            result = await resp.json()
+    await status_message.edit_text(
+        format_images_summary(result),
+        reply_markup=await get_back_to_org_buttons(org_id)
+    )
+
+# media_group_id -> сообщения альбома, ожидающие общей обработки
+_album_buffer = {}
+
+async def process_album(media_group_id: str, org_id: int):
+    """Save all files of an album concurrently and register them with one API call"""
+    await asyncio.sleep(ALBUM_COLLECT_DELAY)
+    messages = _album_buffer.pop(media_group_id, [])
+    if not messages:
+        return
+    first = messages[0]
+    try:
+        org_images_dir = os.path.join(SAVE_FOLDER, f"{org_id}")
+        os.makedirs(org_images_dir, exist_ok=True)
+        filenames = await asyncio.gather(*(save_telegram_image(m, org_images_dir) for m in messages))
+        async with http_session() as session:
+            async with session.post(
+                f"{API_URL}/organizations/{org_id}/images/batch",
+                json={"images": [{"image_name": name, "stored_name": name} for name in filenames]}
+            ) as resp:
+                if resp.status != 200:
+                    raise Exception(f"Failed to register images: {await resp.text()}")
+                result = await resp.json()
+        await first.answer(
+            text=format_images_summary(result),
+            reply_markup=await get_back_to_org_buttons(org_id)
+        )
+    except Exception as e:
+        logger.error(f"Error processing album {media_group_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        await first.answer(
+            text="❌ Произошла ошибка при обработке альбома. Пожалуйста, попробуйте снова."
+        )
+
 @dp.message(OrganizationStates.waiting_for_images)
 async def process_upload_images(message: Message, state: FSMContext):
     """Обработка загрузки изображений"""
@@ -401,38 +585,29 @@ async def process_upload_images(message: Message, state: FSMContext):
             )
             return
 
+        # Архив с фотографиями: распаковка и регистрация на стороне API
+        if message.document and (message.document.file_name or "").lower().endswith('.zip'):
+            await upload_images_archive(message, org_id)
+            return
+
+        # Альбом: копим сообщения и регистрируем их одним запросом
+        if message.media_group_id:
+            if message.media_group_id not in _album_buffer:
+                _album_buffer[message.media_group_id] = []
+                task = asyncio.create_task(process_album(message.media_group_id, org_id))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+            _album_buffer[message.media_group_id].append(message)
+            return
+
         # Создаем директорию для изображений организации
         org_images_dir = os.path.join(SAVE_FOLDER, f"{org_id}")
         os.makedirs(org_images_dir, exist_ok=True)
-
-        # Подготавливаем файл для сохранения
-        if message.photo:
-            file_id = message.photo[-1].file_id
-            file = await bot.get_file(file_id)
-            file_path = file.file_path
-            
-            # Для фото используем caption или генерируем имя на основе времени
-            if message.caption:
-                original_filename = f"{message.caption}.jpg"
-            else:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                original_filename = f"photo_{timestamp}.jpg"
-        else:
-            file_id = message.document.file_id
-            file = await bot.get_file(file_id)
-            file_path = file.file_path
-            original_filename = message.document.file_name
-
-        # Скачиваем файл
-        downloaded_file = await bot.download_file(file_path)
-        
-        # Сохраняем файл локально
+        original_filename = await save_telegram_image(message, org_images_dir)
         local_filepath = os.path.join(org_images_dir, original_filename)
-        with open(local_filepath, 'wb') as f:
-            f.write(downloaded_file.read())
 
         # Отправляем только имя файла через API
-        async with aiohttp.ClientSession() as session:
+        async with http_session() as session:
             # Отправляем JSON с именем файла
             async with session.post(
                 f"{API_URL}/organizations/{org_id}/images",
@@ -479,34 +654,33 @@ async def back_to_main_callback(callback_query: types.CallbackQuery):
 async def show_organization_menu(message: Message, org_id: int):
     """Показывает меню организации"""
     try:
-        async with aiohttp.ClientSession() as session:
+        async with http_session() as session:
             # Получаем меню организации
-            async with session.get(f"{API_URL}/organizations/{org_id}/menu") as resp:
-                if resp.status != 200:
-                    raise Exception(f"Failed to get menu: {await resp.text()}")
-                menu_items = await resp.json()                
-                if not menu_items:
-                    await message.answer("📋 Меню пусто")
-                    return                
-            # Группируем блюда по категориям
-                categories = {}
-                for item in menu_items:
-                    if item['is_available']:
-                        category = item['category']
-                        if category not in categories:
-                            categories[category] = []
-                        categories[category].append(item)                
-            # Формируем сообщение
-                menu_text = "📋 Наше меню:\n\n"                
-                for category, items in categories.items():
-                    menu_text += f"🍽 {category}:\n"
-                    for item in items:
-                        price = float(item['price'])
-                        menu_text += f"• {item['name']} - {price:.2f} ₽\n"
-                        if item.get('description'):
-                            menu_text += f"  {item['description']}\n"
-                    menu_text += "\n"                
-                await message.answer(menu_text)
+            status, menu_items = await api_cache.get_json(session, f"{API_URL}/organizations/{org_id}/menu")
+        if status != 200:
+            raise Exception(f"Failed to get menu: {menu_items}")
+        if not menu_items:
+            await message.answer("📋 Меню пусто")
+            return
+        # Группируем блюда по категориям
+        categories = {}
+        for item in menu_items:
+            if item['is_available']:
+                category = item['category']
+                if category not in categories:
+                    categories[category] = []
+                categories[category].append(item)
+        # Формируем сообщение
+        menu_text = "📋 Наше меню:\n\n"
+        for category, items in categories.items():
+            menu_text += f"🍽 {category}:\n"
+            for item in items:
+                price = float(item['price'])
+                menu_text += f"• {item['name']} - {price:.2f} ₽\n"
+                if item.get('description'):
+                    menu_text += f"  {item['description']}\n"
+            menu_text += "\n"
+        await message.answer(menu_text)
     except Exception as e:
         logger.error(f"Error showing menu: {str(e)}")
         await message.answer("❌ Произошла ошибка при загрузке меню. Пожалуйста, попробуйте позже.")
@@ -522,12 +696,11 @@ async def show_menu_callback(callback_query: types.CallbackQuery):
 async def my_organizations_callback(callback_query: types.CallbackQuery):
     """Обработчик кнопки 'Мои организации'"""
     try:
-        async with aiohttp.ClientSession() as session:
+        async with http_session() as session:
         # Сначала получаем ID пользователя из базы данных
-            async with session.get(f"{API_URL}/users/telegram/{callback_query.from_user.id}") as resp:
-                if resp.status != 200:
-                    raise Exception(f"Failed to get user: {await resp.text()}")
-                user = await resp.json()
+            status, user = await api_cache.get_json(session, f"{API_URL}/users/telegram/{callback_query.from_user.id}")
+            if status != 200:
+                raise Exception(f"Failed to get user: {user}")
         # Теперь получаем список организаций пользователя по его ID в базе данных
             async with session.get(f"{API_URL}/organizations?owner_id={user['id']}") as resp:
                 if resp.status != 200:
@@ -564,12 +737,11 @@ async def organization_actions_callback(callback_query: types.CallbackQuery):
     """Обработчик действий с организацией"""
     org_id = int(callback_query.data.split("_")[2])    
     try:
-        async with aiohttp.ClientSession() as session:
+        async with http_session() as session:
         # Получаем информацию об организации
-            async with session.get(f"{API_URL}/organizations/{org_id}") as resp:
-                if resp.status != 200:
-                    raise Exception(f"Failed to get organization: {await resp.text()}")
-                org = await resp.json()
+            status, org = await api_cache.get_json(session, f"{API_URL}/organizations/{org_id}")
+            if status != 200:
+                raise Exception(f"Failed to get organization: {org}")
         # Создаем клавиатуру с действиями
             keyboard = InlineKeyboardMarkup(
                 inline_keyboard=[
@@ -733,23 +905,25 @@ async def theme_selected_callback(callback_query: types.CallbackQuery):
     data = callback_query.data.split('_')    
     theme_id = data[-1]  # Получаем ID темы
     org_id = int(data[-2])
-    # print(org_id)
+    # Отвечаем сразу: Telegram ждёт ответа на callback ограниченное время
+    await callback_query.answer()
     try:
-        async with aiohttp.ClientSession() as session:
+        async with http_session() as session:
             # Получаем информацию об организации
-            async with session.get(f"{API_URL}/organizations/{org_id}") as resp:
-                if resp.status != 200:
-                    raise Exception(f"Failed to get organization: {await resp.text()}")
-                org = await resp.json()
+            status, org = await api_cache.get_json(session, f"{API_URL}/organizations/{org_id}")
+            if status != 200:
+                raise Exception(f"Failed to get organization: {org}")
             # Получаем информацию о меню
-            async with session.get(f"{API_URL}/organizations/{org_id}/menu") as resp:
-                if resp.status != 200:
-                    raise Exception(f"Failed to get menu: {await resp.text()}")
-                menu_items = await resp.json()
+            status, menu_items = await api_cache.get_json(session, f"{API_URL}/organizations/{org_id}/menu")
+            if status != 200:
+                raise Exception(f"Failed to get menu: {menu_items}")
         
         # Формируем данные для отправки
         content = {}
         for item in menu_items:            
+            # Позиции из стоп-листа на страницу не попадают (как и при /refresh из API)
+            if not item['is_available']:
+                continue
             if item['category'] not in content:
                 content[item['category']] = []
             entity = {
@@ -778,31 +952,60 @@ async def theme_selected_callback(callback_query: types.CallbackQuery):
             }
             
         }
-        # Menu Generation
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{GEN_URL}/generate", json=data) as resp:
-                if resp.status == 200:
-                    result = await resp.json()
-                    menu_url = result.get('url')
-                    await callback_query.message.edit_text(
-                        f"✅ Ваше меню успешно сгенерировано!\n\n"
-                        f"🔗 Ссылка на меню: {menu_url}\n\n"
-                        f"Вы можете поделиться этой ссылкой с вашими клиентами.",
-                        reply_markup=await get_back_to_org_buttons(org_id)
-                    )
-                else:
-                    error_text = await resp.text()
-                    await callback_query.message.edit_text(
-                        f"❌ Ошибка при генерации меню: {error_text}",
-                        reply_markup=await get_back_to_org_buttons(org_id)
-                    )
+        # Menu Generation: генератор принимает задание и рендерит в фоне
+        async with http_session() as session:
+            request = wire.pack(data)
+            # Лимит генератора считается и по организации
+            request["headers"]["X-Organization-Id"] = str(org_id)
+            async with session.post(f"{GEN_URL}/jobs", **request) as resp:
+                busy = instrumentation.busy_message(resp)
+                if busy:
+                    await callback_query.message.edit_text(busy, reply_markup=await get_back_to_org_buttons(org_id))
+                    return
+                if resp.status != 202:
+                    raise Exception(await resp.text())
+                job = await resp.json()
+
+        status_message = await callback_query.message.edit_text("⏳ Генерирую страницу меню...")
+        # Ссылку пришлём правкой этого же сообщения, обработчик не ждёт рендера
+        task = asyncio.create_task(track_render_job(status_message, job['job_id'], org_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
     except Exception as e:
         logger.error(f"Error generating menu: {str(e)}")
         await callback_query.message.edit_text(
             f"❌ Произошла ошибка при генерации меню: {str(e)}",
             reply_markup=await get_back_to_org_buttons(org_id)
         )
-    await callback_query.answer()
+
+async def track_render_job(status_message: Message, job_id: str, org_id: int):
+    """Ждёт завершения задания генератора и редактирует сообщение ссылкой на меню"""
+    deadline = time.monotonic() + RENDER_TIMEOUT
+    try:
+        async with http_session() as session:
+            while True:
+                async with session.get(f"{GEN_URL}/jobs/{job_id}") as resp:
+                    if resp.status != 200:
+                        raise Exception(f"Failed to get render job: {await resp.text()}")
+                    job = await resp.json()
+                if job['status'] in ('done', 'failed'):
+                    break
+                if time.monotonic() > deadline:
+                    raise Exception(f"Render job {job_id} is still {job['status']}")
+                await asyncio.sleep(RENDER_POLL_INTERVAL)
+        if job['status'] == 'done':
+            text = (
+                f"✅ Ваше меню успешно сгенерировано!\n\n"
+                f"🔗 Ссылка на меню: {job['url']}\n\n"
+                f"Вы можете поделиться этой ссылкой с вашими клиентами."
+            )
+        else:
+            text = f"❌ Ошибка при генерации меню: {job.get('error')}"
+    except Exception as e:
+        logger.error(f"Error tracking render job {job_id}: {str(e)}")
+        text = f"❌ Произошла ошибка при генерации меню: {str(e)}"
+    await edit_progress(status_message, text, status_message.text or "", reply_markup=await get_back_to_org_buttons(org_id))
+
 # #Help menu 
 @dp.message(lambda c: c.data.startswith("help_"))
 async def cmd_help(message: Message):
@@ -827,7 +1030,7 @@ async def qr_code(callback_query: types.CallbackQuery):
         inline_keyboard=[
             [InlineKeyboardButton(text="◀️ Назад", callback_data=f"org_actions_{org_id}")]])
     try:
-        async with aiohttp.ClientSession() as session:
+        async with http_session() as session:
             # Получаем информацию о файле qr
             async with session.get(f"{NGINX_URL}/images/{org_id}/qrcode.png") as resp:
                 if resp.status != 200:
@@ -845,25 +1048,123 @@ async def qr_code(callback_query: types.CallbackQuery):
 @dp.callback_query(lambda c: c.data.startswith("ai_generate_theme_"))
 async def ai_generator_main(callback_query: types.CallbackQuery, state: FSMContext):
     """Процесс Генерации стиля"""
+    org_id = int(callback_query.data.split("_")[-1])
     #Сначала смотрим жив ли сервис ai
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [InlineKeyboardButton(text="◀️ Назад", callback_data=f"back_to_main")]])
     try:
-        async with aiohttp.ClientSession() as session:
+        async with http_session() as session:
             async with session.get(f"{AI_GENERATOR_URL}/health") as resp:
                 if resp.status != 200:
                     raise Exception(f"Failed to connect: {await resp.text()}")
                 health = await resp.json()
-                if health['status'] != 'healthy':
-                    await callback_query.message.answer(
-                    text="❌ Ошибка: Сервис Генерации недоступен, повторите попытку позже.",
-                    reply_markup=keyboard
-                )
-                return
+        if health['status'] != 'healthy':
+            raise Exception(f"Service unhealthy: {health}")
     except Exception as e:
-        logger.error(f"Error conection to service AI_geneator: {str(e)}")    
+        logger.error(f"Error conection to service AI_geneator: {str(e)}")
+        await callback_query.message.answer(
+            text="❌ Ошибка: Сервис Генерации недоступен, повторите попытку позже.",
+            reply_markup=keyboard
+        )
+        await callback_query.answer()
+        return
 
+    await state.update_data(org_id=org_id)
+    await state.set_state(OrganizationStates.waiting_for_ai_prompt)
+    await callback_query.message.edit_text(
+        "Опишите желаемый стиль меню.\n"
+        "Например: тёмное дерево, неоновые акценты.",
+        reply_markup=await get_back_to_org_buttons(org_id)
+    )
+    await callback_query.answer()
+
+def format_ai_preview(text: str) -> str:
+    """Форматирует частичный результат генерации для сообщения"""
+    if len(text) > AI_PREVIEW_LIMIT:
+        text = "…" + text[-AI_PREVIEW_LIMIT:]
+    return f"<pre>{html.escape(text)}</pre>"
+
+async def edit_progress(message: Message, text: str, shown: str, reply_markup=None) -> str:
+    """Редактирует сообщение, если текст изменился; возвращает показанный текст"""
+    if text == shown:
+        return shown
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        logger.warning(f"Could not edit progress message: {str(e)}")
+        return shown
+    return text
+
+async def stream_ai_generation(prompt: str, status_message: Message) -> tuple[str, dict]:
+    """Получает стиль из AI сервиса потоком и обновляет одно сообщение"""
+    parts = []
+    theme = {}
+    shown = status_message.text or ""
+    last_edit = time.monotonic()
+    timeout = aiohttp.ClientTimeout(total=AI_STREAM_TIMEOUT)
+    async with http_session(timeout=timeout) as session:
+        async with session.post(f"{AI_GENERATOR_URL}/generate/stream", json={"prompt": prompt}) as resp:
+            busy = instrumentation.busy_message(resp)
+            if busy:
+                raise instrumentation.ServiceBusy(busy)
+            if resp.status != 200:
+                raise Exception(f"Failed to generate: {await resp.text()}")
+            async for raw_line in resp.content:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+                if "error" in event:
+                    raise Exception(event["error"])
+                if "delta" in event:
+                    parts.append(event["delta"])
+                if event.get("done"):
+                    theme = event.get("theme") or {}
+                # Троттлинг: Telegram ограничивает частоту редактирования
+                now = time.monotonic()
+                if parts and now - last_edit >= AI_EDIT_INTERVAL:
+                    shown = await edit_progress(status_message, format_ai_preview("".join(parts)), shown)
+                    last_edit = now
+    return "".join(parts), theme
+
+@dp.message(OrganizationStates.waiting_for_ai_prompt)
+async def process_ai_prompt(message: Message, state: FSMContext):
+    """Обработка описания стиля и потоковая генерация"""
+    data = await state.get_data()
+    org_id = data.get('org_id')
+    if not message.text:
+        await message.answer("❌ Пожалуйста, опишите стиль текстом.")
+        return
+    status_message = await message.answer("⏳ Генерирую стиль...")
+    try:
+        result, theme = await stream_ai_generation(message.text, status_message)
+        keyboard_buttons = []
+        if theme.get('id'):
+            # Опубликованная тема сразу доступна в списке тем - под тем же названием,
+            # что AI сервис записал в theme_mapping.json
+            THEME_MAPPING[theme['file']] = theme['title']
+            keyboard_buttons.append([InlineKeyboardButton(
+                text="🎨 Применить тему",
+                callback_data=f"theme_{org_id}_{theme['id']}"
+            )])
+        keyboard_buttons.append([InlineKeyboardButton(text="◀️ Назад к организации", callback_data=f"org_actions_{org_id}")])
+        await edit_progress(
+            status_message,
+            "✅ Стиль сгенерирован:\n\n" + format_ai_preview(theme.get('css') or result),
+            status_message.text or "",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+        )
+        await state.clear()
+    except instrumentation.ServiceBusy as e:
+        await status_message.edit_text(str(e), reply_markup=await get_back_to_org_buttons(org_id))
+    except Exception as e:
+        logger.error(f"Error in AI generation: {str(e)}")
+        logger.error(traceback.format_exc())
+        await status_message.edit_text(
+            "❌ Произошла ошибка при генерации стиля. Пожалуйста, попробуйте снова.",
+            reply_markup=await get_back_to_org_buttons(org_id)
+        )
 
 #____________________________________________________________________________________________________________
 @dp.callback_query(lambda c: c.data.startswith("upload_images_"))
@@ -878,6 +1179,7 @@ async def upload_images_callback(callback_query: types.CallbackQuery, state: FSM
         "• Имя файла должно соответствовать названию позиции в меню\n"
         "• Формат: JPG\n"
         "• Размер: не более 200Кб\n\n"
+        "Можно отправить сразу альбом или ZIP-архив со всеми фотографиями.\n"
         "Отправьте изображение или нажмите кнопку 'Назад' для возврата к организации.",
         reply_markup=await get_back_to_org_buttons(org_id)
     )    
@@ -886,7 +1188,7 @@ async def upload_images_callback(callback_query: types.CallbackQuery, state: FSM
     await callback_query.answer()
 
 if __name__ == "__main__":
-    import asyncio
+    instrumentation.start_metrics_server()
     # Загружаем темы перед запуском бота
     asyncio.run(load_theme_mapping())
     # Запускаем бота
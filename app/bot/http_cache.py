@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from typing import Any, Tuple
+import os
+
+import aiohttp
+
+import wire
+
+# Сколько ответов API держим для условных запросов (If-None-Match)
+CACHE_SIZE = int(os.getenv("BOT_HTTP_CACHE_SIZE", "512"))
+
+
+class ConditionalCache:
+    """LRU of JSON responses by URL, revalidated with ETag / Last-Modified.
+
+    A 304 from the API is answered with the stored body, so unchanged menus
+    and organizations are not re-sent or re-parsed. Returned objects are
+    shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self._entries: "OrderedDict[str, Tuple[str, str, Any]]" = OrderedDict()
+
+    async def get_json(self, session: aiohttp.ClientSession, url: str) -> Tuple[int, Any]:
+        """GET url; returns (status, decoded body) on 200/304, (status, response text) otherwise.
+
+        Bodies are requested as zstd MessagePack where the API supports it.
+        """
+        headers = dict(wire.ACCEPT_HEADERS)
+        entry = self._entries.get(url)
+        if entry:
+            etag, last_modified, _ = entry
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        async with session.get(url, headers=headers) as resp:
+            if resp.status == 304 and entry:
+                self._entries.move_to_end(url)
+                return 200, entry[2]
+            if resp.status != 200:
+                self._entries.pop(url, None)
+                return resp.status, await resp.text()
+            data = wire.unpack(await resp.read(), resp.content_type)
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+        if etag or last_modified:
+            self._entries[url] = (etag, last_modified, data)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return 200, data
+
+
+api_cache = ConditionalCache()
@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import logging
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+from opentelemetry import trace
+from prometheus_client import Histogram, start_http_server
+
+from common.tracing import setup_tracing
+
+logger = logging.getLogger(__name__)
+
+SLOW_UPDATE_SECONDS = float(os.getenv("BOT_SLOW_UPDATE_SECONDS", "2.0"))
+METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "9101"))
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds",
+    "Time to process one update, keyed by callback prefix or command",
+    ["handler"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+DOWNSTREAM_LATENCY = Histogram(
+    "bot_downstream_duration_seconds",
+    "HTTP calls from the bot to internal services",
+    ["target", "method", "path", "status"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+TELEGRAM_LATENCY = Histogram(
+    "bot_telegram_request_duration_seconds",
+    "Bot API calls (sendMessage, editMessageText, ...)",
+    ["method"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+
+# Накопитель времени по текущему апдейту: {"api": 0.12, "telegram": 0.3, ...}
+_update_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("update_timings", default=None)
+
+# Telegram ID автора текущего апдейта: уходит в X-Telegram-User-Id для лимитов на стороне сервисов
+_current_user: ContextVar[Optional[int]] = ContextVar("current_user", default=None)
+USER_HEADER = "X-Telegram-User-Id"
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+tracer = trace.get_tracer("bot")
+
+
+def _add_timing(target: str, seconds: float) -> None:
+    timings = _update_timings.get()
+    if timings is not None:
+        timings[target] = timings.get(target, 0.0) + seconds
+
+
+def handler_key(update: Update, state: Optional[str] = None) -> str:
+    """Metric key: callback prefix (theme_, org_actions_), command or FSM state"""
+    if update.callback_query and update.callback_query.data:
+        parts = []
+        for part in update.callback_query.data.split("_"):
+            if part.isdigit():
+                return "_".join(parts) + "_"
+            parts.append(part)
+        return update.callback_query.data
+    message = update.message
+    if message:
+        if message.text and message.text.startswith("/"):
+            return message.text.split()[0].split("@")[0]
+        if state:
+            return state
+        return f"message:{message.content_type}"
+    return update.event_type
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    """Outer update middleware: per-handler latency and slow-update log"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        timings: Dict[str, float] = {}
+        token = _update_timings.set(timings)
+        user = data.get("event_from_user")
+        user_token = _current_user.set(user.id if user else None)
+        key = handler_key(event, data.get("raw_state")) if isinstance(event, Update) else type(event).__name__
+        started = time.perf_counter()
+        try:
+            # Корневой span: вызовы API, генератора и Telegram попадут в один trace
+            with tracer.start_as_current_span(f"update {key}", kind=trace.SpanKind.SERVER):
+                return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            _update_timings.reset(token)
+            _current_user.reset(user_token)
+            HANDLER_LATENCY.labels(key).observe(elapsed)
+            if elapsed >= SLOW_UPDATE_SECONDS:
+                downstream = sum(timings.values())
+                details = " ".join(f"{target}={seconds:.3f}s" for target, seconds in sorted(timings.items()))
+                logger.warning(
+                    f"Slow update {key}: total={elapsed:.3f}s {details} own={max(0.0, elapsed - downstream):.3f}s"
+                )
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    """Bot session middleware timing every Bot API call"""
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        try:
+            with tracer.start_as_current_span(f"telegram {type(method).__name__}", kind=trace.SpanKind.CLIENT):
+                return await make_request(bot, method)
+        finally:
+            elapsed = time.perf_counter() - started
+            TELEGRAM_LATENCY.labels(type(method).__name__).observe(elapsed)
+            _add_timing("telegram", elapsed)
+
+
+def _make_trace_config(targets: Dict[str, str]) -> aiohttp.TraceConfig:
+    """aiohttp hook timing calls to the API, generator and AI service"""
+
+    def target_for(url) -> str:
+        netloc = url.host if url.port is None else f"{url.host}:{url.port}"
+        return targets.get(netloc, "other")
+
+    async def on_request_start(session, ctx: SimpleNamespace, params) -> None:
+        ctx.started = time.perf_counter()
+        user = _current_user.get()
+        if user is not None and target_for(params.url) != "other":
+            params.headers.setdefault(USER_HEADER, str(user))
+
+    async def on_request_end(session, ctx: SimpleNamespace, params) -> None:
+        _observe(ctx, params.method, params.url, str(params.response.status))
+
+    async def on_request_exception(session, ctx: SimpleNamespace, params) -> None:
+        _observe(ctx, params.method, params.url, "error")
+
+    def _observe(ctx: SimpleNamespace, method: str, url, status: str) -> None:
+        elapsed = time.perf_counter() - ctx.started
+        target = target_for(url)
+        DOWNSTREAM_LATENCY.labels(target, method, _ID_SEGMENT.sub("/{id}", url.path), status).observe(elapsed)
+        _add_timing(target, elapsed)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+class ServiceBusy(Exception):
+    """A service answered 429; the message is meant for the user"""
+
+
+def busy_message(resp: aiohttp.ClientResponse) -> Optional[str]:
+    """User-facing text for a 429 from a service, None for any other status"""
+    if resp.status != 429:
+        return None
+    retry_after = resp.headers.get("Retry-After", "")
+    wait = f" через {retry_after} с" if retry_after.isdigit() else " чуть позже"
+    return f"⏳ Сервис сейчас перегружен, попробуйте ещё раз{wait}."
+
+
+def _netloc(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    parts = urlsplit(url)
+    return parts.netloc or None
+
+
+_targets: Dict[str, str] = {}
+_trace_configs: List[aiohttp.TraceConfig] = []
+
+
+def configure(api_url: Optional[str], gen_url: Optional[str], ai_url: Optional[str], nginx_url: Optional[str]) -> None:
+    """Register which hosts count as api/generator/ai/nginx and enable tracing if configured"""
+    for name, url in (("api", api_url), ("generator", gen_url), ("ai", ai_url), ("nginx", nginx_url)):
+        netloc = _netloc(url)
+        if netloc:
+            _targets[netloc] = name
+    _trace_configs.append(_make_trace_config(_targets))
+    if setup_tracing("menu-bot"):
+        # Client span и заголовок traceparent на каждый запрос к сервисам
+        from opentelemetry.instrumentation.aiohttp_client import create_trace_config
+        _trace_configs.append(create_trace_config())
+
+
+def http_session(**kwargs) -> aiohttp.ClientSession:
+    """aiohttp.ClientSession with the timing and tracing hooks attached"""
+    if _trace_configs:
+        kwargs.setdefault("trace_configs", list(_trace_configs))
+    return aiohttp.ClientSession(**kwargs)
+
+
+def start_metrics_server() -> None:
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        logger.info(f"Bot metrics exposed on :{METRICS_PORT}/metrics")
@@ -0,0 +1,39 @@
+from typing import Any, Dict
+
+import msgspec
+import zstandard
+
+# Формат внутреннего трафика, как в common/wire.py API и генератора (бот собирается отдельно)
+MSGPACK = "application/msgpack"
+ZSTD = "zstd"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+COMPRESS_MIN_BYTES = 1024
+# Заголовки запроса: ответ MessagePack (JSON как запасной), сжатие zstd
+ACCEPT_HEADERS = {
+    "Accept": f"{MSGPACK}, application/json;q=0.9",
+    "Accept-Encoding": f"{ZSTD}, gzip, deflate",
+}
+
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder()
+_compressor = zstandard.ZstdCompressor(level=3)
+_decompressor = zstandard.ZstdDecompressor()
+
+
+def pack(content: Any) -> Dict[str, Any]:
+    """aiohttp request kwargs (data + headers) sending content as zstd MessagePack"""
+    body = _encoder.encode(content)
+    headers = {"Content-Type": MSGPACK}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        body = _compressor.compress(body)
+        headers["Content-Encoding"] = ZSTD
+    return {"data": body, "headers": headers}
+
+
+def unpack(body: bytes, content_type: str) -> Any:
+    """Decode a MessagePack or JSON response body (zstd is detected by its magic)"""
+    if body.startswith(ZSTD_MAGIC):
+        body = _decompressor.decompress(body)
+    if content_type == MSGPACK:
+        return _decoder.decode(body)
+    return msgspec.json.decode(body)
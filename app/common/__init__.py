@@ -0,0 +1,3 @@
+"""
+Shared instrumentation for the API, generator, AI service and bot
+"""
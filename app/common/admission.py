@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+from common.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# ADMISSION_ENABLED=0 выключает проверки целиком (например, для нагрузочных тестов)
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+# Общее хранилище токенов для нескольких реплик; без него - счётчики в памяти процесса
+ADMISSION_REDIS_URL = os.getenv("ADMISSION_REDIS_URL")
+ADMISSION_MAX_KEYS = int(os.getenv("ADMISSION_MAX_KEYS", "100000"))
+
+# Бот передаёт Telegram ID пользователя; nginx затирает заголовки у внешних запросов
+USER_HEADER = b"x-telegram-user-id"
+ORG_HEADER = b"x-organization-id"
+REAL_IP_HEADER = b"x-real-ip"
+
+
+@dataclass(frozen=True)
+class Rate:
+    """Token bucket: `per_minute` sustained requests with bursts up to `burst`"""
+    per_minute: float
+    burst: int
+
+    @property
+    def per_second(self) -> float:
+        return self.per_minute / 60.0
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    """Limits shared by a group of expensive routes"""
+    name: str
+    concurrency: int
+    queue: int = 0
+    deadline: float = 5.0
+    per_user: Optional[Rate] = None
+    per_org: Optional[Rate] = None
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "RouteClass":
+        """Defaults overridable as ADMISSION_<NAME>_CONCURRENCY / _QUEUE / _DEADLINE / _USER_RPM / _ORG_RPM"""
+        prefix = f"ADMISSION_{name.upper()}_"
+        for field, cast in (("concurrency", int), ("queue", int), ("deadline", float)):
+            value = os.getenv(prefix + field.upper())
+            if value is not None:
+                defaults[field] = cast(value)
+        for field, env in (("per_user", "USER_RPM"), ("per_org", "ORG_RPM")):
+            value = os.getenv(prefix + env)
+            if value is not None:
+                current = defaults.get(field)
+                # 0 снимает ограничение
+                defaults[field] = Rate(float(value), current.burst if current else 1) if float(value) > 0 else None
+        return cls(name=name, **defaults)
+
+
+class MemoryBuckets:
+    """Per-process token buckets, LRU-bounded by key count"""
+
+    def __init__(self, max_keys: int = ADMISSION_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: Rate) -> float:
+        """Spend one token; returns 0 if allowed, otherwise seconds until a token is available"""
+        now = time.monotonic()
+        tokens, stamp = self._buckets.get(key, (float(rate.burst), now))
+        tokens = min(float(rate.burst), tokens + (now - stamp) * rate.per_second)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate.per_second
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# Тот же алгоритм, что в MemoryBuckets, атомарно на стороне Redis
+_REDIS_TAKE = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or burst
+local stamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - stamp) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'stamp', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared by all replicas. Fails open if Redis is unavailable."""
+
+    def __init__(self, url: str):
+        # redis нужен только при заданном ADMISSION_REDIS_URL
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_TAKE)
+
+    async def take(self, key: str, rate: Rate) -> float:
+        try:
+            wait = await self._script(keys=[f"admission:{key}"], args=[rate.per_second, rate.burst])
+        except Exception as e:
+            logger.warning(f"Admission store unavailable, allowing request: {str(e)}")
+            return 0.0
+        return float(wait)
+
+
+class ConcurrencyLimiter:
+    """At most `limit` requests in progress, a bounded queue, and a deadline for waiting in it"""
+
+    def __init__(self, limit: int, queue: int, deadline: float):
+        self.limit = max(1, limit)
+        self.queue = queue
+        self.deadline = deadline
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self._waiting = 0
+        # Скользящее среднее времени обработки - для оценки Retry-After
+        self._service_time = 1.0
+
+    def retry_after(self) -> float:
+        return self._service_time * (self._waiting + 1) / self.limit
+
+    async def acquire(self) -> Optional[str]:
+        """None once a slot is taken, otherwise the rejection reason"""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return None
+        if self._waiting >= self.queue:
+            return "queue_full"
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.deadline)
+        except asyncio.TimeoutError:
+            return "deadline"
+        finally:
+            self._waiting -= 1
+        return None
+
+    def release(self, held: float) -> None:
+        self._service_time = 0.8 * self._service_time + 0.2 * held
+        self._semaphore.release()
+
+
+def _too_many(message: str, retry_after: float) -> JSONResponse:
+    seconds = max(1, math.ceil(retry_after))
+    return JSONResponse(status_code=429, content={"detail": message}, headers={"Retry-After": str(seconds)})
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1").strip() or None
+    return None
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying per-tenant token buckets and per-class concurrency caps.
+
+    Rejections are answered right away with 429 and Retry-After, before the
+    body is read, so an overloaded service does not queue work it will drop.
+    """
+
+    def __init__(self, app, classes: Iterable[RouteClass], routes: Dict[Tuple[str, str], str], buckets=None):
+        self.app = app
+        self.classes = {route_class.name: route_class for route_class in classes}
+        self.routes = routes
+        self.limiters = {
+            name: ConcurrencyLimiter(route_class.concurrency, route_class.queue, route_class.deadline)
+            for name, route_class in self.classes.items()
+        }
+        if buckets is None:
+            buckets = RedisBuckets(ADMISSION_REDIS_URL) if ADMISSION_REDIS_URL else MemoryBuckets()
+        self.buckets = buckets
+
+    def _classify(self, scope) -> Tuple[Optional[RouteClass], Dict[str, str]]:
+        for route in getattr(scope.get("app"), "routes", []):
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                name = self.routes.get((scope["method"], getattr(route, "path", "")))
+                return (self.classes[name] if name else None), child_scope.get("path_params", {})
+        return None, {}
+
+    async def _check_rates(self, route_class: RouteClass, scope, path_params) -> Optional[JSONResponse]:
+        if route_class.per_user:
+            user = _header(scope, USER_HEADER)
+            if user is None:
+                # Запрос не от бота - ограничиваем по адресу клиента
+                client = scope.get("client")
+                user = "ip:" + (_header(scope, REAL_IP_HEADER) or (client[0] if client else "unknown"))
+            wait = await self.buckets.take(f"{route_class.name}:user:{user}", route_class.per_user)
+            if wait:
+                ADMISSION_REJECTED.labels(route_class.name, "user_rate").inc()
+                return _too_many("Too many requests, please try again later", wait)
+        if route_class.per_org:
+            org = path_params.get("org_id") or _header(scope, ORG_HEADER)
+            if org is not None:
+                wait = await self.buckets.take(f"{route_class.name}:org:{org}", route_class.per_org)
+                if wait:
+                    ADMISSION_REJECTED.labels(route_class.name, "org_rate").inc()
+                    return _too_many("Too many requests for this organization, please try again later", wait)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_class, path_params = self._classify(scope)
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        rejection = await self._check_rates(route_class, scope, path_params)
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+
+        limiter = self.limiters[route_class.name]
+        queued = time.perf_counter()
+        reason = await limiter.acquire()
+        started = time.perf_counter()
+        ADMISSION_QUEUE_WAIT.labels(route_class.name).observe(started - queued)
+        if reason is not None:
+            ADMISSION_REJECTED.labels(route_class.name, reason).inc()
+            await _too_many("Service is busy, please try again later", limiter.retry_after())(scope, receive, send)
+            return
+
+        active = ADMISSION_ACTIVE.labels(route_class.name)
+        active.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            active.dec()
+            limiter.release(time.perf_counter() - started)
+
+
+def install_admission(app, classes: Iterable[RouteClass], routes: Dict[Tuple[str, str], str]) -> None:
+    """Limit the given (method, route template) pairs; must be installed before install_metrics"""
+    if not ADMISSION_ENABLED:
+        return
+    app.add_middleware(AdmissionMiddleware, classes=list(classes), routes=routes)
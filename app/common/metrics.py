@@ -0,0 +1,202 @@
+import time
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from starlette.responses import Response
+from starlette.routing import Match
+
+# HTTP ________________________________________________________________________________
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled",
+    ["method", "route"],
+)
+
+# Admission ___________________________________________________________________________
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests answered with 429 by admission control",
+    ["route_class", "reason"],
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds",
+    "Time a request waited for a concurrency slot",
+    ["route_class"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ADMISSION_ACTIVE = Gauge(
+    "admission_active_requests",
+    "Requests holding a concurrency slot",
+    ["route_class"],
+)
+
+# DB pool _____________________________________________________________________________
+DB_POOL_CHECKOUT = Histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_CHECKOUT_ERRORS = Counter(
+    "db_pool_checkout_errors_total",
+    "Pool checkouts that failed or timed out",
+)
+DB_REPLICA_HEALTHY = Gauge(
+    "db_replica_healthy",
+    "1 if the read replica is reachable and within the lag limit",
+    ["replica"],
+)
+DB_REPLICA_LAG_BYTES = Gauge(
+    "db_replica_lag_bytes",
+    "WAL bytes the read replica is behind the primary",
+    ["replica"],
+)
+DB_READ_ROUTED = Counter(
+    "db_read_routed_total",
+    "Read-only sessions by target database and reason",
+    ["target", "reason"],
+)
+
+# Generator ___________________________________________________________________________
+RENDER_DURATION = Histogram(
+    "render_duration_seconds",
+    "Menu page template render time",
+)
+RENDER_OUTPUT_BYTES = Histogram(
+    "render_output_bytes",
+    "Size of rendered menu pages",
+    buckets=(1e3, 5e3, 2e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 5e6),
+)
+RENDER_JOB_WAIT = Histogram(
+    "render_job_wait_seconds",
+    "Time a render job waited for a worker thread",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+RENDER_JOBS_PENDING = Gauge(
+    "render_jobs_pending",
+    "Render jobs queued or running",
+)
+PAGE_FIRST_PAINT_BYTES = Histogram(
+    "page_first_paint_bytes",
+    "Compressed bytes needed before a menu page can paint",
+    buckets=(2e3, 5e3, 1e4, 1.4e4, 2e4, 5e4, 1e5, 2.5e5),
+)
+PAGE_BUDGET_EXCEEDED = Counter(
+    "page_budget_exceeded_total",
+    "Generated pages over a size budget",
+    ["budget"],
+)
+
+# Upstream AI _________________________________________________________________________
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of calls to upstream services",
+    ["upstream", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120),
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total",
+    "Retries of upstream calls",
+    ["upstream"],
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(app, scope) -> str:
+    """Resolve the route template (/organizations/{org_id}) to keep label cardinality low"""
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests"""
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope.get("app"), scope)
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(method, route, str(status_holder["status"])).observe(
+                time.perf_counter() - started
+            )
+
+
+async def metrics_endpoint(request=None) -> Response:
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+def install_metrics(app) -> None:
+    """Add the middleware and the /metrics endpoint to a FastAPI app"""
+    app.add_middleware(PrometheusMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+
+class PoolCollector:
+    """Scrape-time gauges for SQLAlchemy QueuePool saturation"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def collect(self):
+        pool = self.engine.pool
+        stats = {
+            "db_pool_size": ("Configured pool size", pool.size()),
+            "db_pool_checked_out": ("Connections currently checked out", pool.checkedout()),
+            "db_pool_checked_in": ("Idle connections in the pool", pool.checkedin()),
+            # overflow() < 0 пока пул не заполнен до pool_size
+            "db_pool_overflow": ("Connections opened above pool_size", max(0, pool.overflow())),
+        }
+        for name, (documentation, value) in stats.items():
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+
+def instrument_engine(engine, registry=REGISTRY) -> None:
+    """Time pool checkouts and expose pool saturation for an Engine"""
+    pool = engine.pool
+    original_connect = pool.connect
+
+    def timed_connect(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original_connect(*args, **kwargs)
+        except Exception:
+            DB_POOL_CHECKOUT_ERRORS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    registry.register(PoolCollector(engine))
+
+
+def observe_upstream(upstream: str, started: float, outcome: str) -> None:
+    UPSTREAM_LATENCY.labels(upstream, outcome).observe(time.perf_counter() - started)
@@ -0,0 +1,248 @@
+import asyncio
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import Header, HTTPException
+
+from common.metrics import route_template
+
+# Профилирование выключено, пока не задан токен
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_KEEP_FILES = int(os.getenv("PROFILE_KEEP_FILES", "200"))
+PROFILE_HEADER = b"x-profile"
+
+# Стек, заканчивающийся здесь, - простаивающий поток, в профиль не пишем
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+# Метка профилируемого запроса: по ней семплер узнаёт его задачу и поток из пула
+_profiled: contextvars.ContextVar[Optional[object]] = contextvars.ContextVar("profiled_request", default=None)
+
+
+def _holds_mark(context, mark: object) -> bool:
+    return isinstance(context, contextvars.Context) and context.get(_profiled) is mark
+
+
+def _frame_context(frame):
+    # anyio (run_in_threadpool): context.run(func, *args) в WorkerThread.run
+    context = frame.f_locals.get("context")
+    if context is None:
+        # asyncio.to_thread: _WorkItem.fn = partial(context.run, func)
+        fn = getattr(frame.f_locals.get("self"), "fn", None)
+        context = getattr(getattr(fn, "func", None), "__self__", None)
+    return context
+
+
+def _worker_runs(frame, mark: object) -> bool:
+    """A pool thread runs the request if some frame holds the request's context"""
+    while frame is not None:
+        if _holds_mark(_frame_context(frame), mark):
+            return True
+        frame = frame.f_back
+    return False
+
+
+class StackSampler:
+    """Sample the stacks of one request into folded-stack counts.
+
+    On the event loop thread a sample is taken only while the request's task
+    is running; pool threads are sampled while they run the request's sync
+    handler, where a per-thread tracer such as cProfile would see nothing.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.mark = object()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> contextvars.Token:
+        """Mark the calling task as the profiled request and start sampling"""
+        token = _profiled.set(self.mark)
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._thread.start()
+        return token
+
+    def stop(self, token: contextvars.Token) -> None:
+        self._stop.set()
+        self._thread.join()
+        _profiled.reset(token)
+
+    def _on_request(self, thread_id: int, frame) -> bool:
+        if thread_id == self._loop_thread:
+            task = asyncio.tasks._current_tasks.get(self._loop)
+            if task is None:
+                return False
+            get_context = getattr(task, "get_context", None)
+            # До Python 3.12 контекст задачи не виден - берём любой работающий код цикла
+            return get_context is None or _holds_mark(get_context(), self.mark)
+        return _worker_runs(frame, self.mark)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if leaf in _IDLE_LEAVES or not self._on_request(thread_id, frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfileRegistry:
+    """Routes armed for profiling and the captured output files"""
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self.armed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Один профиль за раз: параллельные семплеры искажают друг другу тайминги
+        self._busy = threading.Lock()
+
+    def arm(self, route: str, count: int) -> None:
+        with self._lock:
+            self.armed[route] = self.armed.get(route, 0) + count
+
+    def is_armed(self, route: str) -> bool:
+        return self.armed.get(route, 0) > 0
+
+    def take(self, route: str) -> bool:
+        """Consume one armed capture for the route, if any"""
+        if not self.armed:
+            return False
+        with self._lock:
+            left = self.armed.get(route, 0)
+            if left <= 0:
+                return False
+            if left == 1:
+                del self.armed[route]
+            else:
+                self.armed[route] = left - 1
+            return True
+
+    def try_begin(self) -> bool:
+        return self._busy.acquire(blocking=False)
+
+    def end(self) -> None:
+        self._busy.release()
+
+    def save(self, method: str, route: str, elapsed: float, sampler: StackSampler) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r"[^a-zA-Z0-9]+", "_", route).strip("_") or "root"
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"{stamp}_{method}_{slug}_{int(elapsed * 1000)}ms.folded"
+        with open(os.path.join(self.directory, filename), "w", encoding="utf-8") as f:
+            f.write(sampler.folded())
+        self._prune()
+        return filename
+
+    def files(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory) if f.endswith(".folded"))
+
+    def _prune(self) -> None:
+        files = self.files()
+        for name in files[:-PROFILE_KEEP_FILES]:
+            os.remove(os.path.join(self.directory, name))
+
+
+registry = ProfileRegistry()
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class ProfilingMiddleware:
+    """Capture a stack profile for requests armed by header or admin endpoint"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Быстрый путь: профилирование не настроено или ничего не запрошено
+        if scope["type"] != "http" or not PROFILING_TOKEN:
+            await self.app(scope, receive, send)
+            return
+        requested = _header(scope, PROFILE_HEADER) == PROFILING_TOKEN
+        if not requested and not registry.armed:
+            await self.app(scope, receive, send)
+            return
+
+        route = route_template(scope.get("app"), scope)
+        if not (requested or registry.is_armed(route)) or not registry.try_begin():
+            await self.app(scope, receive, send)
+            return
+        # Заявку на маршрут списываем, только получив слот профилирования
+        if not requested and not registry.take(route):
+            registry.end()
+            await self.app(scope, receive, send)
+            return
+
+        sampler = StackSampler()
+        started = time.perf_counter()
+        token = sampler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampler.stop(token)
+            try:
+                registry.save(scope["method"], route, time.perf_counter() - started, sampler)
+            finally:
+                registry.end()
+
+
+def _check_token(x_profile_token: Optional[str]) -> None:
+    if not PROFILING_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if x_profile_token != PROFILING_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+async def profiling_status(x_profile_token: Optional[str] = Header(None)):
+    """Armed routes and captured profiles"""
+    _check_token(x_profile_token)
+    return {"armed": dict(registry.armed), "directory": registry.directory, "files": registry.files()}
+
+
+async def arm_profiling(route: str, count: int = 1, x_profile_token: Optional[str] = Header(None)):
+    """Profile the next ``count`` requests to a route template, e.g. /organizations/{org_id}/menu"""
+    _check_token(x_profile_token)
+    if count < 1 or count > 100:
+        raise HTTPException(status_code=400, detail="count must be between 1 and 100")
+    registry.arm(route, count)
+    return {"armed": dict(registry.armed)}
+
+
+def install_profiling(app) -> None:
+    """Add the profiling middleware and /debug/profiling endpoints to a FastAPI app"""
+    app.add_middleware(ProfilingMiddleware)
+    app.add_api_route("/debug/profiling", profiling_status, methods=["GET"])
+    app.add_api_route("/debug/profiling/arm", arm_profiling, methods=["POST"])
@@ -0,0 +1,77 @@
+import os
+import logging
+from typing import Optional
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+logger = logging.getLogger(__name__)
+
+# Трассировка выключена, пока не задан ни файл, ни коллектор
+TRACE_FILE = os.getenv("TRACE_FILE")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+# Служебные маршруты не трассируем
+EXCLUDED_URLS = "health,metrics,debug/profiling"
+
+_enabled = False
+
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+
+def setup_tracing(service_name: str) -> bool:
+    """Configure the global tracer provider from TRACE_FILE / OTEL_EXPORTER_OTLP_ENDPOINT.
+
+    Without either the default no-op provider stays in place and spans cost
+    next to nothing.
+    """
+    global _enabled
+    if _enabled or not (TRACE_FILE or OTLP_ENDPOINT):
+        return _enabled
+    resource = Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)})
+    provider = TracerProvider(resource=resource)
+    if TRACE_FILE:
+        os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+        # Одна строка JSON на span - удобно склеивать файлы нескольких сервисов
+        stream = open(TRACE_FILE, "a", encoding="utf-8", buffering=1)
+        provider.add_span_processor(BatchSpanProcessor(
+            ConsoleSpanExporter(out=stream, formatter=lambda span: span.to_json(indent=None) + "\n")
+        ))
+    if OTLP_ENDPOINT:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _enabled = True
+    logger.info(f"Tracing enabled for {service_name} (file={TRACE_FILE}, otlp={OTLP_ENDPOINT})")
+    return True
+
+
+def install_tracing(app, service_name: str) -> None:
+    """Server spans for a FastAPI app; incoming traceparent headers continue the trace"""
+    if not setup_tracing(service_name):
+        return
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    FastAPIInstrumentor.instrument_app(app, excluded_urls=EXCLUDED_URLS)
+
+
+def trace_engine(engine) -> None:
+    """A span per SQL statement executed through the engine"""
+    if not _enabled:
+        return
+    from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    SQLAlchemyInstrumentor().instrument(engine=engine)
+
+
+def trace_httpx() -> None:
+    """Client spans and traceparent injection for every httpx client"""
+    if not _enabled:
+        return
+    from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+    HTTPXClientInstrumentor().instrument()
+
+
+def get_tracer(name: Optional[str] = None) -> trace.Tracer:
+    return trace.get_tracer(name or "menu")
@@ -0,0 +1,82 @@
+from typing import Any, Dict, Optional, Type, TypeVar
+
+import msgspec
+import zstandard
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Внутренний трафик (бот, API, генератор): MessagePack вместо JSON, по желанию сжатый zstd
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+ZSTD = "zstd"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Мелкие ответы сжимать дороже, чем передать как есть
+COMPRESS_MIN_BYTES = 1024
+
+T = TypeVar("T")
+
+_msgpack_encoder = msgspec.msgpack.Encoder()
+_json_encoder = msgspec.json.Encoder()
+_compressor = zstandard.ZstdCompressor(level=3)
+_decompressor = zstandard.ZstdDecompressor()
+
+
+def _accepts(header: Optional[str], token: str) -> bool:
+    """Token listed in an Accept/Accept-Encoding header with q > 0"""
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == token:
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+# Тело зависит от этих заголовков запроса; 304 на такой ответ несёт тот же Vary
+VARY = "Accept, Accept-Encoding"
+
+
+def wants_msgpack(request: Request) -> bool:
+    return _accepts(request.headers.get("accept"), MSGPACK)
+
+
+def encode_response(content: Any, request: Request, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serialize as MessagePack or JSON per Accept, zstd-compressed per Accept-Encoding"""
+    headers = dict(headers or {})
+    headers["Vary"] = VARY
+    if wants_msgpack(request):
+        media_type, body = MSGPACK, _msgpack_encoder.encode(content)
+    else:
+        media_type, body = JSON, _json_encoder.encode(content)
+    if len(body) >= COMPRESS_MIN_BYTES and _accepts(request.headers.get("accept-encoding"), ZSTD):
+        body = _compressor.compress(body)
+        headers["Content-Encoding"] = ZSTD
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def decompress(body: bytes) -> bytes:
+    # Проверяем сигнатуру: прокси или клиент могли уже распаковать тело
+    if body.startswith(ZSTD_MAGIC):
+        return _decompressor.decompress(body)
+    return body
+
+
+async def decode_request(request: Request, schema: Type[T]) -> T:
+    """Decode and validate a MessagePack or JSON body straight into a msgspec schema.
+
+    Raises msgspec.ValidationError / msgspec.DecodeError on bad input.
+    """
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == ZSTD:
+        body = decompress(body)
+    if request.headers.get("content-type", "").split(";")[0].strip().lower() == MSGPACK:
+        return msgspec.msgpack.decode(body, type=schema)
+    return msgspec.json.decode(body, type=schema)
+
+
+def pack(content: Any, compress: bool = True) -> Dict[str, Any]:
+    """Request kwargs (data + headers) for sending content as MessagePack"""
+    body = _msgpack_encoder.encode(content)
+    headers = {"Content-Type": MSGPACK}
+    if compress and len(body) >= COMPRESS_MIN_BYTES:
+        body = _compressor.compress(body)
+        headers["Content-Encoding"] = ZSTD
+    return {"data": body, "headers": headers}
@@ -2,6 +2,9 @@ CREATE DATABASE bar;
 
 \connect bar;
 
+-- Триграммы для поиска по меню с опечатками
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 CREATE TABLE main (
     id SERIAL PRIMARY KEY,
     name TEXT NOT NULL,
@@ -19,6 +22,9 @@ CREATE TABLE users (
     updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Регистрация (/register_user) - upsert по tid: INSERT ... ON CONFLICT (tid)
+CREATE UNIQUE INDEX ix_users_tid ON users (tid);
+
 CREATE TABLE organizations (
     id SERIAL PRIMARY KEY,
     name TEXT NOT NULL,
@@ -36,4 +42,43 @@ CREATE TABLE images (
     stored_filename TEXT NOT NULL,
     created TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+);
+
+-- Сводка категорий меню, поддерживается триггерами на таблицах menu_*
+CREATE TABLE menu_category_summary (
+    menu_table TEXT NOT NULL,
+    category TEXT NOT NULL,
+    subcategory TEXT NOT NULL DEFAULT '',
+    item_count INTEGER NOT NULL DEFAULT 0,
+    available_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (menu_table, category, subcategory)
+);
+
+-- Версии ресурсов для ETag/304; увеличиваются триггерами при записи
+CREATE SEQUENCE resource_version_seq;
+
+CREATE TABLE resource_versions (
+    resource TEXT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    changed TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Очередь импорта меню: задания разбирают воркеры (app/api/worker.py)
+CREATE TABLE import_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    organization_id INTEGER NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+    mode TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    total_rows INTEGER,
+    processed_rows INTEGER NOT NULL DEFAULT 0,
+    result JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished TIMESTAMPTZ
+);
+
+CREATE INDEX ix_import_jobs_pending ON import_jobs (created) WHERE status IN ('queued', 'running');
@@ -1,10 +1,15 @@
 from dataclasses import dataclass
 from typing import Dict, List, Any
-from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Literal
+import msgspec
 import os
 NGINX_URL = os.getenv("NGINX_URL", "http://localhost")
-class MenuItem(BaseModel):
+# html - страница целиком; data - оболочка темы + menu.json, который рендерит клиент
+PAGE_OUTPUT = os.getenv("PAGE_OUTPUT", "html")
+
+# Схемы msgspec: тело запроса (MessagePack или JSON) разбирается и проверяется
+# сразу в эти объекты, без промежуточных dict и повторной валидации
+class MenuItem(msgspec.Struct):
     name: str
     price: float
     description: Optional[str] = None
@@ -15,23 +20,35 @@ class MenuItem(BaseModel):
             return f"{NGINX_URL}/images/{self.image_url}"
         return None
 
-class MenuCategory(BaseModel):
+class MenuCategory(msgspec.Struct):
     name: str
     items: List[MenuItem]
 
-class Organization(BaseModel):
+class Organization(msgspec.Struct):
     title: str
     description: Optional[str] = None
     footer_text: Optional[str] = None
 
-class GenerateRequest(BaseModel):
+class GenerateRequest(msgspec.Struct):
     org_id: str
     page_name: str
     title: str
-    description: Optional[str] = None
     theme: str
     content: Dict[str, List[MenuItem]]
+    organization: Organization
+    description: Optional[str] = None
     page_background: Optional[str] = None
     header_background: Optional[str] = None
     footer_background: Optional[str] = None
-    organization: Organization
\ No newline at end of file
+    output: Literal["html", "data"] = PAGE_OUTPUT
+
+    def settings(self) -> Dict[str, Any]:
+        """Everything except the menu content, as plain JSON-able values"""
+        settings = msgspec.to_builtins(msgspec.structs.replace(self, content={}))
+        settings.pop("content")
+        return settings
+
+class RefreshRequest(msgspec.Struct):
+    """New menu content for a page generated earlier; theme and backgrounds are reused"""
+    org_id: str
+    content: Dict[str, List[MenuItem]]
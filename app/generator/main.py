@@ -1,28 +1,59 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+import asyncio
 import os
+import time
 import logging
 import traceback
 from pydantic import BaseModel
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-from base import GenerateRequest
+from base import GenerateRequest, RefreshRequest
+from page_data import CLIENT_CLASSES, CLIENT_TAGS, DATA_FILE, inject_client, shell_key, write_menu_data
+from optimize import optimize_page
+from service_worker import inject_registration, precache_urls, write_service_worker
+from render_jobs import QueueFull, RenderJobs
+import json
+from common.admission import Rate, RouteClass, install_admission
+from common.metrics import (
+    install_metrics, RENDER_DURATION, RENDER_OUTPUT_BYTES, PAGE_FIRST_PAINT_BYTES, PAGE_BUDGET_EXCEEDED
+)
+from common.profiling import install_profiling
+from common.tracing import install_tracing, get_tracer
+from common.wire import decode_request
+import msgspec
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Menu Generator")
+# /refresh приходит от API уже с дебаунсом по организации - ограничиваем только параллельность
+install_admission(app, [
+    RouteClass.from_env("render", concurrency=os.cpu_count() or 2, queue=16, deadline=20.0,
+                        per_user=Rate(per_minute=6, burst=3), per_org=Rate(per_minute=12, burst=4)),
+    RouteClass.from_env("refresh", concurrency=os.cpu_count() or 2, queue=64, deadline=60.0),
+], {
+    ("POST", "/generate"): "render",
+    ("POST", "/jobs"): "render",
+    ("POST", "/refresh"): "refresh",
+})
+install_metrics(app)
+install_profiling(app)
+install_tracing(app, "menu-generator")
+tracer = get_tracer(__name__)
 
 # Константы
-STATIC_DIR = "/static"
+STATIC_DIR = os.getenv("STATIC_DIR", "/static")
 TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
-PAGES_DIR = "/static/pages"
+PAGES_DIR = os.path.join(STATIC_DIR, "pages")
 NGINX_URL = os.getenv("NGINX_URL", "http://localhost")
 PAGES_URL = os.getenv("PAGES_URL")
 BACKGROUNDS_URL = os.getenv("BACKGROUNDS_URL")
 IMAGES_URL = os.getenv("IMAGES_URL")
+# Критический CSS inline, остальная тема отложенно, минификация HTML
+PAGE_OPTIMIZE = os.getenv("PAGE_OPTIMIZE", "1") == "1"
 # Создаем директории если их нет
 os.makedirs(STATIC_DIR, exist_ok=True)
 os.makedirs(PAGES_DIR, exist_ok=True)
@@ -33,52 +64,208 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 # Настраиваем шаблоны
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
-@app.post("/generate")
-async def generate_menu(request: GenerateRequest):
-    """Генерирует страницу меню"""
-    try:
-        # Получаем шаблон
-        template = templates.env.get_template("menu.html")
-        # Формируем данные для шаблона
-        template_data = {
-            "page_name": request.page_name,
-            "title": request.title,
-            "description": request.description,
-            "theme": request.theme,
-            "categories": request.content,
-            "page_background": request.page_background,
-            "header_background": request.header_background,
-            "footer_background": request.footer_background,
-            "organization": request.organization,
-            "now": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+# Параметры последней генерации: по ним /refresh перерисовывает страницу с новым меню
+PAGE_SETTINGS_FILE = "page.json"
+# Ссылка на страницу всегда index.html (она же в QR-коде). Оболочка data-режима
+# пишется в shell.html: nginx отдаёт её вместо отсутствующего index.html с долгим
+# кэшем, а готовый HTML с товарами остаётся на no-cache с проверкой ETag
+PAGE_FILE = "index.html"
+SHELL_FILE = "shell.html"
+
 
-        # Рендерим шаблон
+def _page_url(org_id: str, filename: str) -> str:
+    return f"{NGINX_URL}/{PAGES_URL}/{org_id}/{filename}"
+
+
+def _render_template(template_data: Dict) -> str:
+    template = templates.env.get_template("menu.html")
+    render_started = time.perf_counter()
+    with tracer.start_as_current_span("template.render", attributes={"template": "menu.html"}):
         html_content = template.render(**template_data)
+    RENDER_DURATION.observe(time.perf_counter() - render_started)
+    RENDER_OUTPUT_BYTES.observe(len(html_content.encode('utf-8')))
+    return html_content
+
+
+def _read_settings(orgpath: str) -> Optional[Dict]:
+    settings_path = os.path.join(orgpath, PAGE_SETTINGS_FILE)
+    if not os.path.exists(settings_path):
+        return None
+    with open(settings_path, encoding='utf-8') as f:
+        return json.load(f)
+
 
-        # Сохраняем результат
-        filename = f"index.html"
-        os.makedirs(os.path.join(PAGES_DIR, request.org_id), exist_ok=True)
-        orgpath = os.path.join(PAGES_DIR, request.org_id)
-        filepath = os.path.join(orgpath, filename)
-        
+def _write_service_worker(orgpath: str, request: GenerateRequest, html_content: str) -> None:
+    with tracer.start_as_current_span("file.write", attributes={"file.path": os.path.join(orgpath, "sw.js")}):
+        write_service_worker(orgpath, request.org_id, precache_urls(html_content, request), html_content)
+
+
+def render_page(request: GenerateRequest) -> Tuple[str, Optional[Dict]]:
+    """Render menu.html for the request, write it to the org's page dir.
+
+    Returns the page URL and the size/budget report of the written HTML
+    (None when nothing was re-rendered).
+
+    In data mode the template is rendered without items as a shell with an
+    inline client renderer, re-rendered only when theme or texts change;
+    the items go to menu.json. Every call rewrites the org's service worker
+    so that clients pick up the new precache manifest.
+    """
+    orgpath = os.path.join(PAGES_DIR, request.org_id)
+    os.makedirs(orgpath, exist_ok=True)
+    settings = request.settings()
+    filename = SHELL_FILE if request.output == "data" else PAGE_FILE
+    filepath = os.path.join(orgpath, filename)
+
+    if request.output == "data":
+        key = shell_key(settings)
+        previous = _read_settings(orgpath) or {}
+        with tracer.start_as_current_span("file.write", attributes={"file.path": os.path.join(orgpath, DATA_FILE)}):
+            write_menu_data(orgpath, request.content)
+        if previous.get("shell_key") == key and os.path.exists(filepath):
+            # Оболочка прежняя, но список картинок мог измениться
+            with open(filepath, encoding='utf-8') as f:
+                _write_service_worker(orgpath, request, f.read())
+            return _page_url(request.org_id, PAGE_FILE), None
+        settings["shell_key"] = key
+        categories = {}
+    else:
+        categories = request.content
+
+    # Формируем данные для шаблона
+    template_data = {
+        "page_name": request.page_name,
+        "title": request.title,
+        "description": request.description,
+        "theme": request.theme,
+        "categories": categories,
+        "page_background": request.page_background,
+        "header_background": request.header_background,
+        "footer_background": request.footer_background,
+        "organization": request.organization,
+        "now": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    html_content = _render_template(template_data)
+    if request.output == "data":
+        html_content = inject_client(html_content)
+    html_content = inject_registration(html_content)
+    report = None
+    if PAGE_OPTIMIZE:
+        with tracer.start_as_current_span("page.optimize"):
+            data_mode = request.output == "data"
+            html_content, page_report = optimize_page(
+                html_content, CLIENT_CLASSES if data_mode else (), CLIENT_TAGS if data_mode else ()
+            )
+        report = page_report.to_dict()
+        PAGE_FIRST_PAINT_BYTES.observe(page_report.first_paint_bytes)
+        for budget in page_report.over_budget:
+            PAGE_BUDGET_EXCEEDED.labels(budget=budget).inc()
+        if page_report.over_budget:
+            logger.warning(f"Page of org {request.org_id} is over budget {page_report.over_budget}: {report}")
+
+    # Сохраняем результат
+    with tracer.start_as_current_span("file.write", attributes={"file.path": filepath}):
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(html_content)
+        # Страница прошлого режима иначе перекрыла бы новую
+        stale_path = os.path.join(orgpath, PAGE_FILE if filename == SHELL_FILE else SHELL_FILE)
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+        with open(os.path.join(orgpath, PAGE_SETTINGS_FILE), 'w', encoding='utf-8') as f:
+            json.dump(settings, f, ensure_ascii=False)
+    _write_service_worker(orgpath, request, html_content)
+
+    # Формируем URL для доступа к странице
+    return _page_url(request.org_id, PAGE_FILE), report
+
+async def _decode_body(request: Request, schema):
+    """MessagePack or JSON body (optionally zstd) validated by the msgspec schema"""
+    try:
+        return await decode_request(request, schema)
+    except (msgspec.ValidationError, msgspec.DecodeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+async def generate_request_body(request: Request) -> GenerateRequest:
+    return await _decode_body(request, GenerateRequest)
+
+async def refresh_request_body(request: Request) -> RefreshRequest:
+    return await _decode_body(request, RefreshRequest)
 
-        # Формируем URL для доступа к странице
-        url = f"{NGINX_URL}/{PAGES_URL}/{request.org_id}/{filename}"
+render_jobs = RenderJobs(render_page)
+
+async def _render(request: GenerateRequest) -> Tuple[str, Optional[Dict]]:
+    """Render on the job threads and wait for the result"""
+    try:
+        _, future = render_jobs.submit(request)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return await asyncio.wrap_future(future)
 
+@app.post("/generate")
+async def generate_menu(request: GenerateRequest = Depends(generate_request_body)):
+    """Генерирует страницу меню"""
+    try:
+        url, report = await _render(request)
         return {
             "status": "success",
             "message": "Menu page generated successfully",
-            "url": url
+            "url": url,
+            "report": report
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating menu: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/jobs", status_code=202)
+async def create_render_job(request: GenerateRequest = Depends(generate_request_body)):
+    """Queue a page render; poll GET /jobs/{job_id} for the URL"""
+    try:
+        job, _ = render_jobs.submit(request)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return {
+        "status": "queued",
+        "message": "Menu page render queued",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "job": msgspec.to_builtins(job),
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_render_job(job_id: str):
+    """Status of a render job; url and report are set once it is done"""
+    job = render_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return msgspec.to_builtins(job)
+
+@app.post("/refresh")
+async def refresh_menu(request: RefreshRequest = Depends(refresh_request_body)):
+    """Re-render an existing page with new menu content, keeping its theme"""
+    settings = _read_settings(os.path.join(PAGES_DIR, request.org_id))
+    if settings is None:
+        raise HTTPException(status_code=404, detail="Page has not been generated yet")
+    try:
+        settings.pop("shell_key", None)
+        # В режиме data оболочка не меняется - переписывается только menu.json
+        url, report = await _render(msgspec.convert({**settings, "content": request.content}, GenerateRequest))
+        return {
+            "status": "success",
+            "message": "Menu page refreshed successfully",
+            "url": url,
+            "report": report
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error refreshing menu: {str(e)}")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
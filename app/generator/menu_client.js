@@ -0,0 +1,58 @@
+// Рендер меню из menu.json поверх закэшированной оболочки страницы.
+// Формат: {"v": версия, "c": [[категория, [[название, цена, описание, подкатегория, картинка], ...]], ...]}
+// Разметка та же, что у страницы с товарами: темы стилизуют .category-section и .menu-item
+(function () {
+  var root = document.querySelector("[data-menu-root]");
+  if (!root) {
+    // Без контейнера не трогаем страницу: replaceChildren стёр бы шапку и регистрацию service worker
+    console.error("menu: [data-menu-root] not found");
+    return;
+  }
+  var url = root.getAttribute("data-menu-url") || "menu.json";
+
+  function el(tag, cls, text) {
+    var node = document.createElement(tag);
+    if (cls) node.className = cls;
+    if (text) node.textContent = text;
+    return node;
+  }
+
+  function price(value) {
+    return value.toLocaleString("ru-RU", { minimumFractionDigits: 2, maximumFractionDigits: 2 }) + " ₽";
+  }
+
+  function render(data) {
+    var fragment = document.createDocumentFragment();
+    data.c.forEach(function (category) {
+      var section = el("section", "category-section");
+      section.appendChild(el("h2", null, category[0]));
+      category[1].forEach(function (item) {
+        var card = el("div", "menu-item");
+        if (item[4]) {
+          var img = el("img");
+          img.src = item[4];
+          img.alt = item[0];
+          img.loading = "lazy";
+          img.onerror = function () { img.remove(); };
+          card.appendChild(img);
+        }
+        card.appendChild(el("h3", null, item[0]));
+        if (item[3]) card.appendChild(el("p", null, item[3]));
+        if (item[2]) card.appendChild(el("p", null, item[2]));
+        card.appendChild(el("span", "price", price(item[1])));
+        section.appendChild(card);
+      });
+      fragment.appendChild(section);
+    });
+    root.replaceChildren(fragment);
+    root.setAttribute("data-menu-version", data.v);
+  }
+
+  fetch(url, { cache: "no-cache" })
+    .then(function (resp) {
+      if (!resp.ok) throw new Error("menu.json: " + resp.status);
+      return resp.json();
+    })
+    .then(render)
+    .catch(function (err) { console.error(err); });
+})();
@@ -0,0 +1,260 @@
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+import gzip
+import os
+import re
+import threading
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.getenv("STATIC_DIR", "/static")
+# nginx отдаёт /static/themes/ из /static/css/themes/
+THEMES_DIR = os.getenv("THEMES_DIR", os.path.join(STATIC_DIR, "css", "themes"))
+THEMES_URL_PART = "static/themes/"
+
+# Первый ответ сервера (~14 КБ сжатых за первый RTT) должен содержать всё для первой отрисовки
+FIRST_PAINT_BUDGET_BYTES = int(os.getenv("PAGE_FIRST_PAINT_BUDGET_BYTES", str(14 * 1024)))
+CRITICAL_CSS_BUDGET_BYTES = int(os.getenv("PAGE_CRITICAL_CSS_BUDGET_BYTES", str(10 * 1024)))
+HTML_BUDGET_BYTES = int(os.getenv("PAGE_HTML_BUDGET_BYTES", str(100 * 1024)))
+
+_STYLESHEET_LINK = re.compile(r"<link\b[^>]*\brel=[\"']?stylesheet[\"']?[^>]*>", re.IGNORECASE)
+_HREF = re.compile(r"\bhref=[\"']([^\"']+)[\"']", re.IGNORECASE)
+_TAG = re.compile(r"<([a-zA-Z][a-zA-Z0-9-]*)([^>]*)>")
+_CLASS_ATTR = re.compile(r"\bclass=[\"']([^\"']*)[\"']", re.IGNORECASE)
+_ID_ATTR = re.compile(r"\bid=[\"']([^\"']*)[\"']", re.IGNORECASE)
+# Комментарии, строки в кавычках и url(...) без кавычек - по одному токену
+_CSS_PROTECTED = re.compile(
+    r"/\*.*?\*/|\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|\burl\(\s*[^\"')\s]*\s*\)",
+    re.DOTALL | re.IGNORECASE,
+)
+_CSS_PLACEHOLDER = re.compile("\x00(\\d+)\x00")
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+# Содержимое этих тегов нельзя трогать при сжатии пробелов
+_RAW_BLOCK = re.compile(r"(<(pre|textarea|script|style)\b[^>]*>.*?</\2>)", re.DOTALL | re.IGNORECASE)
+_SIMPLE_PARTS = re.compile(r"([.#]?)(-?[a-zA-Z_][\w-]*)")
+_PSEUDO_OR_ATTR = re.compile(r"::?[\w-]+(\([^)]*\))?|\[[^\]]*\]")
+_COMBINATOR = re.compile(r"\s*[>+~]\s*|\s+")
+_HEAD_CLOSE = re.compile(r"</head>", re.IGNORECASE)
+
+
+@dataclass
+class DocumentIndex:
+    """Tags, classes and ids present in the page (plus ones a client script will create)"""
+    tags: Set[str] = field(default_factory=lambda: {"html", "body", "*"})
+    classes: Set[str] = field(default_factory=set)
+    ids: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class PageReport:
+    raw_bytes: int = 0
+    html_bytes: int = 0
+    html_gzip_bytes: int = 0
+    critical_css_bytes: int = 0
+    deferred_css_bytes: int = 0
+    blocking_requests: int = 0
+    first_paint_bytes: int = 0
+    over_budget: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def index_document(html_content: str, extra_classes: Iterable[str] = (), extra_tags: Iterable[str] = ()) -> DocumentIndex:
+    index = DocumentIndex()
+    index.classes.update(extra_classes)
+    index.tags.update(extra_tags)
+    for tag, attrs in _TAG.findall(html_content):
+        index.tags.add(tag.lower())
+        for value in _CLASS_ATTR.findall(attrs):
+            index.classes.update(value.split())
+        index.ids.update(_ID_ATTR.findall(attrs))
+    return index
+
+
+def _compound_used(compound: str, index: DocumentIndex) -> bool:
+    # Псевдоклассы и атрибуты не проверяем: состояние (:hover) на странице не видно
+    compound = _PSEUDO_OR_ATTR.sub("", compound)
+    if not compound or compound == "*":
+        return True
+    for prefix, name in _SIMPLE_PARTS.findall(compound):
+        if prefix == "." and name not in index.classes:
+            return False
+        if prefix == "#" and name not in index.ids:
+            return False
+        if not prefix and name.lower() not in index.tags:
+            return False
+    return True
+
+
+def selector_used(selector: str, index: DocumentIndex) -> bool:
+    """Conservative: a selector is kept if each of its compounds could match something"""
+    return all(_compound_used(part, index) for part in _COMBINATOR.split(selector.strip()) if part)
+
+
+def _restore_protected(css: str, protected: List[str]) -> str:
+    return _CSS_PLACEHOLDER.sub(lambda m: protected[int(m.group(1))], css)
+
+
+def minify_css(css: str) -> str:
+    # Строки и url(...) убираем из-под регулярок: пробелы и ";" внутри них - это данные
+    protected: List[str] = []
+
+    def protect(match: re.Match) -> str:
+        if match.group(0).startswith("/*"):
+            return ""
+        protected.append(match.group(0))
+        return f"\x00{len(protected) - 1}\x00"
+
+    css = _CSS_PROTECTED.sub(protect, css)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    # Пробел перед ":" в селекторе - комбинатор потомка (.menu :hover), его оставляем;
+    # убираем только в объявлениях, где до следующей "{" идёт ";" или "}"
+    css = re.sub(r":\s+", ":", css)
+    css = re.sub(r"\s+:(?=[^{};]*[;}])", ":", css)
+    return _restore_protected(css.replace(";}", "}").strip(), protected)
+
+
+def _split_blocks(css: str) -> List[Tuple[str, str]]:
+    """Top-level (prelude, body) pairs; at-rule bodies keep their nested rules"""
+    blocks = []
+    depth = 0
+    start = 0
+    prelude = ""
+    for i, ch in enumerate(css):
+        if ch == "{":
+            if depth == 0:
+                prelude = css[start:i].strip()
+                start = i + 1
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                blocks.append((prelude, css[start:i]))
+                start = i + 1
+            depth = max(depth, 0)
+    return blocks
+
+
+def critical_css(css: str, index: DocumentIndex) -> str:
+    """Rules of the stylesheet that can apply to the rendered page, minified"""
+    out = []
+    for prelude, body in _split_blocks(minify_css(css)):
+        if prelude.startswith("@media") or prelude.startswith("@supports"):
+            inner = critical_css(body, index)
+            if inner:
+                out.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@"):
+            # @font-face, @keyframes: нужны используемым правилам, фильтровать не по чему
+            out.append(f"{prelude}{{{body}}}")
+        else:
+            kept = [s for s in prelude.split(",") if s and selector_used(s, index)]
+            if kept:
+                out.append(f"{','.join(kept)}{{{body}}}")
+    return "".join(out)
+
+
+_css_cache: Dict[str, Tuple[float, str]] = {}
+_css_cache_lock = threading.Lock()
+
+
+def _resolve_stylesheet(href: str) -> Optional[str]:
+    path = urlparse(href).path
+    position = path.find(THEMES_URL_PART)
+    if position == -1:
+        return None
+    filepath = os.path.normpath(os.path.join(THEMES_DIR, path[position + len(THEMES_URL_PART):]))
+    if not filepath.startswith(os.path.normpath(THEMES_DIR) + os.sep):
+        return None
+    return filepath
+
+
+def _read_stylesheet(filepath: str) -> Optional[str]:
+    try:
+        mtime = os.path.getmtime(filepath)
+    except OSError:
+        return None
+    with _css_cache_lock:
+        cached = _css_cache.get(filepath)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(filepath, encoding="utf-8") as f:
+        css = f.read()
+    with _css_cache_lock:
+        _css_cache[filepath] = (mtime, css)
+    return css
+
+
+def _deferred_link(href: str) -> str:
+    # Полная тема догружается после первой отрисовки; без JS - обычной ссылкой
+    return (
+        f'<link rel="preload" href="{href}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">'
+        f'<noscript><link rel="stylesheet" href="{href}"></noscript>'
+    )
+
+
+def minify_html(html_content: str) -> str:
+    parts = _RAW_BLOCK.split(html_content)
+    out = []
+    # split с группами: [текст, блок, имя тега, текст, ...]
+    for i, part in enumerate(parts):
+        kind = i % 3
+        if kind == 0:
+            # Комментарии убираем только вне script/pre; отступы шаблона сжимаем до одного
+            # пробела - между строчными элементами он виден
+            part = _HTML_COMMENT.sub("", part)
+            part = re.sub(r"\s+", " ", part)
+            out.append(part)
+        elif kind == 1:
+            out.append(part)
+    return "".join(out).strip()
+
+
+def optimize_page(html_content: str, extra_classes: Iterable[str] = (),
+                  extra_tags: Iterable[str] = ()) -> Tuple[str, PageReport]:
+    """Inline critical theme CSS, defer the full stylesheets, minify; report sizes and budgets"""
+    report = PageReport(raw_bytes=len(html_content.encode("utf-8")))
+    index = index_document(html_content, extra_classes, extra_tags)
+    critical: List[str] = []
+
+    def replace_link(match: re.Match) -> str:
+        href_match = _HREF.search(match.group(0))
+        filepath = _resolve_stylesheet(href_match.group(1)) if href_match else None
+        css = _read_stylesheet(filepath) if filepath else None
+        if css is None:
+            report.blocking_requests += 1
+            return match.group(0)
+        subset = critical_css(css, index)
+        critical.append(subset)
+        report.deferred_css_bytes += len(css.encode("utf-8"))
+        return _deferred_link(href_match.group(1))
+
+    html_content = _STYLESHEET_LINK.sub(replace_link, html_content)
+    if critical:
+        style = f"<style>{''.join(critical)}</style>"
+        report.critical_css_bytes = len(style.encode("utf-8"))
+        if _HEAD_CLOSE.search(html_content):
+            html_content = _HEAD_CLOSE.sub(lambda m: style + m.group(0), html_content, count=1)
+        else:
+            html_content = style + html_content
+
+    html_content = minify_html(html_content)
+    encoded = html_content.encode("utf-8")
+    report.html_bytes = len(encoded)
+    report.html_gzip_bytes = len(gzip.compress(encoded))
+    # Для первой отрисовки нужен только сжатый HTML (CSS уже внутри), если нет блокирующих ссылок
+    report.first_paint_bytes = report.html_gzip_bytes
+    if report.first_paint_bytes > FIRST_PAINT_BUDGET_BYTES:
+        report.over_budget.append("first_paint")
+    if report.critical_css_bytes > CRITICAL_CSS_BUDGET_BYTES:
+        report.over_budget.append("critical_css")
+    if report.html_bytes > HTML_BUDGET_BYTES:
+        report.over_budget.append("html")
+    if report.blocking_requests:
+        report.over_budget.append("blocking_requests")
+    return html_content, report
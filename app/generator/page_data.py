@@ -0,0 +1,89 @@
+from typing import Any, Dict, List, Optional
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from base import MenuItem
+
+# Данные меню отдельно от оболочки: правка цены или стоп-листа - это запись нескольких КБ
+DATA_FILE = "menu.json"
+CLIENT_SCRIPT_FILE = os.path.join(os.path.dirname(__file__), "menu_client.js")
+
+with open(CLIENT_SCRIPT_FILE, encoding="utf-8") as f:
+    CLIENT_SCRIPT = f.read()
+
+# Теги и классы разметки, которую создаёт клиент: их правила тоже нужны в критическом CSS оболочки
+CLIENT_TAGS = frozenset(re.findall(r'el\("(\w+)"', CLIENT_SCRIPT))
+CLIENT_CLASSES = frozenset(re.findall(r'el\("\w+", "([\w-]+)"', CLIENT_SCRIPT))
+# Контейнер, который заполняет клиент; вставляется, если в шаблоне его нет
+MENU_ROOT = f'<div data-menu-root data-menu-url="{DATA_FILE}"></div>'
+_MAIN_CLOSE = re.compile(r"</main>", re.IGNORECASE)
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    # nginx не должен отдать наполовину записанный файл
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build_menu_data(content: Dict[str, List[MenuItem]]) -> Dict[str, Any]:
+    """Compact menu.json payload: positional item arrays and a content hash as version"""
+    categories = [
+        [category, [
+            [item.name, item.price, item.description, item.subcategory, item.get_image_url()]
+            for item in items
+        ]]
+        for category, items in content.items()
+    ]
+    body = json.dumps(categories, ensure_ascii=False, separators=(",", ":"))
+    return {"v": hashlib.sha256(body.encode("utf-8")).hexdigest()[:12], "c": categories}
+
+
+def read_data_version(orgpath: str) -> Optional[str]:
+    try:
+        with open(os.path.join(orgpath, DATA_FILE), encoding="utf-8") as f:
+            return json.load(f).get("v")
+    except (OSError, ValueError):
+        return None
+
+
+def write_menu_data(orgpath: str, content: Dict[str, List[MenuItem]]) -> str:
+    """Write menu.json and its gzip copy (for gzip_static); unchanged data is not rewritten"""
+    data = build_menu_data(content)
+    if read_data_version(orgpath) == data["v"]:
+        return data["v"]
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    path = os.path.join(orgpath, DATA_FILE)
+    # Сначала .gz: nginx предпочитает его, и он не должен оказаться старше оригинала
+    _atomic_write(f"{path}.gz", gzip.compress(raw, compresslevel=9, mtime=0))
+    _atomic_write(path, raw)
+    return data["v"]
+
+
+def shell_key(settings: Dict[str, Any]) -> str:
+    """Everything the shell depends on; the shell is re-rendered only when this changes"""
+    body = json.dumps(settings, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256((body + CLIENT_SCRIPT).encode("utf-8")).hexdigest()[:12]
+
+
+def inject_client(html_content: str) -> str:
+    """Inline the renderer before </body> (or at the end if the template has none).
+
+    The shell always gets a [data-menu-root] container: at the end of <main>
+    if the template has one, otherwise right before the script.
+    """
+    script = f"<script>{CLIENT_SCRIPT}</script>"
+    if "data-menu-root" not in html_content:
+        main_close = _MAIN_CLOSE.search(html_content)
+        if main_close:
+            html_content = html_content[:main_close.start()] + MENU_ROOT + html_content[main_close.start():]
+        else:
+            script = MENU_ROOT + script
+    index = html_content.lower().rfind("</body>")
+    if index == -1:
+        return html_content + script
+    return html_content[:index] + script + html_content[index:]
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+
+import msgspec
+
+from base import GenerateRequest
+from common.metrics import RENDER_JOB_WAIT, RENDER_JOBS_PENDING
+
+logger = logging.getLogger(__name__)
+
+# Рендер идёт в потоках: event loop остаётся свободным для приёма запросов и опроса заданий
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Больше заданий в очереди не принимаем - клиент получит 429
+RENDER_QUEUE_LIMIT = int(os.getenv("RENDER_QUEUE_LIMIT", "64"))
+# Сколько завершённых заданий помним для GET /jobs/{job_id}
+RENDER_JOBS_KEEP = int(os.getenv("RENDER_JOBS_KEEP", "1000"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class RenderJob(msgspec.Struct):
+    id: str
+    org_id: str
+    status: str
+    created: str
+    url: Optional[str] = None
+    report: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    finished: Optional[str] = None
+
+
+class QueueFull(Exception):
+    """Too many render jobs are waiting"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class RenderJobs:
+    """Background page renders with pollable status.
+
+    Renders of one organization run one at a time, since they write the same
+    files: a job is handed to the pool only when the previous job of its
+    organization is done, so waiting jobs never hold a worker thread and
+    different organizations render in parallel on RENDER_WORKERS threads.
+    """
+
+    def __init__(self, render: Callable[[GenerateRequest], Tuple[str, Optional[Dict]]],
+                 workers: int = RENDER_WORKERS, queue_limit: int = RENDER_QUEUE_LIMIT, keep: int = RENDER_JOBS_KEEP):
+        self._render = render
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="render")
+        self.queue_limit = queue_limit
+        self.keep = keep
+        self._jobs: "OrderedDict[str, RenderJob]" = OrderedDict()
+        # Последнее задание каждой организации; следующее стартует по его завершении
+        self._org_tails: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, request: GenerateRequest) -> Tuple[RenderJob, Future]:
+        """Queue a render; the future resolves to (url, report) once it is written"""
+        result: Future = Future()
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                raise QueueFull(f"{self._pending} render jobs are already queued")
+            self._pending += 1
+            job = RenderJob(id=uuid.uuid4().hex, org_id=request.org_id, status=QUEUED, created=_now())
+            self._jobs[job.id] = job
+            previous = self._org_tails.get(request.org_id)
+            self._org_tails[request.org_id] = result
+            self._trim()
+        RENDER_JOBS_PENDING.inc()
+        # Контекст (текущий span) переносится в поток рендера
+        context = contextvars.copy_context()
+        queued = time.perf_counter()
+
+        def start(_=None) -> None:
+            self._executor.submit(context.run, self._run, job, request, result, queued)
+
+        if previous is None:
+            start()
+        else:
+            previous.add_done_callback(start)
+        return job, result
+
+    def get(self, job_id: str) -> Optional[RenderJob]:
+        return self._jobs.get(job_id)
+
+    def _trim(self) -> None:
+        # Вытесняем самые старые завершённые задания
+        excess = len(self._jobs) - self.keep
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.status in (DONE, FAILED)][:max(0, excess)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: RenderJob, request: GenerateRequest, result: Future, queued: float) -> None:
+        RENDER_JOB_WAIT.observe(time.perf_counter() - queued)
+        job.status = RUNNING
+        error = None
+        try:
+            url, report = self._render(request)
+            job.url, job.report, job.status = url, report, DONE
+        except Exception as e:
+            logger.error(f"Render job {job.id} for org {job.org_id} failed: {str(e)}")
+            job.error, job.status = str(e), FAILED
+            error = e
+        job.finished = _now()
+        with self._lock:
+            self._pending -= 1
+            # Очередь организации опустела - запись больше не нужна
+            if self._org_tails.get(job.org_id) is result:
+                del self._org_tails[job.org_id]
+        RENDER_JOBS_PENDING.dec()
+        # Колбэк завершения запускает следующее задание организации
+        if error is None:
+            result.set_result((url, report))
+        else:
+            result.set_exception(error)
@@ -0,0 +1,67 @@
+from typing import Dict, List
+import hashlib
+import json
+import os
+import re
+
+from base import GenerateRequest
+from page_data import DATA_FILE
+
+# sw.js лежит рядом со страницей (index.html или shell.html): его scope - страница организации
+SW_FILE = "sw.js"
+SW_TEMPLATE_FILE = os.path.join(os.path.dirname(__file__), "sw_template.js")
+
+with open(SW_TEMPLATE_FILE, encoding="utf-8") as f:
+    SW_TEMPLATE = f.read()
+
+REGISTRATION_SCRIPT = (
+    "<script>if('serviceWorker' in navigator){addEventListener('load',function(){"
+    f"navigator.serviceWorker.register('{SW_FILE}').catch(function(){{}})}})}}</script>"
+)
+
+_STYLE_LINK = re.compile(r"<link\b[^>]*\b(?:rel=[\"']?stylesheet|as=[\"']?style)[^>]*>", re.IGNORECASE)
+_HREF = re.compile(r"\bhref=[\"']([^\"']+)[\"']", re.IGNORECASE)
+
+
+def inject_registration(html_content: str) -> str:
+    index = html_content.lower().rfind("</body>")
+    if index == -1:
+        return html_content + REGISTRATION_SCRIPT
+    return html_content[:index] + REGISTRATION_SCRIPT + html_content[index:]
+
+
+def precache_urls(html_content: str, request: GenerateRequest) -> List[str]:
+    """Page, theme CSS, backgrounds and item images, in that order, without duplicates"""
+    urls = ["./"]
+    if request.output == "data":
+        urls.append(DATA_FILE)
+    for link in _STYLE_LINK.findall(html_content):
+        href = _HREF.search(link)
+        if href:
+            urls.append(href.group(1))
+    urls.extend(
+        url for url in (request.page_background, request.header_background, request.footer_background) if url
+    )
+    for items in request.content.values():
+        urls.extend(item.get_image_url() for item in items if item.image_url)
+    return list(dict.fromkeys(urls))
+
+
+def write_service_worker(orgpath: str, org_id: str, urls: List[str], page_content: str) -> str:
+    """Write sw.js with a precache manifest; the version changes with the page or the manifest"""
+    digest = hashlib.sha256()
+    digest.update(page_content.encode("utf-8"))
+    digest.update(json.dumps(urls).encode("utf-8"))
+    version = digest.hexdigest()[:12]
+    script = (
+        SW_TEMPLATE
+        .replace("__VERSION__", json.dumps(version))
+        .replace("__CACHE_PREFIX__", json.dumps(f"menu-{org_id}-"))
+        .replace("__PRECACHE__", json.dumps(urls, ensure_ascii=False))
+    )
+    path = os.path.join(orgpath, SW_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(script)
+    os.replace(tmp_path, path)
+    return version
@@ -0,0 +1,87 @@
+// Service worker страницы меню: генерируется вместе со страницей, версия меняется при каждой перегенерации
+const VERSION = __VERSION__;
+const CACHE_PREFIX = __CACHE_PREFIX__;
+const CACHE_NAME = CACHE_PREFIX + VERSION;
+const PRECACHE = __PRECACHE__;
+const PAGE_URL = new URL("./", self.location).href;
+const PRECACHE_URLS = new Set(PRECACHE.map((url) => new URL(url, self.location).href));
+// Данные меню меняются чаще страницы: сначала сеть, кэш - только без связи
+const NETWORK_FIRST = [new URL("menu.json", self.location).href];
+// Сверх манифеста кэшируем только картинки своего домена, не больше стольких штук
+const MAX_RUNTIME_ENTRIES = 100;
+
+function cacheable(request, url) {
+  return PRECACHE_URLS.has(url) || request.mode === "navigate" ||
+    (request.destination === "image" && new URL(url).origin === self.location.origin);
+}
+
+// Вытесняем самые старые записи вне манифеста: keys() отдаёт их в порядке добавления
+function trimCache(cache) {
+  return cache.keys().then((keys) => {
+    const runtime = keys.filter((key) => !PRECACHE_URLS.has(key.url.split("?")[0]) && key.url !== PAGE_URL);
+    return Promise.all(runtime.slice(0, Math.max(0, runtime.length - MAX_RUNTIME_ENTRIES)).map((key) => cache.delete(key)));
+  });
+}
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(CACHE_NAME).then((cache) =>
+      // Отсутствующая картинка не должна ломать установку остального
+      Promise.all(PRECACHE.map((url) =>
+        cache.add(new Request(url, { cache: "reload" })).catch(() => null)
+      ))
+    ).then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys().then((keys) => Promise.all(
+      keys.filter((key) => key.startsWith(CACHE_PREFIX) && key !== CACHE_NAME).map((key) => caches.delete(key))
+    )).then(() => self.clients.claim())
+  );
+});
+
+// Из кэша сразу, в фоне обновляем копию; без сети - последняя сохранённая
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  if (request.method !== "GET" || !request.url.startsWith("http")) {
+    return;
+  }
+  const url = request.url.split("?")[0];
+  if (NETWORK_FIRST.includes(url)) {
+    event.respondWith(caches.open(CACHE_NAME).then((cache) =>
+      fetch(request).then((response) => {
+        if (response.ok) {
+          cache.put(request, response.clone());
+        }
+        return response;
+      }).catch(() => cache.match(request, { ignoreSearch: true }).then((cached) => cached || Response.error()))
+    ));
+    return;
+  }
+  // Чужие ресурсы и прочее вне манифеста браузер загружает сам
+  if (!cacheable(request, url)) {
+    return;
+  }
+  event.respondWith(caches.open(CACHE_NAME).then((cache) =>
+    cache.match(request, { ignoreSearch: true }).then((cached) => {
+      const network = fetch(request).then((response) => {
+        if (response.ok) {
+          const stored = cache.put(request, response.clone());
+          if (!PRECACHE_URLS.has(url)) {
+            event.waitUntil(stored.then(() => trimCache(cache)).catch(() => null));
+          }
+        }
+        return response;
+      });
+      if (cached) {
+        event.waitUntil(network.catch(() => null));
+        return cached;
+      }
+      return network.catch(() =>
+        request.mode === "navigate" ? cache.match(PAGE_URL) : Response.error()
+      );
+    })
+  ));
+});
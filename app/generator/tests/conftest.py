@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули генератора импортируются без пакета (from base import ...), как в контейнере
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,41 @@
+from optimize import minify_css, minify_html
+
+
+def test_minify_css_strips_whitespace_and_comments():
+    css = "/* тема */\n.menu-item  {\n  color : red ;\n  margin: 0 auto;\n}\n"
+    assert minify_css(css) == ".menu-item{color:red;margin:0 auto}"
+
+
+def test_minify_css_keeps_descendant_pseudo_class():
+    assert minify_css(".menu :hover { color: red }") == ".menu :hover{color:red}"
+    assert minify_css(".menu a:hover , .x > .y { color: red }") == ".menu a:hover,.x>.y{color:red}"
+
+
+def test_minify_css_keeps_string_literals():
+    assert minify_css('.a::before { content: " ; " }') == '.a::before{content:" ; "}'
+    assert minify_css("body { font-family: \"A , B\", 'C  >  D' }") == "body{font-family:\"A , B\",'C  >  D'}"
+    assert minify_css('.a { content: "/* not a comment */" }') == '.a{content:"/* not a comment */"}'
+
+
+def test_minify_css_keeps_url():
+    css = ".a { background: url( /img/a;b.png ) no-repeat , url(\"x y.png\") }"
+    assert minify_css(css) == ".a{background:url( /img/a;b.png ) no-repeat,url(\"x y.png\")}"
+
+
+def test_minify_css_media_query():
+    assert minify_css("@media (min-width: 600px) { a { x : 1 } }") == "@media (min-width:600px){a{x:1}}"
+
+
+def test_minify_html_keeps_space_between_inline_elements():
+    html = "<p>\n  <a>x</a>\n  <b>y</b>\n</p>"
+    assert minify_html(html) == "<p> <a>x</a> <b>y</b> </p>"
+
+
+def test_minify_html_strips_comments_outside_raw_blocks():
+    html = "<div><!-- drop --></div><!--[if IE]>keep<![endif]-->"
+    assert minify_html(html) == "<div></div><!--[if IE]>keep<![endif]-->"
+
+
+def test_minify_html_keeps_raw_blocks():
+    html = "<script>// <!-- keep -->\nvar a  =  1;</script>\n<pre> <!-- k -->\n  x</pre>"
+    assert minify_html(html) == "<script>// <!-- keep -->\nvar a  =  1;</script> <pre> <!-- k -->\n  x</pre>"
@@ -0,0 +1,53 @@
+"""Diff two benchmark reports produced by run.py.
+
+    python benchmarks/compare.py old.json new.json [--threshold 10]
+
+Exits with status 1 when any endpoint's p95 regressed by more than the
+threshold (percent), so it can gate a release.
+"""
+import argparse
+import json
+import sys
+
+
+def change(old: float, new: float) -> float:
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed p95 regression, percent")
+    args = parser.parse_args()
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)["endpoints"]
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)["endpoints"]
+
+    regressions = []
+    print(f"{'endpoint':45s} {'p50':>18s} {'p95':>18s} {'p99':>18s} {'rps':>16s}")
+    for label in sorted(set(old) | set(new)):
+        if label not in old or label not in new:
+            print(f"{label:45s} {'only in ' + ('new' if label in new else 'old'):>18s}")
+            continue
+        a, b = old[label], new[label]
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            cells.append(f"{b[key]:8.1f} ({change(a[key], b[key]):+6.1f}%)")
+        cells.append(f"{b['throughput_rps']:7.1f} ({change(a['throughput_rps'], b['throughput_rps']):+5.1f}%)")
+        print(f"{label:45s} " + " ".join(f"{c:>18s}" for c in cells))
+        if change(a["p95_ms"], b["p95_ms"]) > args.threshold:
+            regressions.append(label)
+
+    if regressions:
+        print(f"\np95 regressed more than {args.threshold}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Local stand-ins for OpenAI and the Telegram Bot API used by the benchmarks"""
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+FAKE_CSS = """```css
+:root { --primary-color: #3b2416; --accent-color: #39ff14; }
+body { color: #f5e6d3; background-color: #1b120c; }
+.header h1 { color: var(--accent-color); text-shadow: 0 0 8px #39ff14; }
+.menu-item { background-color: rgba(59, 36, 22, 0.85); border-radius: 8px; }
+.menu-item .price { color: var(--accent-color); }
+```"""
+
+
+def make_openai_app(latency: float = 0.5, chunk_delay: float = 0.02) -> web.Application:
+    """Fake /v1/chat/completions (plain and SSE) and /v1/models"""
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        if payload.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            await asyncio.sleep(latency / 5)
+            for i in range(0, len(FAKE_CSS), 24):
+                chunk = {"choices": [{"delta": {"content": FAKE_CSS[i:i + 24]}}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                await asyncio.sleep(chunk_delay)
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            return response
+        await asyncio.sleep(latency)
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": FAKE_CSS}}]})
+
+    async def models(request: web.Request) -> web.Response:
+        return web.json_response({"data": [{"id": "gpt-4"}]})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    app.router.add_get("/v1/models", models)
+    return app
+
+
+class FakeTelegram:
+    """Minimal Bot API: queued getUpdates and recorded outgoing calls.
+
+    ``inject`` queues an update for the bot; ``wait_for_reply`` resolves when
+    the bot sends or edits a message in that chat, which gives the
+    update-to-reply latency the bot benchmark reports.
+    """
+
+    def __init__(self):
+        self._updates: asyncio.Queue = asyncio.Queue()
+        self._update_id = 0
+        self._message_id = 0
+        self._waiters: Dict[int, List[asyncio.Future]] = {}
+        self.calls: List[dict] = []
+
+    def inject_message(self, user_id: int, text: str) -> int:
+        self._update_id += 1
+        self._message_id += 1
+        user = {"id": user_id, "is_bot": False, "first_name": f"bench{user_id}"}
+        self._updates.put_nowait({
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": user,
+                "text": text,
+                "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else [],
+            },
+        })
+        return self._update_id
+
+    def wait_for_reply(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append(future)
+        return future
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if method == "getUpdates":
+            timeout = float(params.get("timeout") or 0)
+            updates = []
+            try:
+                updates.append(await asyncio.wait_for(self._updates.get(), timeout=max(timeout, 0.1)))
+            except asyncio.TimeoutError:
+                pass
+            while not self._updates.empty():
+                updates.append(self._updates.get_nowait())
+            return web.json_response({"ok": True, "result": updates})
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}})
+        if method in ("deleteWebhook", "answerCallbackQuery"):
+            return web.json_response({"ok": True, "result": True})
+
+        self.calls.append({"method": method, "at": time.perf_counter()})
+        chat_id = self._chat_id(params)
+        self._message_id += 1
+        for future in self._waiters.pop(chat_id, []) if chat_id is not None else []:
+            if not future.done():
+                future.set_result(time.perf_counter())
+        return web.json_response({"ok": True, "result": {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id or 0, "type": "private"},
+            "text": params.get("text", ""),
+        }})
+
+    @staticmethod
+    def _chat_id(params: dict) -> Optional[int]:
+        try:
+            return int(params.get("chat_id"))
+        except (TypeError, ValueError):
+            return None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        app.router.add_get("/bot{token}/{method}", self._handle)
+        return app
+
+
+async def start_app(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
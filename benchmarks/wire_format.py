@@ -0,0 +1,183 @@
+"""Micro-benchmark of the internal wire formats for a large menu.
+
+Compares the previous JSON path (json encoding, pydantic validation of the
+generate request) with the msgspec schemas decoding JSON and MessagePack,
+with and without zstd, for the generator's /generate body and the API's
+menu read.
+
+    python benchmarks/wire_format.py --items 2000 --output wire_report.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Callable, Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.join(ROOT, "app", "generator"))
+
+import msgspec  # noqa: E402
+import zstandard  # noqa: E402
+
+from pydantic import BaseModel  # noqa: E402
+from typing import List, Optional  # noqa: E402
+
+from base import GenerateRequest  # noqa: E402
+
+
+# Прежние pydantic-модели генератора: точка отсчёта для сравнения
+class PydanticMenuItem(BaseModel):
+    name: str
+    price: float
+    description: Optional[str] = None
+    subcategory: Optional[str] = None
+    image_url: Optional[str] = None
+
+
+class PydanticOrganization(BaseModel):
+    title: str
+    description: Optional[str] = None
+    footer_text: Optional[str] = None
+
+
+class PydanticGenerateRequest(BaseModel):
+    org_id: str
+    page_name: str
+    title: str
+    description: Optional[str] = None
+    theme: str
+    content: Dict[str, List[PydanticMenuItem]]
+    page_background: Optional[str] = None
+    header_background: Optional[str] = None
+    footer_background: Optional[str] = None
+    organization: PydanticOrganization
+
+CATEGORIES = ["Коктейли", "Пиво", "Закуски", "Горячее", "Десерты", "Кофе", "Вино", "Безалкогольное"]
+
+
+def make_menu(items: int) -> list:
+    """Rows as GET /organizations/{id}/menu returns them"""
+    rng = random.Random(42)
+    return [{
+        "id": i + 1,
+        "name": f"Позиция {i} {rng.choice(['классика', 'фирменный', 'сезонный'])}",
+        "description": "Описание блюда, состав и граммовка " * rng.randint(1, 3),
+        "price": round(rng.uniform(100, 2000), 2),
+        "category": rng.choice(CATEGORIES),
+        "subcategory": rng.choice([None, "Авторские", "Классические"]),
+        "is_available": rng.random() > 0.1,
+        "image_name": f"item_{i}",
+        "created": "2026-01-01T12:00:00",
+        "updated": "2026-01-02T12:00:00",
+    } for i in range(items)]
+
+
+def make_generate_request(menu: list) -> dict:
+    content: Dict[str, list] = {}
+    for item in menu:
+        content.setdefault(item["category"], []).append({
+            "name": item["name"],
+            "price": item["price"],
+            "description": item["description"],
+            "subcategory": item["subcategory"],
+            "image_url": f"1/{item['image_name']}.jpg",
+        })
+    return {
+        "org_id": "1",
+        "page_name": "menu_bench",
+        "title": "Bench bar",
+        "description": "Benchmark",
+        "theme": "classic",
+        "content": content,
+        "organization": {"title": "Bench bar", "description": "Benchmark", "footer_text": "footer"},
+    }
+
+
+def timeit(fn: Callable[[], object], repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {"median_ms": round(statistics.median(samples) * 1000, 3), "min_ms": round(samples[0] * 1000, 3)}
+
+
+def run(items: int, repeat: int) -> dict:
+    menu = make_menu(items)
+    request = make_generate_request(menu)
+    compressor = zstandard.ZstdCompressor(level=3)
+    decompressor = zstandard.ZstdDecompressor()
+
+    json_body = json.dumps(request).encode()
+    msgpack_body = msgspec.msgpack.encode(request)
+    zstd_body = compressor.compress(msgpack_body)
+    generate = {
+        "json+pydantic": {
+            "bytes": len(json_body),
+            "decode": timeit(lambda: PydanticGenerateRequest.model_validate_json(json_body), repeat),
+        },
+        "json+msgspec": {
+            "bytes": len(json_body),
+            "decode": timeit(lambda: msgspec.json.decode(json_body, type=GenerateRequest), repeat),
+        },
+        "msgpack+msgspec": {
+            "bytes": len(msgpack_body),
+            "decode": timeit(lambda: msgspec.msgpack.decode(msgpack_body, type=GenerateRequest), repeat),
+        },
+        "zstd+msgpack+msgspec": {
+            "bytes": len(zstd_body),
+            "decode": timeit(
+                lambda: msgspec.msgpack.decode(decompressor.decompress(zstd_body), type=GenerateRequest),
+                repeat,
+            ),
+        },
+    }
+
+    menu_json = json.dumps(menu).encode()
+    menu_msgpack = msgspec.msgpack.encode(menu)
+    menu_zstd = compressor.compress(menu_msgpack)
+    menu_read = {
+        "json": {
+            "bytes": len(menu_json),
+            "encode": timeit(lambda: json.dumps(menu).encode(), repeat),
+            "decode": timeit(lambda: json.loads(menu_json), repeat),
+        },
+        "msgpack": {
+            "bytes": len(menu_msgpack),
+            "encode": timeit(lambda: msgspec.msgpack.encode(menu), repeat),
+            "decode": timeit(lambda: msgspec.msgpack.decode(menu_msgpack), repeat),
+        },
+        "zstd+msgpack": {
+            "bytes": len(menu_zstd),
+            "encode": timeit(lambda: compressor.compress(msgspec.msgpack.encode(menu)), repeat),
+            "decode": timeit(lambda: msgspec.msgpack.decode(decompressor.decompress(menu_zstd)), repeat),
+        },
+    }
+    return {"items": items, "repeat": repeat, "generate_request": generate, "menu_read": menu_read}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    report = run(args.items, args.repeat)
+    for section in ("generate_request", "menu_read"):
+        print(section)
+        for name, result in report[section].items():
+            timings = "  ".join(f"{key} {value['median_ms']:8.2f} ms" for key, value in result.items() if key != "bytes")
+            print(f"  {name:24s} {result['bytes']:>9d} B  {timings}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()